@@ -6,6 +6,7 @@ including the knowledge base API.
 """
 
 import os
+import threading
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,11 +18,13 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import the knowledge base API
-from knowledge_base import kb_app
+from knowledge_base import kb_app, warm_up
+from common.executor import shutdown_executor
 
 # Load environment variables
 load_dotenv()
 PORT = int(os.getenv("PORT", "8000"))
+WARM_UP = os.getenv("WARM_UP", "true").lower() == "true"
 
 # Create main FastAPI app
 app = FastAPI(
@@ -42,6 +45,17 @@ app.add_middleware(
 # Mount the knowledge base API
 app.mount("/kb", kb_app)
 
+# Preload the tokenizer and precomputed answers in the background
+@app.on_event("startup")
+async def start_warm_up():
+    if WARM_UP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Let in-flight blocking calls finish
+@app.on_event("shutdown")
+async def stop_executor():
+    shutdown_executor()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,112 @@
+"""
+Conversation Simulator Benchmark
+
+Runs simulated conversations concurrently through the local conversation
+flow (transitions, template rendering and knowledge base lookups against the
+KB app in this process) and reports the latency percentiles of each stage,
+throughput, where conversations ended, memory per session and the prompt
+tokens of each state. Use it as a regression benchmark: with --json the
+results are printed as one JSON object to compare between runs.
+
+Conversations are generated at random, or read from a JSON script: a list
+of conversations, each a list of {"text": ..., "slots": {...}} turns.
+With --go-url the Go chatbot's state flow endpoint is driven instead.
+
+Usage: python benchmarks/bench_conversation_simulator.py [--conversations 2000] [--concurrency 200] [--go-url http://localhost:8080/chatbot/state-flow]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Keep sampled request logs out of the results
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+from knowledge_base import kb_app, warm_up
+from conversation_flow.simulator import ConversationSimulator, Session, SimulationReport, UserTurn, random_user, scripted_user
+
+def make_users(args):
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+        return [scripted_user([UserTurn(turn["text"], turn.get("slots", {})) for turn in conversation])
+                for conversation in script]
+    rng = random.Random(args.seed)
+    return [random_user(random.Random(rng.random()), args.confusion) for _ in range(args.conversations)]
+
+def client_for(args):
+    if args.go_url:
+        return httpx.AsyncClient(timeout=30)
+    # The KB app in this process, with nothing between it and the client
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=kb_app), base_url="http://kb", timeout=30)
+
+async def simulate(args):
+    async with client_for(args) as client:
+        simulator = ConversationSimulator(client, kb_path="", go_url=args.go_url, max_turns=args.max_turns)
+        # Untimed, so first-use costs like compiling the transitions don't count
+        await simulator.run(make_users(args)[:10], args.concurrency)
+        gc.collect()
+        return await simulator.run(make_users(args), args.concurrency)
+
+async def session_memory(args):
+    """Bytes held per session in the middle of a conversation, from tracemalloc."""
+    sessions = []
+    async with client_for(args) as client:
+        simulator = ConversationSimulator(client, kb_path="", go_url=args.go_url, max_turns=3)
+        users = make_users(args)[:args.memory_sessions]
+        tracemalloc.start()
+        for user in users:
+            sessions.append(await simulator.run_conversation(user, SimulationReport(), Session()))
+        count = len(sessions)
+        gc.collect()
+        with_sessions = tracemalloc.get_traced_memory()[0]
+        # Only count what the sessions hold, not caches filled along the way
+        del sessions
+        gc.collect()
+        held = with_sessions - tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return held / count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="conversations in flight at once")
+    parser.add_argument("--max-turns", type=int, default=30)
+    parser.add_argument("--confusion", type=float, default=0.1, help="chance of an unhelpful user turn")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--script", help="JSON file of scripted conversations")
+    parser.add_argument("--go-url", help="Go chatbot /chatbot/state-flow URL to drive instead of the local flow")
+    parser.add_argument("--memory-sessions", type=int, default=500, help="sessions measured with tracemalloc")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if not args.go_url:
+        warm_up()
+    report = asyncio.run(simulate(args))
+    results = report.summary()
+    results["bytes_per_session"] = asyncio.run(session_memory(args))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{results['conversations']} conversations, {results['turns']} turns in {results['elapsed']:.2f}s "
+          f"({results['turns_per_second']:,.0f} turns/s), {results['bytes_per_session']:,.0f} bytes per session")
+    print(f"{'stage':<11} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<11} {stats['count']:>8} {stats['p50']:>8.3f} {stats['p95']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}")
+    if results["prompt_tokens"]:
+        print(f"{'state':<26} {'renders':>8} {'mean tokens':>12} {'max tokens':>11}")
+        for state, stats in results["prompt_tokens"].items():
+            print(f"{state:<26} {stats['renders']:>8} {stats['mean']:>12.1f} {stats['max']:>11}")
+    print("ended in: " + ", ".join(f"{state} {count}" for state, count in results["final_states"].items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Conversation Flow Engine Benchmark
+
+Measures get_next_state steps per second over simulated conversations. The
+compiled state machine is compared with evaluating each condition string
+with eval() on every step, which it must agree with on every step, and with
+the substring matching get_next_state used before, whose wrong answers are
+counted. The Retell flow's edges, compiled from their JavaScript-like
+conditions, are timed over the same steps.
+
+Usage: python benchmarks/bench_flow_engine.py [--conversations 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from conversation_flow.transitions import transitions, get_transitions_from_state, get_state_machine
+from conversation_flow.retell_integration import get_retell_state_machine
+
+INTENTS = ["inquiry", "new_reservation", "modify_reservation", "cancel_reservation"]
+
+# What a turn might add to the context, with how likely it is
+UPDATES = [
+    (0.3, lambda rng: {"city": rng.choice(["delhi", "bangalore"])}),
+    (0.3, lambda rng: {"outlet": rng.choice(["indiranagar", "jp_nagar", "connaught_place"])}),
+    (0.3, lambda rng: {"intent": rng.choice(INTENTS)}),
+    (0.3, lambda rng: {rng.choice(["date", "time", "party_size", "customer_name", "phone_number"]): "x"}),
+    (0.1, lambda rng: {rng.choice(["inquiry_complete", "reservation_confirmed", "modification_complete",
+                                   "cancellation_complete", "change_intent", "restart", "end_conversation"]): True}),
+]
+
+def reference_next_state(current_state, context, attempt_count, user_response):
+    """Evaluate every condition string as Python, the behaviour the engine must match."""
+    for transition in get_transitions_from_state(current_state):
+        variables = {"context": context, "attempt_count": attempt_count, "user_response": user_response}
+        if eval(transition["condition"], {"__builtins__": {}}, variables):
+            return transition["destination"]
+    return current_state
+
+def legacy_next_state(current_state, context, attempt_count, user_response):
+    """The substring matching get_next_state did before the engine."""
+    for transition in get_transitions_from_state(current_state):
+        condition = transition["condition"]
+        condition_met = False
+        if "context.get('city')" in condition and context.get('city'):
+            condition_met = True
+        elif "context.get('outlet')" in condition and context.get('outlet'):
+            condition_met = True
+        elif "context.get('intent')" in condition and context.get('intent'):
+            condition_met = True
+        if "attempt_count >" in condition:
+            threshold = int(condition.split("attempt_count >")[1].split(" and")[0].strip())
+            if attempt_count > threshold:
+                condition_met = True
+        if condition_met:
+            return transition["destination"]
+    return current_state
+
+def simulate(rng, conversations, max_turns=30):
+    """Run conversations with the reference and return the (state, context, attempts, response) of every step."""
+    steps = []
+    for _ in range(conversations):
+        state, context, attempts = "greeting", {}, 0
+        for _ in range(max_turns):
+            for probability, update in UPDATES:
+                if rng.random() < probability:
+                    context.update(update(rng))
+            response = rng.choice(["", "hello", "yes please", "I'd like to book"])
+            steps.append((state, dict(context), attempts, response))
+            next_state = reference_next_state(state, context, attempts, response)
+            attempts = attempts + 1 if next_state == state else 0
+            state = next_state
+            if state == "farewell":
+                break
+    return steps
+
+def steps_per_second(next_state, steps, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for state, context, attempts, response in steps:
+            next_state(state, context, attempts, response)
+    return len(steps) * repeat / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    steps = simulate(random.Random(args.seed), args.conversations)
+    machine = get_state_machine()
+    expected = [reference_next_state(*step) for step in steps]
+    assert [machine.next_state(*step) for step in steps] == expected
+    wrong = sum(legacy_next_state(*step) != state for step, state in zip(steps, expected))
+
+    print(f"{len(steps)} steps in {args.conversations} conversations, {len(transitions)} transitions")
+    print(f"{'engine':<10} {'steps/s':>12} {'wrong':>8}")
+    for name, next_state, mistakes in (
+        ("eval", reference_next_state, 0),
+        ("legacy", legacy_next_state, wrong),
+        ("compiled", machine.next_state, 0),
+        ("retell", get_retell_state_machine().next_state, None),
+    ):
+        mistakes = "-" if mistakes is None else mistakes
+        print(f"{name:<10} {steps_per_second(next_state, steps, args.repeat):>12,.0f} {mistakes:>8}")
+
+if __name__ == "__main__":
+    main()
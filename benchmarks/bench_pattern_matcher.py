@@ -0,0 +1,94 @@
+"""
+Pattern Matcher Benchmark
+
+Compares the keyword-prefiltered PatternMatcher against a plain loop of
+re.search calls as the number of predefined patterns grows.
+
+Usage: python benchmarks/bench_pattern_matcher.py [--messages 2000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from knowledge_base.api import HARDCODED_RESPONSES
+from knowledge_base.matcher import PatternMatcher
+
+VOCABULARY = [
+    "paneer", "tikka", "kebab", "biryani", "kulfi", "mocktail", "parking", "valet",
+    "buffet", "lunch", "dinner", "weekend", "birthday", "anniversary", "corporate",
+    "dessert", "brownie", "prawns", "mutton", "chicken", "jain", "vegan", "outdoor",
+    "rooftop", "wheelchair", "lift", "bar", "koramangala", "indiranagar", "saket",
+]
+
+def synthetic_patterns(count, rng):
+    """Generate patterns shaped like the real HARDCODED_RESPONSES keys."""
+    patterns = list(HARDCODED_RESPONSES)
+    while len(patterns) < count:
+        first, second = rng.sample(VOCABULARY, 2)
+        patterns.append(rf"(?:what|tell me) about (?:the )?{first} {second}{len(patterns)} options")
+    return patterns[:count]
+
+def synthetic_messages(patterns, count, rng):
+    """Mix messages that hit a pattern with messages that hit none."""
+    messages = []
+    for i in range(count):
+        if i % 2:
+            words = rng.sample(VOCABULARY, 6)
+            messages.append("hi, i wanted to ask " + " ".join(words) + " please")
+        else:
+            pattern = rng.choice(patterns)
+            match = re.search(r"(\w+) (\w+\d+) options", pattern)
+            if match:
+                messages.append(f"can you tell me about the {match.group(1)} {match.group(2)} options")
+            else:
+                messages.append("what are the veg starters")
+    return messages
+
+def naive_search(compiled, text):
+    for regex in compiled:
+        if regex.search(text):
+            return regex.pattern
+    return None
+
+def run(pattern_count, message_count, rng):
+    patterns = synthetic_patterns(pattern_count, rng)
+    messages = synthetic_messages(patterns, message_count, rng)
+
+    start = time.perf_counter()
+    matcher = PatternMatcher(patterns)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # Precompile for the loop too (re's own cache only holds 512 patterns),
+    # so the comparison measures scanning rather than compilation
+    compiled = [re.compile(pattern) for pattern in patterns]
+
+    start = time.perf_counter()
+    expected = [naive_search(compiled, message) for message in messages]
+    naive_us = (time.perf_counter() - start) * 1e6 / message_count
+
+    start = time.perf_counter()
+    actual = [matcher.search(message) for message in messages]
+    matcher_us = (time.perf_counter() - start) * 1e6 / message_count
+
+    assert actual == expected, "PatternMatcher disagrees with the re.search loop"
+    print(f"{pattern_count:>7} {build_ms:>10.1f} {naive_us:>12.1f} {matcher_us:>12.1f} {naive_us / matcher_us:>8.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'patterns':>7} {'build ms':>10} {'loop us/msg':>12} {'index us/msg':>12} {'speedup':>9}")
+    for pattern_count in (len(HARDCODED_RESPONSES), 100, 1000, 5000):
+        run(pattern_count, args.messages, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Retrieval Benchmark
+
+Measures FactRetriever query latency (p50/p99) as the knowledge base grows.
+Larger knowledge bases are synthesized by cloning the real outlets under new
+names, so passage length and vocabulary stay realistic.
+
+Usage: python benchmarks/bench_retrieval.py [--queries 500]
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from knowledge_base.data import knowledge_base
+from knowledge_base.retrieval import FactRetriever, build_fact_passages
+
+QUERIES = [
+    "is there valet parking at koramangala",
+    "which outlets have wheelchair access",
+    "paneer dishes",
+    "do you have hot chocolate",
+    "birthday cake offer",
+    "lunch timings on weekends",
+    "jain food options",
+    "address of the saket outlet",
+    "mocktails and fresh juices",
+    "outdoor seating in bangalore",
+]
+
+def scaled_knowledge_base(factor):
+    """Return a knowledge base with roughly ``factor`` times as many outlets."""
+    scaled = {"menu": knowledge_base["menu"]}
+    for copy_index in range(factor):
+        for city, outlets in knowledge_base.items():
+            if city == "menu":
+                continue
+            city_key = city if copy_index == 0 else f"{city}{copy_index}"
+            scaled[city_key] = copy.deepcopy(outlets)
+    return scaled
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(factor, query_count, rng):
+    passages = build_fact_passages(scaled_knowledge_base(factor))
+
+    start = time.perf_counter()
+    retriever = FactRetriever(passages)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    queries = [rng.choice(QUERIES) for _ in range(query_count)]
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    retriever.search_many(queries)
+    batch_ms = (time.perf_counter() - start) * 1000 / query_count
+
+    print(f"{len(passages):>9} {build_ms:>10.1f} {percentile(latencies, 0.5):>8.3f} "
+          f"{percentile(latencies, 0.99):>8.3f} {batch_ms:>14.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'passages':>9} {'build ms':>10} {'p50 ms':>8} {'p99 ms':>8} {'batched ms/q':>14}")
+    for factor in (1, 10, 100, 1000):
+        run(factor, args.queries, rng)
+
+if __name__ == "__main__":
+    main()
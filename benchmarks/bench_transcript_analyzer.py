@@ -0,0 +1,121 @@
+"""
+Transcript Analyzer Benchmark
+
+Compares analyze_transcript with the per-field extraction functions in
+webhook/google_sheets.py on synthetic call transcripts, from a short call up
+to a 30-minute one (about 4,500 words), and checks that both produce the
+same fields for every transcript.
+
+Usage: python benchmarks/bench_transcript_analyzer.py [--calls 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from webhook.google_sheets import (
+    get_call_outcome,
+    extract_booking_date,
+    extract_booking_time,
+    extract_party_size,
+    extract_customer_name,
+    generate_call_summary
+)
+from webhook.transcript_analyzer import analyze_transcript
+
+# Spoken at roughly 150 words per minute
+WORDS_PER_MINUTE = 150
+
+FILLER = [
+    "Thank you for calling Barbeque Nation, how can I help you today?",
+    "Sure, let me check that for you.",
+    "Could you please hold for a moment?",
+    "We serve unlimited grills at the table along with starters and desserts.",
+    "Is there anything else I can help you with?",
+    "The weather has been lovely this week.",
+    "Our staff will be happy to assist you when you arrive.",
+    "Yes, we have both vegetarian and non vegetarian options.",
+    "Okay, I understand.",
+    "Let me note that down.",
+]
+
+def details(rng):
+    """Return one sentence carrying a field the extractors look for."""
+    number = rng.randint(1, 20)
+    hour = rng.randint(1, 12)
+    options = [
+        f"I would like to book a table for {number} people.",
+        f"Can we make it a party of {number}?",
+        f"We will be {number} guests.",
+        f"The booking for {number} is under my name.",
+        f"Please reserve it for {rng.randint(1, 28)}/{rng.randint(1, 12)}/2025.",
+        f"How about 2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}?",
+        f"We will come at {hour}:{rng.choice(['00', '15', '30', '45'])}.",
+        f"Around {hour} {rng.choice(['pm', 'am', 'PM'])} works for us.",
+        f"My name is {rng.choice(['Asha', 'Ravi', 'Meera', 'John'])}.",
+        f"The name's {rng.choice(['Kiran', 'Neha'])}.",
+        "Can I change my existing reservation?",
+        "I need to cancel the booking.",
+        "What time do you open on weekends?",
+        "What is the address of the Indiranagar location?",
+        "Is there parking available?",
+        "Can you tell me about the menu?",
+        "Can we come today?",
+        "Is tomorrow possible?",
+    ]
+    return rng.choice(options)
+
+def transcript(rng, minutes):
+    words = 0
+    sentences = []
+    while words < minutes * WORDS_PER_MINUTE:
+        sentence = details(rng) if rng.random() < 0.15 else rng.choice(FILLER)
+        sentences.append(sentence)
+        words += len(sentence.split())
+    return " ".join(sentences)
+
+def legacy_fields(text):
+    outcome = get_call_outcome(text)
+    date = extract_booking_date(text)
+    booking_time = extract_booking_time(text)
+    party_size = extract_party_size(text)
+    name = extract_customer_name(text)
+    summary = generate_call_summary(text, outcome, date, booking_time, party_size)
+    return (outcome, date, booking_time, party_size, name, summary)
+
+def timed(function, texts):
+    start = time.perf_counter()
+    for text in texts:
+        function(text)
+    return (time.perf_counter() - start) * 1000 / len(texts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'minutes':>7} {'chars':>8} {'legacy ms':>10} {'analyzer ms':>12} {'speedup':>8}")
+    for minutes in (1, 5, 30):
+        texts = [transcript(rng, minutes) for _ in range(args.calls)]
+        for text in texts:
+            # Both read the clock for "today"; only compare when the day is stable
+            day = datetime.now().date()
+            expected = legacy_fields(text)
+            actual = tuple(analyze_transcript(text))
+            if datetime.now().date() == day:
+                assert actual == expected, (text, expected, actual)
+
+        legacy_ms = timed(legacy_fields, texts)
+        analyzer_ms = timed(analyze_transcript, texts)
+        chars = sum(len(text) for text in texts) // len(texts)
+        print(f"{minutes:>7} {chars:>8} {legacy_ms:>10.3f} {analyzer_ms:>12.3f} {legacy_ms / analyzer_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Executor Load Test
+
+Measures knowledge base /query latency on the combined app (the KB and
+webhook APIs mounted as in server.py), first on its own and then while a
+burst of call_ended webhooks for long calls is being stored and flushed to a
+simulated Google Sheet. Requests arrive at fixed rates, and latency counts
+from when each query was due, so time spent waiting for a busy event loop
+shows up. Each run is repeated with blocking work inline on the event loop,
+on the shared thread pool, and on the thread pool with webhook decoding in
+worker processes, each in a fresh interpreter with its own temporary call
+store and Sheets queue.
+
+Usage: python benchmarks/load_test_executor.py [--queries 600] [--rate 200] [--calls 60] [--call-rate 20]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def run_load(args):
+    """Run one load test in this interpreter and print the results as JSON."""
+    sys.path.insert(0, ROOT)
+    import asyncio
+    import gc
+    import random
+    import time
+    import httpx
+    from fastapi import FastAPI
+    from knowledge_base import kb_app, warm_up
+    from common.executor import executor_stats, get_cpu_executor, shutdown_executor
+    from webhook.api import app as webhook_app
+    from webhook import google_sheets
+
+    class SimulatedWorksheet:
+        """Builds the request body like gspread and waits like the network would."""
+        def append_rows(self, rows):
+            json.dumps({"values": rows})
+            time.sleep(args.sheets_latency)
+
+        def stats(self):
+            return {}
+
+    google_sheets.WORKSHEET = SimulatedWorksheet()
+
+    app = FastAPI()
+    app.mount("/kb", kb_app)
+    app.mount("/webhook", webhook_app)
+    warm_up()
+    get_cpu_executor().start("webhook.streaming")
+
+    rng = random.Random(7)
+    words = "table booking parking menu starters desserts indiranagar jp nagar delhi timings valet".split()
+    sentences = [
+        "Sure let me check that for you.",
+        "I would like to book a table for 4 people at indiranagar.",
+        "Could we come tomorrow at 8 pm?",
+        "Is there parking available?",
+    ]
+
+    def call_event(number):
+        turns = [{"transcript": rng.choice(sentences), "words": [{"word": "w", "start": 0.1, "end": 0.2}] * 10}
+                 for _ in range(args.turns)]
+        return {"event_type": "call_ended", "payload": {"call_id": f"call-{number}", "phone_number": "98", "turns": turns}}
+
+    events = [json.dumps(call_event(number)) for number in range(args.calls)]
+
+    async def query(client, number, scheduled, latencies):
+        response = await client.post("/kb/query", json={"query": " ".join(rng.sample(words, 3)) + f" {number}"})
+        # Measured from when the request was due, so time spent waiting for a
+        # blocked event loop counts too
+        latencies.append(time.perf_counter() - scheduled)
+        assert response.status_code == 200, response.text
+
+    async def query_load(client, latencies, queries):
+        # Requests arrive at a fixed rate whether or not earlier ones are done
+        start = time.perf_counter()
+        tasks = []
+        for number in range(queries):
+            scheduled = start + number / args.rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            tasks.append(asyncio.create_task(query(client, number, scheduled, latencies)))
+        await asyncio.gather(*tasks)
+
+    async def call_ended(client, body):
+        response = await client.post("/webhook/webhook", content=body)
+        assert response.status_code == 200, response.text
+
+    async def webhook_load(client):
+        start = time.perf_counter()
+        tasks = []
+        for number, body in enumerate(events):
+            await asyncio.sleep(max(0.0, start + number / args.call_rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(call_ended(client, body)))
+        await asyncio.gather(*tasks)
+
+    async def phase(client, with_webhooks, queries):
+        latencies = []
+        tasks = [query_load(client, latencies, queries)]
+        if with_webhooks:
+            tasks.append(webhook_load(client))
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        pick = lambda fraction: latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+        return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": latencies[-1] * 1000, "elapsed": elapsed}
+
+    async def phases():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Untimed first requests, so start-up costs don't count as latency
+            await phase(client, False, 100)
+            return {"alone": await phase(client, False, args.queries), "webhooks": await phase(client, True, args.queries)}
+
+    # Keep a full collection of the set-up garbage out of the timed phases
+    gc.collect()
+    results = asyncio.run(phases())
+    results["executor"] = executor_stats()
+    results["sheets"] = google_sheets.get_sheets_writer().stats()
+    google_sheets.stop_sheets_writer()
+    shutdown_executor()
+    print(json.dumps(results))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=600, help="KB queries per phase")
+    parser.add_argument("--rate", type=float, default=200, help="KB queries per second")
+    parser.add_argument("--calls", type=int, default=60, help="call_ended webhooks in the burst")
+    parser.add_argument("--call-rate", type=float, default=20, help="call_ended webhooks per second")
+    parser.add_argument("--turns", type=int, default=400, help="turns per call")
+    parser.add_argument("--workers", type=int, default=8, help="executor threads")
+    parser.add_argument("--processes", type=int, default=2, help="executor processes for webhook decoding")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="seconds per simulated Sheets append")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_load(args)
+        return
+
+    print(f"{'mode':<9} {'phase':<9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    modes = (("inline", 0, 0), ("threads", args.workers, 0), ("processes", args.workers, args.processes))
+    for mode, workers, processes in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                EXECUTOR_WORKERS=str(workers),
+                CPU_EXECUTOR_WORKERS=str(processes),
+                CALL_STORE_PATH=os.path.join(directory, "calls.db"),
+                SHEETS_QUEUE_PATH=os.path.join(directory, "queue.db"),
+                SHEETS_BATCH_SIZE="20",
+                SHEETS_FLUSH_INTERVAL="0.1",
+                # Every query misses the cache, so each one does the full work
+                RESPONSE_CACHE_SIZE="0",
+                PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")]))
+            )
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run"] + sys.argv[1:],
+                cwd=directory, env=env, capture_output=True, text=True
+            )
+        if result.returncode:
+            print(result.stderr.strip().splitlines()[-1])
+            continue
+        results = json.loads(result.stdout.strip().splitlines()[-1])
+        for phase in ("alone", "webhooks"):
+            r = results[phase]
+            print(f"{mode:<9} {phase:<9} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['max']:>8.2f}")
+        for name, executor in results["executor"].items():
+            if executor["workers"]:
+                print(f"{'':<9} {name}: {executor['completed']} calls, wait p95 {executor['wait_ms']['p95']:.2f} ms, "
+                      f"run p95 {executor['run_ms']['p95']:.2f} ms")
+        print(f"{'':<9} sheets: {results['sheets']['rows_written']} rows written, {results['sheets']['pending']} pending")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Startup Profile
+
+Reports the cold-start cost of the server modules: the slowest imports from
+``python -X importtime`` for each module, then how long the lazy loaders take
+when the knowledge base is warmed up. Every measurement runs in a fresh
+interpreter, so nothing is already cached in sys.modules.
+
+Usage: python benchmarks/profile_startup.py [--top 15] [module ...]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MODULES = ["knowledge_base", "webhook.api", "server"]
+
+WARM_UP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import knowledge_base
+imported = time.perf_counter() - start
+start = time.perf_counter()
+knowledge_base.warm_up()
+warmed = time.perf_counter() - start
+from knowledge_base.utils import LOAD_TIMES
+print(json.dumps({"import": imported, "warm_up": warmed, "loads": LOAD_TIMES}))
+"""
+
+def run_python(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    return subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True)
+
+def import_times(module):
+    """Return ``(cumulative_us, self_us, name)`` rows for one cold import."""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return rows, error
+
+def report_imports(module, top):
+    rows, error = import_times(module)
+    if error:
+        print(f"\n{module}: import failed ({error})")
+        return
+    # Top-level imports are the ones with no indentation after the separator
+    total = sum(cumulative for cumulative, _, name in rows if not name.startswith("  "))
+    print(f"\n{module}: {total / 1000:.1f} ms total")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+
+def report_warm_up():
+    result = run_python(["-c", WARM_UP_SCRIPT])
+    if result.returncode:
+        print(f"\nwarm-up failed ({result.stderr.strip().splitlines()[-1]})")
+        return
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"\nknowledge_base import: {timings['import'] * 1000:.1f} ms, "
+          f"warm-up: {timings['warm_up'] * 1000:.1f} ms")
+    for name, seconds in sorted(timings["loads"].items(), key=lambda item: -item[1]):
+        print(f"{seconds * 1000:>14.1f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        report_imports(module, args.top)
+    report_warm_up()
+
+if __name__ == "__main__":
+    main()
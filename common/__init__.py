@@ -0,0 +1,6 @@
+"""
+Common Package
+
+This package contains the code shared by the knowledge base, webhook and
+conversation flow apps.
+"""
@@ -0,0 +1,222 @@
+"""
+Blocking Work Executor
+
+This module runs blocking work from the async API handlers off the event
+loop, so a burst of slow requests to one API queues in a bounded pool rather
+than stalling every other request.
+
+Work that waits on I/O or releases the GIL, such as SQLite and Google Sheets
+calls and tiktoken encoding, goes to a shared thread pool (run_blocking).
+Pure Python CPU work, such as decoding a long webhook body, only gets faster
+in another process, so it can go to an optional process pool instead
+(run_cpu_bound); without one it runs inline, since threads would only fight
+the event loop for the GIL.
+
+Both pools track how many calls are waiting and running, and how long calls
+wait for a worker and take to run, for monitoring.
+"""
+
+import asyncio
+import contextvars
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Tuple, TypeVar
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+# 0 runs the work inline on the event loop
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "0"))
+
+T = TypeVar("T")
+
+# Recent timings kept for the percentiles in stats()
+TIMING_WINDOW = 1000
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _preload(modules: Tuple[str, ...]):
+    for module in modules:
+        importlib.import_module(module)
+
+def _call_in_process(call: Callable[[], T]) -> Tuple[float, float, T]:
+    """Run a call in a worker process, timing it on the wall clock shared with the parent."""
+    started = time.time()
+    result = call()
+    return started, time.time(), result
+
+class BlockingExecutor:
+    """
+    Thread or process pool for blocking calls from async code, with queue metrics.
+
+    With 0 workers calls run inline. Calls for a process pool, and their
+    arguments and results, must be picklable, and since its workers are
+    spawned the script that started the server must guard its entry point
+    with if __name__ == "__main__" (server.py and uvicorn both do).
+    """
+
+    def __init__(self, workers: int, kind: str = "thread"):
+        self.workers = workers
+        self.kind = kind
+        if workers <= 0:
+            self._pool = None
+        elif kind == "process":
+            # Forking a server that is already running threads can deadlock the child
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blocking")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_times = deque(maxlen=TIMING_WINDOW)
+        self._run_times = deque(maxlen=TIMING_WINDOW)
+
+    async def run(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run function(*args, **kwargs) on the pool and await its result."""
+        call = partial(function, *args, **kwargs)
+        if self._pool is None:
+            return call()
+        if self.kind == "process":
+            return await self._run_in_process(call)
+
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+        # Run in the caller's context, so the request ID is still logged
+        context = contextvars.copy_context()
+
+        def timed_call():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._wait_times.append(started - submitted)
+            try:
+                return context.run(call)
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self._run_times.append(time.perf_counter() - started)
+
+        future = self._pool.submit(timed_call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A call cancelled before it started never leaves the queue itself
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    async def _run_in_process(self, call: Callable[[], T]) -> T:
+        submitted = time.time()
+        with self._lock:
+            self.queued += 1
+        # The worker process can't update these counters, so a call counts as
+        # queued until it returns and its wait is worked out afterwards
+        try:
+            started, finished, result = await asyncio.wrap_future(self._pool.submit(_call_in_process, call))
+        except BaseException as e:
+            with self._lock:
+                self.queued -= 1
+                if not isinstance(e, asyncio.CancelledError):
+                    self.failed += 1
+                    self.completed += 1
+            raise
+        with self._lock:
+            self.queued -= 1
+            self.completed += 1
+            self._wait_times.append(max(0.0, started - submitted))
+            self._run_times.append(finished - started)
+        return result
+
+    def start(self, *modules: str):
+        """Start the worker processes now and import modules in them, instead of on the first calls."""
+        if self.kind == "process" and self._pool is not None:
+            futures = [self._pool.submit(_preload, modules) for _ in range(self.workers)]
+            for future in futures:
+                future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, counters and recent wait and run times in milliseconds."""
+        with self._lock:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            stats = {
+                "kind": self.kind,
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed
+            }
+        for name, values in (("wait_ms", wait_times), ("run_ms", run_times)):
+            stats[name] = {
+                "p50": _percentile(values, 0.5) * 1000,
+                "p95": _percentile(values, 0.95) * 1000,
+                "max": max(values, default=0.0) * 1000
+            }
+        return stats
+
+_executor = None
+_cpu_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> BlockingExecutor:
+    """Return the shared thread pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BlockingExecutor(EXECUTOR_WORKERS, "thread")
+        return _executor
+
+def get_cpu_executor() -> BlockingExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _cpu_executor
+    with _executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = BlockingExecutor(CPU_EXECUTOR_WORKERS, "process")
+        return _cpu_executor
+
+async def run_blocking(function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a call that blocks on I/O or releases the GIL on the shared thread pool."""
+    return await get_executor().run(function, *args, **kwargs)
+
+async def run_cpu_bound(function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a picklable, CPU-bound call on the shared process pool, or inline without one."""
+    return await get_cpu_executor().run(function, *args, **kwargs)
+
+def executor_stats() -> Dict[str, Any]:
+    """Return the stats of both shared pools."""
+    return {"threads": get_executor().stats(), "processes": get_cpu_executor().stats()}
+
+def shutdown_executor():
+    """Wait for running calls and stop the shared pools."""
+    global _executor, _cpu_executor
+    with _executor_lock:
+        for executor in (_executor, _cpu_executor):
+            if executor is not None:
+                executor.shutdown()
+        _executor = _cpu_executor = None
@@ -0,0 +1,221 @@
+"""
+Structured Logging
+
+This module provides the logging used by the knowledge base, webhook and
+conversation flow modules in place of print(). Each log entry is an event
+name plus key=value fields, written as one JSON line (or plain text) to
+stdout.
+
+Logging never blocks a request: records are put on a bounded queue and
+written by a background thread, and are dropped if the queue is full.
+Nothing is formatted in the calling thread, and disabled levels and events
+left out by sampling are not even turned into records, so high-volume
+events can be logged at a sample rate instead of every time.
+
+Every HTTP request to the apps gets a request ID (from its X-Request-ID
+header, or a new one), which is added to everything logged while handling
+it, including from executor threads, and returned in the response headers.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Default fraction of high-volume events that are logged
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Parent of every logger created here, where the queue handler is attached
+ROOT_LOGGER = "bbq"
+
+REQUEST_ID: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def current_request_id() -> Optional[str]:
+    """Return the ID of the request being handled, if any."""
+    return REQUEST_ID.get()
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """Handle everything in the block as one request; also works as a decorator."""
+    token = REQUEST_ID.set(request_id or new_request_id())
+    try:
+        yield REQUEST_ID.get()
+    finally:
+        REQUEST_ID.reset(token)
+
+class RequestIdMiddleware:
+    """ASGI middleware that gives each HTTP request an ID and returns it in X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Keep the caller's ID so a request can be followed across services
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id" and 0 < len(value) <= 64:
+                request_id = value.decode("latin-1")
+                break
+        request_id = request_id or new_request_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        with request_context(request_id):
+            await self.app(scope, receive, send_with_id)
+
+class _QueueingHandler(logging.handlers.QueueHandler):
+    """Hands records to the log thread unformatted, dropping them if it falls behind."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The request ID is only known in the calling thread
+        record.request_id = REQUEST_ID.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Formats a record as "time level logger [request ID] event key=value ..."."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [self.formatTime(record), record.levelname, record.name]
+        if getattr(record, "request_id", None):
+            parts.append(f"[{record.request_id}]")
+        parts.append(record.getMessage())
+        parts.extend(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+_handler: Optional[_QueueingHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_logging_lock = threading.Lock()
+
+def configure_logging():
+    """Start the log thread and attach its queue to the root logger; does nothing if already started."""
+    global _handler, _listener
+    with _logging_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+        _handler = _QueueingHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        root.propagate = False
+        atexit.register(stop_logging)
+
+def stop_logging():
+    """Write out queued records and stop the log thread."""
+    global _handler, _listener
+    with _logging_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _handler = _listener = None
+
+def logging_stats() -> Dict[str, Any]:
+    """Return how many records are waiting to be written and how many were dropped."""
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+class EventLogger:
+    """
+    Logs events by name with key=value fields.
+
+    Field values are kept as they are and only formatted on the log thread,
+    so pass values that won't change afterwards rather than whole payloads.
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event: str, **fields: Any):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any):
+        """Log an error with the traceback of the exception being handled."""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+    def sample(self, event: str, rate: Optional[float] = None, **fields: Any):
+        """Log a high-volume info event for a random fraction of calls (LOG_SAMPLE_RATE by default)."""
+        rate = LOG_SAMPLE_RATE if rate is None else rate
+        if self._logger.isEnabledFor(logging.INFO) and random.random() < rate:
+            fields["sample_rate"] = rate
+            self._log(logging.INFO, event, fields)
+
+def get_logger(name: str) -> EventLogger:
+    """Return an event logger, starting the log thread on first use."""
+    configure_logging()
+    return EventLogger(name)
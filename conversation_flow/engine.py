@@ -0,0 +1,57 @@
+"""
+Conversation Flow Engine
+
+This module compiles the conversation flow transitions into a state machine.
+Each transition condition is parsed once into a predicate function, and the
+transitions are grouped by source state, so a step only evaluates the
+conditions of the current state, in order, without looking at the condition
+text again.
+
+Conditions are compiled by the expressions module, in Python for the local
+flow or Retell's JavaScript-like dialect for the Retell flow, so both flows
+can be run locally. Unsupported conditions are rejected when the
+transitions are compiled rather than when a conversation reaches them.
+"""
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from .expressions import Predicate, compile_expression
+
+class CompiledTransition(NamedTuple):
+    destination: str
+    condition: str
+    predicate: Predicate
+
+class StateMachine:
+    """Transitions compiled into per-state tables of predicates, checked in order."""
+
+    def __init__(self, transitions: Iterable[Dict[str, Any]], dialect: str = "python"):
+        tables: Dict[str, List[CompiledTransition]] = {}
+        for transition in transitions:
+            tables.setdefault(transition["source"], []).append(CompiledTransition(
+                transition["destination"],
+                transition["condition"],
+                compile_expression(transition["condition"], dialect)
+            ))
+        self.tables: Dict[str, Tuple[CompiledTransition, ...]] = {
+            state: tuple(table) for state, table in tables.items()
+        }
+
+    def next_state(self, current_state: str, context: Dict[str, Any], attempt_count: int, user_response: Any) -> str:
+        """
+        Return the destination of the first transition whose condition holds, or the current state.
+
+        The user's latest response is required because conditions can depend
+        on it; the greeting only moves on once the user has said something.
+        """
+        for transition in self.tables.get(current_state, ()):
+            if transition.predicate(context, attempt_count, user_response):
+                return transition.destination
+        return current_state
+
+    def states(self) -> List[str]:
+        """Return every state that appears in the transitions."""
+        states = dict.fromkeys(self.tables)
+        for table in self.tables.values():
+            states.update(dict.fromkeys(transition.destination for transition in table))
+        return list(states)
@@ -0,0 +1,386 @@
+"""
+Condition Expressions
+
+This module parses the transition conditions of both conversation flows into
+one small syntax tree and compiles it to Python functions, without eval().
+
+The local flow (transitions.py) writes conditions in Python:
+
+    attempt_count > 2 and not context.get('city')
+
+and the Retell flow (retell_integration.py) in Retell's JavaScript-like
+dialect:
+
+    city != null && transcript.toLowerCase().includes('delhi')
+
+In both, a context variable (``context.get('city')`` or ``city``) reads the
+conversation context, ``attempt_count`` is the number of attempts made in
+the current state, and the user's latest response is ``user_response`` in
+Python and ``transcript`` in JavaScript. Only boolean operators,
+comparisons (including ``is`` and ``is not`` in Python), lower-casing and
+substring tests are supported. Missing values never raise: lower-casing None
+gives None, nothing is found in None, None is found in no string, and
+ordering None or values of different types is false.
+
+Compiled predicates are cached by dialect and expression text, so the same
+condition is parsed once however many flows use it.
+"""
+
+import ast
+import operator
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
+
+# A predicate takes (context, attempt_count, user_response)
+Predicate = Callable[[Dict[str, Any], int, Any], bool]
+
+# Syntax tree shared by both dialects
+
+class Const(NamedTuple):
+    value: Any
+
+class Var(NamedTuple):
+    """A context variable, None when missing."""
+    name: str
+    default: Any = None
+
+class Input(NamedTuple):
+    """"attempt_count" or "user_response"."""
+    name: str
+
+class Not(NamedTuple):
+    operand: "Node"
+
+class And(NamedTuple):
+    operands: Tuple["Node", ...]
+
+class Or(NamedTuple):
+    operands: Tuple["Node", ...]
+
+class Compare(NamedTuple):
+    op: str
+    left: "Node"
+    right: "Node"
+
+class Contains(NamedTuple):
+    """Whether container (a string, list or dict) contains item."""
+    container: "Node"
+    item: "Node"
+
+class Lower(NamedTuple):
+    operand: "Node"
+
+Node = Union[Const, Var, Input, Not, And, Or, Compare, Contains, Lower]
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "is": operator.is_,
+    "is not": operator.is_not
+}
+
+# Comparisons that hold or fail for any pair of values
+EQUALITY = ("==", "!=", "is", "is not")
+
+# Python dialect
+
+PYTHON_COMPARISONS = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+    ast.Is: "is", ast.IsNot: "is not"
+}
+
+PYTHON_INPUTS = {"attempt_count": "attempt_count", "user_response": "user_response"}
+
+def parse_python(text: str) -> Node:
+    """Parse a condition written in Python."""
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid condition {text!r}: {e.msg}")
+    return _from_python(tree.body, text)
+
+def _from_python(node: ast.AST, text: str) -> Node:
+    if isinstance(node, ast.Constant):
+        return Const(node.value)
+    if isinstance(node, ast.Name) and node.id in PYTHON_INPUTS:
+        return Input(PYTHON_INPUTS[node.id])
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return Not(_from_python(node.operand, text))
+    if isinstance(node, ast.BoolOp):
+        operands = tuple(_from_python(value, text) for value in node.values)
+        return And(operands) if isinstance(node.op, ast.And) else Or(operands)
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and not node.keywords:
+        target, method, args = node.func.value, node.func.attr, node.args
+        # context.get('city') or context.get('city', default)
+        if (method == "get" and isinstance(target, ast.Name) and target.id == "context" and 1 <= len(args) <= 2
+                and all(isinstance(arg, ast.Constant) for arg in args)):
+            return Var(args[0].value, args[1].value if len(args) == 2 else None)
+        if method == "lower" and not args:
+            return Lower(_from_python(target, text))
+
+    if isinstance(node, ast.Compare):
+        # a < b < c means a < b and b < c
+        comparisons = []
+        left = _from_python(node.left, text)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _from_python(comparator, text)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                comparison = Contains(right, left)
+                comparisons.append(Not(comparison) if isinstance(op, ast.NotIn) else comparison)
+            elif type(op) in PYTHON_COMPARISONS:
+                comparisons.append(Compare(PYTHON_COMPARISONS[type(op)], left, right))
+            else:
+                break
+            left = right
+        else:
+            return comparisons[0] if len(comparisons) == 1 else And(tuple(comparisons))
+
+    raise ValueError(f"Unsupported expression {ast.unparse(node)!r} in condition {text!r}")
+
+# JavaScript dialect
+
+JS_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?)
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<name>[A-Za-z_$][A-Za-z0-9_$]*)
+      | (?P<op>===|!==|==|!=|<=|>=|&&|\|\||[<>!().,])
+    )""", re.VERBOSE)
+
+JS_CONSTANTS = {"true": True, "false": False, "null": None, "undefined": None}
+
+JS_INPUTS = {"transcript": "user_response", "attempt_count": "attempt_count"}
+
+def _tokenize_js(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = JS_TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {text[position:].lstrip()[:1]!r} in condition {text!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    tokens.append(("end", ""))
+    return tokens
+
+class _JsParser:
+    """Recursive descent parser: or > and > comparison > not > method calls > values."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = _tokenize_js(text)
+        self.position = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.position]
+
+    def take(self, value: str = None) -> Tuple[str, str]:
+        token = self.tokens[self.position]
+        if value is not None and token[1] != value:
+            raise ValueError(f"Expected {value!r} but found {token[1] or 'the end'!r} in condition {self.text!r}")
+        if token[0] != "end":
+            self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.peek()[0] != "end":
+            raise ValueError(f"Unexpected {self.peek()[1]!r} in condition {self.text!r}")
+        return node
+
+    def parse_or(self) -> Node:
+        operands = [self.parse_and()]
+        while self.peek() == ("op", "||"):
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def parse_and(self) -> Node:
+        operands = [self.parse_comparison()]
+        while self.peek() == ("op", "&&"):
+            self.take()
+            operands.append(self.parse_comparison())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def parse_comparison(self) -> Node:
+        left = self.parse_not()
+        kind, value = self.peek()
+        if kind == "op" and value in ("===", "!==", "==", "!=", "<", "<=", ">", ">="):
+            self.take()
+            # Without type coercion, == and === mean the same here
+            return Compare(value[:2], left, self.parse_not())
+        return left
+
+    def parse_not(self) -> Node:
+        if self.peek() == ("op", "!"):
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_call()
+
+    def parse_call(self) -> Node:
+        node = self.parse_value()
+        while self.peek() == ("op", "."):
+            self.take()
+            kind, method = self.take()
+            self.take("(")
+            args = []
+            if self.peek() != ("op", ")"):
+                args.append(self.parse_or())
+                while self.peek() == ("op", ","):
+                    self.take()
+                    args.append(self.parse_or())
+            self.take(")")
+            if kind == "name" and method == "toLowerCase" and not args:
+                node = Lower(node)
+            elif kind == "name" and method == "includes" and len(args) == 1:
+                node = Contains(node, args[0])
+            else:
+                raise ValueError(f"Unsupported method {method!r} in condition {self.text!r}")
+        return node
+
+    def parse_value(self) -> Node:
+        kind, value = self.take()
+        if kind == "number":
+            return Const(float(value) if "." in value else int(value))
+        if kind == "string":
+            return Const(ast.literal_eval(value))
+        if kind == "name":
+            if value in JS_CONSTANTS:
+                return Const(JS_CONSTANTS[value])
+            if value in JS_INPUTS:
+                return Input(JS_INPUTS[value])
+            return Var(value)
+        if value == "(":
+            node = self.parse_or()
+            self.take(")")
+            return node
+        raise ValueError(f"Unexpected {value or 'end'!r} in condition {self.text!r}")
+
+def parse_js(text: str) -> Node:
+    """Parse a condition written in Retell's JavaScript-like dialect."""
+    return _JsParser(text).parse()
+
+PARSERS = {"python": parse_python, "js": parse_js}
+
+# Compiling
+
+def compile_node(node: Node) -> Callable[[Dict[str, Any], int, Any], Any]:
+    """Compile a syntax tree to a function of (context, attempt_count, user_response)."""
+    if isinstance(node, Const):
+        value = node.value
+        return lambda c, a, u: value
+
+    if isinstance(node, Var):
+        name, default = node.name, node.default
+        if default is None:
+            return lambda c, a, u: c.get(name)
+        return lambda c, a, u: c.get(name, default)
+
+    if isinstance(node, Input):
+        if node.name == "attempt_count":
+            return lambda c, a, u: a
+        return lambda c, a, u: u
+
+    if isinstance(node, Not):
+        operand = compile_node(node.operand)
+        return lambda c, a, u: not operand(c, a, u)
+
+    if isinstance(node, (And, Or)):
+        operands = [compile_node(operand) for operand in node.operands]
+        if len(operands) == 2:
+            first, second = operands
+            if isinstance(node, And):
+                return lambda c, a, u: first(c, a, u) and second(c, a, u)
+            return lambda c, a, u: first(c, a, u) or second(c, a, u)
+        stop_when = not isinstance(node, And)
+        def chain(c, a, u):
+            result = not stop_when
+            for operand in operands:
+                result = operand(c, a, u)
+                if bool(result) == stop_when:
+                    return result
+            return result
+        return chain
+
+    if isinstance(node, Compare):
+        compare = COMPARISONS[node.op]
+        left = compile_node(node.left)
+        # Comparisons against a constant, like attempt_count > 2, skip a call
+        if isinstance(node.right, Const):
+            value = node.right.value
+            if node.op in EQUALITY:
+                return lambda c, a, u: compare(left(c, a, u), value)
+            return lambda c, a, u: _order(compare, left(c, a, u), value)
+        right = compile_node(node.right)
+        if node.op in EQUALITY:
+            return lambda c, a, u: compare(left(c, a, u), right(c, a, u))
+        return lambda c, a, u: _order(compare, left(c, a, u), right(c, a, u))
+
+    if isinstance(node, Contains):
+        container = compile_node(node.container)
+        if isinstance(node.item, Const) and isinstance(node.item.value, str):
+            item = node.item.value
+            # Substring tests of the transcript are the common case
+            def contains_text(c, a, u):
+                x = container(c, a, u)
+                return item in x if isinstance(x, str) else _contains(x, item)
+            return contains_text
+        item_of = compile_node(node.item)
+        return lambda c, a, u: _contains(container(c, a, u), item_of(c, a, u))
+
+    if isinstance(node, Lower):
+        operand = compile_node(node.operand)
+        def lower(c, a, u):
+            x = operand(c, a, u)
+            return x.lower() if isinstance(x, str) else x
+        return lower
+
+    raise ValueError(f"Unknown expression node {node!r}")
+
+def _order(compare: Callable[[Any, Any], bool], x: Any, y: Any) -> bool:
+    """An ordering comparison that is false for None or values that can't be ordered."""
+    if x is None or y is None:
+        return False
+    try:
+        return compare(x, y)
+    except TypeError:
+        return False
+
+def _contains(container: Any, item: Any) -> bool:
+    """Whether container contains item; false for None or an item of the wrong type."""
+    if isinstance(container, str):
+        return isinstance(item, str) and item in container
+    if container is None:
+        return False
+    try:
+        return item in container
+    except TypeError:
+        return False
+
+_compiled: Dict[Tuple[str, str], Predicate] = {}
+_compiled_lock = threading.Lock()
+
+def parse_expression(text: str, dialect: str = "python") -> Node:
+    """Parse a condition in the "python" or "js" dialect; raises ValueError if it is not supported."""
+    if dialect not in PARSERS:
+        raise ValueError(f"Unknown condition dialect {dialect!r}")
+    return PARSERS[dialect](text)
+
+def compile_expression(text: str, dialect: str = "python") -> Predicate:
+    """Return the predicate for a condition, parsing and compiling it on first use."""
+    key = (dialect, text)
+    predicate = _compiled.get(key)
+    if predicate is None:
+        evaluate = compile_node(parse_expression(text, dialect))
+        predicate = lambda context, attempt_count=0, user_response=None: bool(evaluate(context, attempt_count, user_response))
+        with _compiled_lock:
+            predicate = _compiled.setdefault(key, predicate)
+    return predicate
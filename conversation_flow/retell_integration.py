@@ -9,8 +9,9 @@ import os
 import requests
 import json
 from dotenv import load_dotenv
-from jinja2 import Template
-from .templates import TEMPLATES
+from common.logs import get_logger, request_context, current_request_id, new_request_id
+from .templates import GLOBAL_PROMPT, TEMPLATES, render_prompt
+from .engine import StateMachine
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +30,12 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+log = get_logger("conversation_flow.retell_integration")
+
+def request_headers():
+    """Headers for a Retell API request, tagged with the current request ID."""
+    return dict(HEADERS, **{"X-Request-ID": current_request_id() or new_request_id()})
+
 def create_agent(name, description, voice_id="matthew"):
     """Create a new Retell agent."""
     payload = {
@@ -38,39 +45,45 @@ def create_agent(name, description, voice_id="matthew"):
         "llm": "gpt-4"
     }
     
-    response = requests.post(RETELL_AGENTS_URL, headers=HEADERS, json=payload)
+    response = requests.post(RETELL_AGENTS_URL, headers=request_headers(), json=payload)
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error creating agent: {response.text}")
+        log.error("retell_request_failed", operation="create_agent", status=response.status_code, response=response.text)
         return None
 
-def create_flow(agent_id, name, description):
-    """Create a new conversation flow for an agent."""
+def create_flow(agent_id, name, description, global_prompt=GLOBAL_PROMPT.strip()):
+    """Create a new conversation flow for an agent, with the prompt shared by all its nodes."""
     payload = {
         "agent_id": agent_id,
         "name": name,
-        "description": description
+        "description": description,
+        "global_prompt": global_prompt
     }
     
-    response = requests.post(RETELL_FLOWS_URL, headers=HEADERS, json=payload)
+    response = requests.post(RETELL_FLOWS_URL, headers=request_headers(), json=payload)
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error creating flow: {response.text}")
+        log.error("retell_request_failed", operation="create_flow", status=response.status_code, response=response.text)
         return None
 
 def create_node(flow_id, name, state_name, template_variables=None):
-    """Create a new node in a conversation flow."""
+    """
+    Create a new node in a conversation flow.
+
+    Without template_variables the raw template is sent, which doesn't
+    introduce the assistant: that line is the global_prompt create_flow gives
+    the whole flow, so nodes only work in a flow created that way.
+    """
     # Get the template for this state
     template_str = TEMPLATES.get(state_name, "")
     
-    # Render the template with variables (if provided)
+    # Render the template with variables (if provided); the flow already has the global prompt
     if template_variables:
-        template = Template(template_str)
-        prompt = template.render(**template_variables)
+        prompt = render_prompt(state_name, template_variables, include_global=False).text
     else:
         prompt = template_str
     
@@ -80,12 +93,12 @@ def create_node(flow_id, name, state_name, template_variables=None):
         "prompt": prompt
     }
     
-    response = requests.post(RETELL_NODES_URL, headers=HEADERS, json=payload)
+    response = requests.post(RETELL_NODES_URL, headers=request_headers(), json=payload)
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error creating node: {response.text}")
+        log.error("retell_request_failed", operation="create_node", status=response.status_code, response=response.text)
         return None
 
 def create_edge(flow_id, from_node_id, to_node_id, condition):
@@ -97,16 +110,108 @@ def create_edge(flow_id, from_node_id, to_node_id, condition):
         "condition": condition
     }
     
-    response = requests.post(RETELL_EDGES_URL, headers=HEADERS, json=payload)
+    response = requests.post(RETELL_EDGES_URL, headers=request_headers(), json=payload)
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error creating edge: {response.text}")
+        log.error("retell_request_failed", operation="create_edge", status=response.status_code, response=response.text)
         return None
 
+# Edges of the Retell flow, in the same format as transitions.transitions but
+# with conditions in Retell's JavaScript-like dialect
+EDGES = [
+    {
+        "source": "greeting",
+        "destination": "city_collection",
+        "condition": "true",
+        "description": "Always transition after greeting"
+    },
+    {
+        "source": "city_collection",
+        "destination": "outlet_collection",
+        "condition": "city != null && (transcript.toLowerCase().includes('delhi') || transcript.toLowerCase().includes('bangalore'))",
+        "description": "City Collection to Outlet Collection"
+    },
+    {
+        "source": "outlet_collection",
+        "destination": "intent_identification",
+        "condition": "outlet != null",
+        "description": "Outlet Collection to Intent Identification"
+    },
+    {
+        "source": "intent_identification",
+        "destination": "information_inquiry",
+        "condition": "transcript.toLowerCase().includes('information') || transcript.toLowerCase().includes('menu') || transcript.toLowerCase().includes('hour') || transcript.toLowerCase().includes('facilities') || transcript.toLowerCase().includes('parking')",
+        "description": "Intent Identification to Information Inquiry"
+    },
+    # Changes and cancellations come before new reservations, because "change
+    # my booking" and "cancel my reservation" mention a booking too
+    {
+        "source": "intent_identification",
+        "destination": "modify_reservation",
+        "condition": "transcript.toLowerCase().includes('modify') || transcript.toLowerCase().includes('change') || transcript.toLowerCase().includes('update')",
+        "description": "Intent Identification to Modify Reservation"
+    },
+    {
+        "source": "intent_identification",
+        "destination": "cancel_reservation",
+        "condition": "transcript.toLowerCase().includes('cancel')",
+        "description": "Intent Identification to Cancel Reservation"
+    },
+    {
+        "source": "intent_identification",
+        "destination": "new_reservation",
+        "condition": "transcript.toLowerCase().includes('reservation') || transcript.toLowerCase().includes('book') || transcript.toLowerCase().includes('table')",
+        "description": "Intent Identification to New Reservation"
+    },
+    {
+        "source": "information_inquiry",
+        "destination": "farewell",
+        "condition": "transcript.toLowerCase().includes('thank you') || transcript.toLowerCase().includes('thanks') || transcript.toLowerCase().includes('goodbye')",
+        "description": "Information Inquiry to Farewell"
+    },
+    {
+        "source": "new_reservation",
+        "destination": "reservation_confirmation",
+        "condition": "date != null && time != null && party_size != null && customer_name != null && phone_number != null",
+        "description": "New Reservation to Reservation Confirmation"
+    },
+    {
+        "source": "reservation_confirmation",
+        "destination": "farewell",
+        "condition": "true",
+        "description": "Always transition after confirmation"
+    },
+    {
+        "source": "modify_reservation",
+        "destination": "farewell",
+        "condition": "transcript.toLowerCase().includes('thank you') || transcript.toLowerCase().includes('thanks') || transcript.toLowerCase().includes('goodbye')",
+        "description": "Modify Reservation to Farewell"
+    },
+    {
+        "source": "cancel_reservation",
+        "destination": "farewell",
+        "condition": "confirmation == 'yes'",
+        "description": "Cancel Reservation to Farewell"
+    },
+    {
+        "source": "fallback",
+        "destination": "city_collection",
+        "condition": "transcript.toLowerCase().includes('start over') || transcript.toLowerCase().includes('restart')",
+        "description": "Fallback to City Collection"
+    },
+    {
+        "source": "fallback",
+        "destination": "farewell",
+        "condition": "transcript.toLowerCase().includes('goodbye') || transcript.toLowerCase().includes('bye')",
+        "description": "Fallback to Farewell"
+    }
+]
+
+@request_context()
 def create_bbq_nation_flow():
-    """Create the complete Barbeque Nation conversation flow."""
+    """Create the complete Barbeque Nation conversation flow, as one request ID in the logs."""
     # Create an agent
     agent = create_agent(
         name="BBQ Nation Assistant",
@@ -256,118 +361,13 @@ def create_bbq_nation_flow():
     )
     
     # Create edges between nodes
-    
-    # Greeting to City Collection
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["greeting"]["id"],
-        to_node_id=nodes["city_collection"]["id"],
-        condition="true"  # Always transition after greeting
-    )
-    
-    # City Collection to Outlet Collection
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["city_collection"]["id"],
-        to_node_id=nodes["outlet_collection"]["id"],
-        condition="city != null && (transcript.toLowerCase().includes('delhi') || transcript.toLowerCase().includes('bangalore'))"
-    )
-    
-    # Outlet Collection to Intent Identification
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["outlet_collection"]["id"],
-        to_node_id=nodes["intent_identification"]["id"],
-        condition="outlet != null"
-    )
-    
-    # Intent Identification to Information Inquiry
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["intent_identification"]["id"],
-        to_node_id=nodes["information_inquiry"]["id"],
-        condition="transcript.toLowerCase().includes('information') || transcript.toLowerCase().includes('menu') || transcript.toLowerCase().includes('hour') || transcript.toLowerCase().includes('facilities') || transcript.toLowerCase().includes('parking')"
-    )
-    
-    # Intent Identification to New Reservation
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["intent_identification"]["id"],
-        to_node_id=nodes["new_reservation"]["id"],
-        condition="transcript.toLowerCase().includes('reservation') || transcript.toLowerCase().includes('book') || transcript.toLowerCase().includes('table')"
-    )
-    
-    # Intent Identification to Modify Reservation
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["intent_identification"]["id"],
-        to_node_id=nodes["modify_reservation"]["id"],
-        condition="transcript.toLowerCase().includes('modify') || transcript.toLowerCase().includes('change') || transcript.toLowerCase().includes('update')"
-    )
-    
-    # Intent Identification to Cancel Reservation
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["intent_identification"]["id"],
-        to_node_id=nodes["cancel_reservation"]["id"],
-        condition="transcript.toLowerCase().includes('cancel')"
-    )
-    
-    # Information Inquiry to Farewell
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["information_inquiry"]["id"],
-        to_node_id=nodes["farewell"]["id"],
-        condition="transcript.toLowerCase().includes('thank you') || transcript.toLowerCase().includes('thanks') || transcript.toLowerCase().includes('goodbye')"
-    )
-    
-    # New Reservation to Reservation Confirmation
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["new_reservation"]["id"],
-        to_node_id=nodes["reservation_confirmation"]["id"],
-        condition="date != null && time != null && party_size != null && customer_name != null && phone_number != null"
-    )
-    
-    # Reservation Confirmation to Farewell
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["reservation_confirmation"]["id"],
-        to_node_id=nodes["farewell"]["id"],
-        condition="true"  # Always transition after confirmation
-    )
-    
-    # Modify Reservation to Farewell
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["modify_reservation"]["id"],
-        to_node_id=nodes["farewell"]["id"],
-        condition="transcript.toLowerCase().includes('thank you') || transcript.toLowerCase().includes('thanks') || transcript.toLowerCase().includes('goodbye')"
-    )
-    
-    # Cancel Reservation to Farewell
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["cancel_reservation"]["id"],
-        to_node_id=nodes["farewell"]["id"],
-        condition="confirmation == 'yes'"
-    )
-    
-    # Fallback to City Collection
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["fallback"]["id"],
-        to_node_id=nodes["city_collection"]["id"],
-        condition="transcript.toLowerCase().includes('start over') || transcript.toLowerCase().includes('restart')"
-    )
-    
-    # Fallback to Farewell
-    create_edge(
-        flow_id=flow_id,
-        from_node_id=nodes["fallback"]["id"],
-        to_node_id=nodes["farewell"]["id"],
-        condition="transcript.toLowerCase().includes('goodbye') || transcript.toLowerCase().includes('bye')"
-    )
+    for edge in EDGES:
+        create_edge(
+            flow_id=flow_id,
+            from_node_id=nodes[edge["source"]]["id"],
+            to_node_id=nodes[edge["destination"]]["id"],
+            condition=edge["condition"]
+        )
     
     return {
         "agent": agent,
@@ -375,14 +375,18 @@ def create_bbq_nation_flow():
         "nodes": nodes
     }
 
+def get_retell_state_machine():
+    """Return the Retell flow's edges as a state machine, to run the flow locally."""
+    return StateMachine(EDGES, dialect="js")
+
 def get_flow_details(flow_id):
     """Get details for a conversation flow."""
-    response = requests.get(f"{RETELL_FLOWS_URL}/{flow_id}", headers=HEADERS)
+    response = requests.get(f"{RETELL_FLOWS_URL}/{flow_id}", headers=request_headers())
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error getting flow details: {response.text}")
+        log.error("retell_request_failed", operation="get_flow_details", status=response.status_code, response=response.text)
         return None
 
 def purchase_phone_number(agent_id):
@@ -392,10 +396,10 @@ def purchase_phone_number(agent_id):
         "country": "US"  # Assuming we're purchasing a US number
     }
     
-    response = requests.post(f"{RETELL_BASE_URL}/phone-numbers", headers=HEADERS, json=payload)
+    response = requests.post(f"{RETELL_BASE_URL}/phone-numbers", headers=request_headers(), json=payload)
     
     if response.status_code == 200:
         return response.json()
     else:
-        print(f"Error purchasing phone number: {response.text}")
+        log.error("retell_request_failed", operation="purchase_phone_number", status=response.status_code, response=response.text)
         return None 
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""
+Conversation Simulator
+
+This module runs simulated conversations through the conversation flow
+without live calls, so the flow logic can be exercised and timed offline.
+
+Each turn of a simulated user says something (and, for the local flow,
+fills in the context slots that a speech model would extract from it). The
+turn then goes through the same stages as a live one:
+
+- transition: get_next_state picks the next state
+- render: the prompt of that state is rendered with the context, and its
+  tokens counted
+- kb: questions asked in the information state are looked up in the
+  knowledge base
+
+Users are either scripted (a fixed list of turns) or generated at random,
+and thousands of conversations can run at once on one event loop. The
+latency of every stage and the prompt tokens of every state are recorded,
+so runs can be compared over time.
+
+The Go chatbot's /chatbot/state-flow handler can be driven the same way by
+giving its URL, in which case each transition is one request to it and
+there is nothing to render or look up.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from knowledge_base.data import knowledge_base
+from .templates import RenderedPrompt, render_prompt
+from .transitions import get_next_state
+
+STAGES = ("transition", "render", "kb")
+
+class UserTurn(NamedTuple):
+    """What the user says, and the context slots it fills in for the local flow."""
+    text: str
+    slots: Dict[str, Any] = {}
+
+# A user takes the current state and context and returns the next turn
+User = Callable[[str, Dict[str, Any]], UserTurn]
+
+def scripted_user(turns: List[UserTurn]) -> User:
+    """A user who says the given turns in order, then hangs up with "bye"."""
+    remaining = iter(turns)
+    return lambda state, context: next(remaining, UserTurn("bye", {"end_conversation": True}))
+
+CITIES = [city for city in knowledge_base if city != "menu"]
+
+QUESTIONS = [
+    "What are the timings?",
+    "Is there parking available?",
+    "What veg starters do you have?",
+    "What is the address?",
+    "Do you serve Jain food?",
+    "What are the dessert options?",
+]
+
+INTENTS = [
+    ("I'd like some information about the outlet", "inquiry"),
+    ("I want to book a table", "new_reservation"),
+    ("I need to change my booking", "modify_reservation"),
+    ("Please cancel my reservation", "cancel_reservation"),
+]
+
+RESERVATION_DETAILS = [
+    ("date", lambda rng: rng.choice(["today", "tomorrow", "saturday", "sunday"]), "on {}"),
+    ("time", lambda rng: f"{rng.randint(6, 10)} pm", "at {}"),
+    ("party_size", lambda rng: rng.randint(2, 12), "for {} people"),
+    ("customer_name", lambda rng: rng.choice(["Asha", "Ravi", "Meera", "John"]), "my name is {}"),
+    ("phone_number", lambda rng: f"98{rng.randint(10000000, 99999999)}", "my number is {}"),
+]
+
+def random_user(rng: random.Random, confusion: float = 0.1) -> User:
+    """
+    A user who answers what each state asks for, and who says something
+    unhelpful with probability ``confusion``.
+
+    Understands the states of both the local flow and the Go chatbot.
+    """
+    def turn(state: str, context: Dict[str, Any]) -> UserTurn:
+        city = context.get("city") or rng.choice(CITIES)
+        if rng.random() < confusion:
+            return UserTurn(rng.choice(["hmm", "sorry, what?", "can you repeat that"]))
+
+        if state == "greeting":
+            if rng.random() < 0.3:
+                return UserTurn(f"Hi, I'm looking for a place in {city.title()}", {"city": city})
+            return UserTurn("Hi, I'd like to book a table")
+        if state in ("city_collection", "city"):
+            return UserTurn(f"{city.title()} please", {"city": city})
+        if state in ("outlet_collection", "outlet"):
+            outlet = rng.choice(list(knowledge_base[city]))
+            return UserTurn(f"The {outlet.replace('_', ' ')} one", {"outlet": outlet})
+        if state == "intent_identification":
+            text, intent = rng.choice(INTENTS)
+            return UserTurn(text, {"intent": intent})
+        if state == "information_inquiry":
+            if rng.random() < 0.3:
+                return UserTurn("Thanks, that's all", {"inquiry_complete": True})
+            return UserTurn(rng.choice(QUESTIONS))
+        if state == "new_reservation":
+            missing = [detail for detail in RESERVATION_DETAILS if not context.get(detail[0])]
+            slot, value, phrase = rng.choice(missing or RESERVATION_DETAILS)
+            value = value(rng)
+            return UserTurn(phrase.format(value).capitalize(), {slot: value})
+        if state == "reservation":
+            return UserTurn(f"Tomorrow at {rng.randint(6, 10)} pm for {rng.randint(2, 12)} people")
+        if state == "contact":
+            return UserTurn(f"Asha, 98{rng.randint(10000000, 99999999)}")
+        if state in ("reservation_confirmation", "confirmation"):
+            return UserTurn("Yes, that's correct", {"reservation_confirmed": True})
+        if state == "modify_reservation":
+            return UserTurn("Move it to saturday please", {"modification_complete": True})
+        if state == "cancel_reservation":
+            return UserTurn("Yes, cancel it", {"confirmation": "yes", "cancellation_complete": True})
+        if state == "fallback":
+            if rng.random() < 0.5:
+                return UserTurn("Let's start over", {"restart": True})
+            return UserTurn("Never mind, bye", {"end_conversation": True})
+        return UserTurn("Thank you, bye")
+    return turn
+
+class Session:
+    """One simulated conversation."""
+
+    __slots__ = ("state", "context", "attempts", "turns", "finished")
+
+    def __init__(self, state: str = "greeting"):
+        self.state = state
+        self.context: Dict[str, Any] = {}
+        self.attempts = 0
+        self.turns = 0
+        self.finished = False
+
+class SimulationReport:
+    """Stage latencies, prompt tokens and conversation counts from a simulation run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.prompt_tokens: Dict[str, List[int]] = {}
+        self.final_states: Dict[str, int] = {}
+        self.conversations = 0
+        self.turns = 0
+        self.elapsed = 0.0
+
+    def record(self, stage: str, started: float):
+        self.latencies[stage].append(time.perf_counter() - started)
+
+    def record_prompt(self, prompt: RenderedPrompt):
+        self.prompt_tokens.setdefault(prompt.state, []).append(prompt.tokens)
+
+    def prompt_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the renders and mean and max prompt tokens of each state that was rendered."""
+        return {
+            state: {"renders": len(tokens), "mean": sum(tokens) / len(tokens), "max": max(tokens)}
+            for state, tokens in sorted(self.prompt_tokens.items())
+        }
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the count and p50, p95, p99 and max latency in milliseconds of each stage that ran."""
+        stats = {}
+        for stage, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            ordered = sorted(latencies)
+            pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+            stats[stage] = {
+                "count": len(ordered),
+                "p50": pick(0.5),
+                "p95": pick(0.95),
+                "p99": pick(0.99),
+                "max": ordered[-1] * 1000
+            }
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "conversations": self.conversations,
+            "turns": self.turns,
+            "elapsed": self.elapsed,
+            "turns_per_second": self.turns / self.elapsed if self.elapsed else 0.0,
+            "stages": self.stage_stats(),
+            "prompt_tokens": self.prompt_stats(),
+            "final_states": dict(sorted(self.final_states.items()))
+        }
+
+class ConversationSimulator:
+    """
+    Runs simulated users through the local flow, or the Go chatbot's state flow.
+
+    ``client`` is an httpx.AsyncClient for the knowledge base (mounted at
+    kb_path) and, with go_url, the Go chatbot. Without a client the
+    knowledge base stage is skipped.
+    """
+
+    def __init__(self, client=None, kb_path: str = "/kb", go_url: Optional[str] = None, max_turns: int = 30):
+        self.client = client
+        self.kb_path = kb_path
+        self.go_url = go_url
+        self.max_turns = max_turns
+
+    async def run_conversation(self, user: User, report: SimulationReport, session: Optional[Session] = None) -> Session:
+        """Run one conversation until it ends or reaches max_turns."""
+        session = session or Session()
+        while not session.finished and session.turns < self.max_turns:
+            turn = user(session.state, session.context)
+            session.turns += 1
+            if self.go_url:
+                await self._go_step(session, turn, report)
+            else:
+                await self._local_step(session, turn, report)
+            # Let other conversations run between turns
+            await asyncio.sleep(0)
+
+        report.conversations += 1
+        report.turns += session.turns
+        report.final_states[session.state] = report.final_states.get(session.state, 0) + 1
+        return session
+
+    async def _local_step(self, session: Session, turn: UserTurn, report: SimulationReport):
+        session.context.update(turn.slots)
+
+        started = time.perf_counter()
+        next_state = get_next_state(session.state, session.context, session.attempts, turn.text)
+        report.record("transition", started)
+        session.attempts = session.attempts + 1 if next_state == session.state else 0
+        session.state = next_state
+
+        started = time.perf_counter()
+        prompt = render_prompt(next_state, session.context)
+        report.record("render", started)
+        report.record_prompt(prompt)
+
+        if next_state == "information_inquiry" and turn.text in QUESTIONS and self.client is not None:
+            started = time.perf_counter()
+            response = await self.client.post(f"{self.kb_path}/query", json={
+                "query": turn.text,
+                "city": session.context.get("city"),
+                "outlet": session.context.get("outlet")
+            })
+            report.record("kb", started)
+            response.raise_for_status()
+
+        session.finished = next_state == "farewell"
+
+    async def _go_step(self, session: Session, turn: UserTurn, report: SimulationReport):
+        started = time.perf_counter()
+        response = await self.client.post(self.go_url, json={
+            "user_id": "simulator",
+            "current_state": session.state,
+            "message": turn.text,
+            "context": session.context
+        })
+        report.record("transition", started)
+        response.raise_for_status()
+        result = response.json()
+        session.state = result["next_state"]
+        session.context = result.get("context") or {}
+        session.finished = result.get("finished", False) or session.state == "end"
+
+    async def run(self, users: List[User], concurrency: int = 100) -> SimulationReport:
+        """Run one conversation per user, at most ``concurrency`` at a time."""
+        report = SimulationReport()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run_one(user):
+            async with slots:
+                await self.run_conversation(user, report)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(user) for user in users))
+        report.elapsed = time.perf_counter() - started
+        return report
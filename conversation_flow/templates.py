@@ -3,11 +3,48 @@ Conversation Flow Templates
 
 This module contains Jinja templates for the Retell AI conversation flow states.
 These templates are used to generate the prompts for each state in the conversation.
+
+Templates are compiled once, by a shared jinja2 Environment, and kept by
+state name, so render_template is cheap enough to call on every turn. The
+compiled bytecode is also cached on disk (in TEMPLATE_CACHE_DIR, or the
+system temp directory), so a fresh process skips compiling too. The
+Environment uses trim_blocks and lstrip_blocks, so a line holding only a
+{% if %} or {% endif %} tag renders as nothing rather than a blank or
+indented line; prompts differ from the raw templates in that whitespace.
+
+The line introducing the assistant is written once, in GLOBAL_PROMPT,
+rather than in every state. render_prompt puts the two together, counts
+the tokens of the result with the knowledge base tokenizer and, for prompts
+over PROMPT_TOKEN_BUDGET, trims the context values until the prompt fits,
+keeping per-state token counts that prompt_token_stats reports. The
+instructions are never cut: a state whose instructions alone are over the
+budget raises ValueError.
+"""
+
+import os
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from jinja2 import DictLoader, Environment, FileSystemBytecodeCache, Template, meta
+from common.logs import get_logger
+from knowledge_base.utils import count_tokens, truncate_to_token_limit
+
+# Load environment variables
+load_dotenv()
+# Unset or empty caches compiled templates in the temp directory; "off" keeps them in memory only
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+# Most tokens a rendered prompt may have, global prompt included
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "400"))
+
+log = get_logger("conversation_flow.templates")
+
+# Global prompt, shared by every state
+GLOBAL_PROMPT = """
+You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
 """
 
 # Greeting state template
 GREETING_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
 Your goal is to help customers with inquiries about Barbeque Nation restaurants in Delhi and Bangalore,
 take new reservations, modify existing reservations, or cancel reservations.
 
@@ -23,8 +60,6 @@ Which city's Barbeque Nation restaurant are you interested in today, Delhi or Ba
 
 # City collection template
 CITY_COLLECTION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 {% if city %}
 The customer has indicated they're interested in Barbeque Nation restaurants in {{ city }}.
 {% else %}
@@ -45,8 +80,6 @@ Be friendly and concise. Don't provide additional information unless asked.
 
 # Outlet collection template
 OUTLET_COLLECTION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer is interested in Barbeque Nation in {{ city }}.
 
 {% if outlet %}
@@ -69,8 +102,6 @@ If they haven't specified an outlet, ask which outlet they're interested in.
 
 # Intent identification template
 INTENT_IDENTIFICATION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer is interested in the {{ outlet }} outlet in {{ city }}.
 
 Your task is to identify their primary intention:
@@ -87,8 +118,6 @@ Be attentive to keywords like "book", "reserve", "cancel", "change", "modify", "
 
 # Information inquiry template
 INFORMATION_INQUIRY_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer is asking for information about the {{ outlet }} outlet in {{ city }}.
 
 You have access to the following information through the knowledge base API:
@@ -115,8 +144,6 @@ Keep responses accurate, helpful and concise.
 
 # New reservation template
 NEW_RESERVATION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer wants to make a new reservation at the {{ outlet }} outlet in {{ city }}.
 
 You need to collect the following information:
@@ -166,8 +193,6 @@ If the customer provides ambiguous information, seek clarification.
 
 # Reservation confirmation template
 RESERVATION_CONFIRMATION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 You have collected all the reservation details:
 - Outlet: {{ outlet }} in {{ city }}
 - Date: {{ date }}
@@ -186,8 +211,6 @@ If they have no further questions, thank them for choosing Barbeque Nation and w
 
 # Modify reservation template
 MODIFY_RESERVATION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer wants to modify an existing reservation at the {{ outlet }} outlet in {{ city }}.
 
 First, you need to identify their existing reservation. Ask for:
@@ -239,8 +262,6 @@ Once all new details are collected, confirm the modification and thank the custo
 
 # Cancel reservation template
 CANCEL_RESERVATION_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer wants to cancel an existing reservation at the {{ outlet }} outlet in {{ city }}.
 
 First, you need to identify their existing reservation. Ask for:
@@ -273,8 +294,6 @@ Ask: "To confirm, would you like me to cancel your reservation for {{ reservatio
 
 # Fallback template
 FALLBACK_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 You're having trouble understanding the customer's request. 
 
 Apologize and try to clarify what they need. Say something like:
@@ -291,8 +310,6 @@ Based on any information you've already collected, try to guide the conversation
 
 # Farewell template
 FAREWELL_TEMPLATE = """
-You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.
-
 The customer's request has been fulfilled, and the conversation is coming to an end.
 
 Thank them for contacting Barbeque Nation and offer a warm closing. Say something like:
@@ -318,4 +335,153 @@ TEMPLATES = {
     "cancel_reservation": CANCEL_RESERVATION_TEMPLATE,
     "fallback": FALLBACK_TEMPLATE,
     "farewell": FAREWELL_TEMPLATE
-} 
\ No newline at end of file
+}
+
+_environment: Optional[Environment] = None
+_compiled: Dict[str, Template] = {}
+_variables: Dict[str, Tuple[str, ...]] = {}
+_templates_lock = threading.Lock()
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    if TEMPLATE_CACHE_DIR == "off":
+        return None
+    try:
+        if TEMPLATE_CACHE_DIR:
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        # Empty means unset: the temp directory rather than the working directory
+        return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR or None)
+    except OSError:
+        return None
+
+def _compile_templates(bytecode_cache: Optional[FileSystemBytecodeCache]) -> Environment:
+    environment = Environment(
+        loader=DictLoader(TEMPLATES),
+        bytecode_cache=bytecode_cache,
+        # Drop the lines the {% if %} tags leave behind, which are only whitespace tokens
+        trim_blocks=True,
+        lstrip_blocks=True,
+        # The templates never change while running
+        auto_reload=False
+    )
+    _compiled.update({state_name: environment.get_template(state_name) for state_name in TEMPLATES})
+    return environment
+
+def get_template_environment() -> Environment:
+    """Return the shared Environment, compiling every template on first use."""
+    global _environment
+    with _templates_lock:
+        if _environment is None:
+            try:
+                _environment = _compile_templates(_bytecode_cache())
+            except OSError:
+                # The disk cache couldn't be read or written; compile in memory only
+                _environment = _compile_templates(None)
+        return _environment
+
+def get_template(state_name: str) -> Optional[Template]:
+    """Return the compiled template of a state, or None if the state has none."""
+    if _environment is None:
+        get_template_environment()
+    return _compiled.get(state_name)
+
+def render_template(state_name: str, context: Dict[str, Any]) -> str:
+    """Render the prompt of a state with a context dict; unknown states render as ""."""
+    template = get_template(state_name)
+    return template.render(context) if template is not None else ""
+
+def template_variables(state_name: str) -> Tuple[str, ...]:
+    """Return the names of the context values a state's template reads."""
+    if state_name not in _variables:
+        source = TEMPLATES.get(state_name, "")
+        _variables[state_name] = tuple(sorted(meta.find_undeclared_variables(get_template_environment().parse(source))))
+    return _variables[state_name]
+
+class RenderedPrompt(NamedTuple):
+    state: str
+    text: str
+    tokens: int
+    trimmed: bool
+
+_token_stats: Dict[str, Dict[str, int]] = {}
+_token_stats_lock = threading.Lock()
+
+def _render_with_global(state_name: str, context: Dict[str, Any], include_global: bool) -> str:
+    text = render_template(state_name, context).strip()
+    if include_global:
+        text = "\n\n".join(part for part in (GLOBAL_PROMPT.strip(), text) if part)
+    return text
+
+def _trim_context(state_name: str, context: Dict[str, Any], include_global: bool, budget: int,
+                  tokens: int) -> Tuple[str, int]:
+    """
+    Shorten the longest context value the template reads, and render again,
+    until the prompt fits the budget. Raises ValueError when it still doesn't
+    fit with every value emptied, as the instructions alone are over budget.
+    """
+    context = dict(context)
+    names = [name for name in template_variables(state_name) if context.get(name) is not None]
+    while tokens > budget:
+        lengths = {name: count_tokens(str(context[name])) for name in names}
+        longest = max(names, key=lengths.get, default=None)
+        if longest is None or lengths[longest] == 0:
+            raise ValueError(
+                f"Prompt for state {state_name!r} is {tokens} tokens without its context, over the budget of {budget}"
+            )
+        # Cut what's over budget from one value, but at most half of it at a time, as a value used
+        # several times in the template frees more. Too short to keep more than its "...", it's emptied
+        keep = max(lengths[longest] - (tokens - budget), lengths[longest] // 2)
+        context[longest] = truncate_to_token_limit(str(context[longest]), keep) if keep > 3 else ""
+        text = _render_with_global(state_name, context, include_global)
+        tokens = count_tokens(text)
+    return text, tokens
+
+def render_prompt(state_name: str, context: Dict[str, Any], include_global: bool = True,
+                  budget: int = PROMPT_TOKEN_BUDGET) -> RenderedPrompt:
+    """
+    Render the prompt of a state, after the global prompt unless include_global
+    is False, and count its tokens.
+
+    A prompt over the token budget has its longest context values trimmed
+    until it fits, and is logged, so one large context can't make every later
+    turn slower and dearer. The instructions are never trimmed: ValueError is
+    raised if they alone don't fit.
+    """
+    text = _render_with_global(state_name, context, include_global)
+    tokens = count_tokens(text)
+    trimmed = tokens > budget
+    if trimmed:
+        log.warning("prompt_context_trimmed", state=state_name, tokens=tokens, budget=budget)
+        text, tokens = _trim_context(state_name, context, include_global, budget, tokens)
+
+    with _token_stats_lock:
+        stats = _token_stats.setdefault(state_name, {"renders": 0, "tokens": 0, "max_tokens": 0, "trimmed": 0})
+        stats["renders"] += 1
+        stats["tokens"] += tokens
+        stats["max_tokens"] = max(stats["max_tokens"], tokens)
+        stats["trimmed"] += trimmed
+    return RenderedPrompt(state_name, text, tokens, trimmed)
+
+def prompt_token_stats() -> Dict[str, Any]:
+    """Return the budget, the global prompt's tokens and the renders and tokens of each state so far."""
+    with _token_stats_lock:
+        states = {
+            state_name: dict(stats, mean_tokens=stats["tokens"] / stats["renders"])
+            for state_name, stats in sorted(_token_stats.items())
+        }
+    return {
+        "budget": PROMPT_TOKEN_BUDGET,
+        "global_tokens": count_tokens(GLOBAL_PROMPT.strip()),
+        "states": states
+    }
+
+def prompt_token_report(context: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Return the tokens of every state's prompt rendered with one context, without the global prompt."""
+    return {
+        state_name: count_tokens(render_template(state_name, context or {}).strip())
+        for state_name in TEMPLATES
+    }
+
+def reset_prompt_token_stats() -> None:
+    """Forget the token counts of earlier renders."""
+    with _token_stats_lock:
+        _token_stats.clear()
@@ -5,6 +5,8 @@ This module defines the transitions between states in the conversation flow.
 Each transition has a source state, a destination state, and a condition.
 """
 
+from .engine import StateMachine
+
 transitions = [
     # Greeting transitions
     {
@@ -13,6 +15,12 @@ transitions = [
         "condition": "user_response and not context.get('city')",
         "description": "Initial greeting to collecting city"
     },
+    {
+        "source": "greeting",
+        "destination": "city_collection",
+        "condition": "context.get('city')",
+        "description": "City given with the greeting, city collection moves straight on"
+    },
     
     # City collection transitions
     {
@@ -157,36 +165,23 @@ transitions = [
 def get_transitions_from_state(state_name):
     return [t for t in transitions if t["source"] == state_name]
 
+_state_machine = None
+
+def get_state_machine():
+    """Return the transitions compiled into a state machine, compiling them on first use."""
+    global _state_machine
+    if _state_machine is None:
+        _state_machine = StateMachine(transitions)
+    return _state_machine
+
 # Function to get the next state based on current state and context
-def get_next_state(current_state, context, attempt_count=0):
-    # Get transitions from the current state
-    possible_transitions = get_transitions_from_state(current_state)
-    
-    # Evaluate each transition condition
-    for transition in possible_transitions:
-        # In a real implementation, we would evaluate the condition string
-        # For this simplified version, we'll directly check the context
-        condition = transition["condition"]
-        
-        # Simple condition evaluation logic (would be more sophisticated in production)
-        condition_met = False
-        
-        if "context.get('city')" in condition and context.get('city'):
-            condition_met = True
-        elif "context.get('outlet')" in condition and context.get('outlet'):
-            condition_met = True
-        elif "context.get('intent')" in condition and context.get('intent'):
-            condition_met = True
-        # Add more condition checks as needed
-        
-        if "attempt_count >" in condition:
-            # Extract the attempt count threshold
-            threshold = int(condition.split("attempt_count >")[1].split(" and")[0].strip())
-            if attempt_count > threshold:
-                condition_met = True
-        
-        if condition_met:
-            return transition["destination"]
+def get_next_state(current_state, context, attempt_count, user_response):
+    """
+    Return the state to move to from current_state, or current_state if no condition holds.
     
-    # If no transition condition is met, stay in the current state
-    return current_state 
\ No newline at end of file
+    Conditions are checked in the order they are listed, against the
+    conversation context, the number of attempts made in the current state
+    and the user's latest response. The response is required: the greeting
+    only moves on to city collection once the user has replied.
+    """
+    return get_state_machine().next_state(current_state, context, attempt_count, user_response)
@@ -4,5 +4,5 @@ Knowledge Base Package
 This package contains the knowledge base API for Barbeque Nation outlet and menu information.
 """
 
-from .api import app as kb_app
+from .api import app as kb_app, warm_up
 from .data import knowledge_base 
\ No newline at end of file
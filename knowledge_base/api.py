@@ -6,25 +6,43 @@ knowledge base data with token limiting.
 """
 
 from fastapi import FastAPI, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Hashable
 import os
-import re
+import copy
+import importlib
+import json
 from dotenv import load_dotenv
+from common.executor import run_blocking, executor_stats
+from common.logs import RequestIdMiddleware, get_logger, logging_stats
 
 # Load local modules
 from .data import knowledge_base
+from .matcher import PatternMatcher
+from .index import KnowledgeIndex, tokenize
+from .cache import ResponseCache
 from .utils import (
-    format_json_response, 
+    serialize_json_within_budget,
     count_tokens, 
     truncate_to_token_limit,
     format_menu_response,
-    format_outlet_response
+    format_outlet_response,
+    get_token_cache_stats,
+    knowledge_base_version,
+    dumps_json,
+    get_tokenizer,
+    load_once,
+    LOAD_TIMES
 )
 
 # Load environment variables
 load_dotenv()
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "800"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -32,6 +50,8 @@ app = FastAPI(
     description="API for retrieving information about Barbeque Nation outlets and menu",
     version="1.0.0"
 )
+app.add_middleware(RequestIdMiddleware)
+log = get_logger("knowledge_base.api")
 
 # Define request and response models
 class QueryRequest(BaseModel):
@@ -39,12 +59,17 @@ class QueryRequest(BaseModel):
     context: Optional[List[Dict[str, str]]] = []
     city: Optional[str] = None
     outlet: Optional[str] = None
+    mode: Optional[str] = None  # "retrieval" ranks fact passages with BM25
 
 class KBResponse(BaseModel):
     answer: str
     source: str
     token_count: int
 
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+    max_tokens: Optional[int] = None  # combined budget across the batch
+
 class ConversationRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
@@ -167,10 +192,155 @@ FALLBACK_RESPONSES = [
     "I'm not able to answer that specific question. May I tell you about our menu options, restaurant facilities, or special offers?"
 ]
 
+# Compiled once; reports which predefined pattern a message matches
+HARDCODED_MATCHER = PatternMatcher(HARDCODED_RESPONSES)
+
+# Inverted keyword index used to route /query questions to knowledge base nodes
+KB_INDEX = KnowledgeIndex(knowledge_base)
+MENU_KEYWORDS = {"menu", "food", "dish", "cuisine", "eat"}
+
+@load_once
+def get_fact_retriever():
+    """BM25 ranking over flattened fact passages, used by retrieval mode"""
+    # scikit-learn is slow to import, so it is only loaded once retrieval is used
+    try:
+        from .retrieval import FactRetriever, build_fact_passages
+    except ImportError:  # numpy / scikit-learn not installed
+        return None
+    return FactRetriever(build_fact_passages(knowledge_base))
+
+def build_static_responses() -> Dict[str, KBResponse]:
+    """
+    Serialize every deterministic knowledge base answer once, keyed by source.
+
+    This covers each menu category, the menu summary, every outlet and outlet
+    info type, the city summaries and the general help answer, so /query can
+    return them without touching the tokenizer.
+    """
+    responses = {}
+
+    def add(source: str, data: Dict[str, Any]):
+        answer, token_count = serialize_json_within_budget(data, MAX_TOKENS)
+        responses[source] = KBResponse(answer=answer, source=source, token_count=token_count)
+
+    menu_data = knowledge_base.get("menu", {})
+    for category in menu_data:
+        add(f"menu.{category}", format_menu_response(menu_data, category))
+    add("menu", format_menu_response(menu_data))
+
+    for city_key, outlets in knowledge_base.items():
+        if city_key == "menu":
+            continue
+        add(city_key, city_summary_data(city_key, city_key.title()))
+        for outlet_key, outlet_data in outlets.items():
+            add(f"{city_key}.{outlet_key}", format_outlet_response(outlet_data))
+            for info_type in outlet_data:
+                add(f"{city_key}.{outlet_key}.{info_type}", format_outlet_response(outlet_data, info_type))
+
+    add("general", {
+        "cities": list(knowledge_base.keys()),
+        "menu_categories": list(menu_data.keys()),
+        "help": "Try asking about specific cities, outlets, or menu items"
+    })
+    return responses
+
+# Cache of serialized response bodies, dropped whenever the KB data changes.
+# KB_VERSION is recomputed by reload_knowledge_base.
+KB_VERSION = knowledge_base_version(knowledge_base)
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, KB_VERSION)
+
+def json_response(body: bytes) -> Response:
+    """Send an already serialized JSON body as is"""
+    return Response(content=body, media_type="application/json")
+
+def data_body(static: KBResponse) -> bytes:
+    """
+    Build a {"data": ..., "token_count": ...} body around a precomputed answer.
+
+    The answer is already JSON, so it is spliced into the body as raw bytes
+    and the reported token count is the count of exactly those bytes.
+    """
+    return b'{"data":' + static.answer.encode("utf-8") + b',"token_count":' + str(static.token_count).encode() + b"}"
+
+async def cached_response(key: Hashable, build: Callable[[], Any]) -> Response:
+    """Serve a pre-serialized body from the response cache, building it on a miss"""
+    key = key + (MAX_TOKENS,)
+    version = KB_VERSION
+    body = RESPONSE_CACHE.get(key, version)
+    log.sample("kb_response", endpoint=key[0], cached=body is not None)
+    if body is None:
+        # Building means tokenizing and serializing, so keep it off the event loop
+        body = await run_blocking(build_body, key, build, version)
+    return json_response(body)
+
+def build_body(key: Hashable, build: Callable[[], Any], version: str) -> bytes:
+    """Build, serialize and cache a response body for a version of the KB data"""
+    result = build()
+    body = result if isinstance(result, bytes) else dumps_json(jsonable_encoder(result))
+    # Predefined answers are picked at random, so they are never cached
+    if not (isinstance(result, KBResponse) and result.source == "predefined_answers"):
+        RESPONSE_CACHE.set(key, body, version)
+    return body
+
+# Precomputed answers, built on first use since they need the tokenizer
+static_responses = load_once(build_static_responses)
+
+@load_once
+def canned_responses() -> Dict[str, KBResponse]:
+    """Token-counted predefined answers, keyed by answer text"""
+    return {
+        answer: KBResponse(answer=answer, source="predefined_answers", token_count=count_tokens(answer))
+        for answers in HARDCODED_RESPONSES.values()
+        for answer in answers
+    }
+
+def reload_knowledge_base(data: Optional[Dict[str, Any]] = None):
+    """
+    Replace the knowledge base data, or re-read it from the data module.
+
+    The shared dict is updated in place, so every module holding it sees the
+    new data. The index, precomputed answers and retriever are rebuilt, and
+    the new data version makes the response cache drop what it holds on its
+    next use.
+    """
+    global KB_VERSION, KB_INDEX
+    if data is None:
+        from . import data as data_module
+        data = importlib.reload(data_module).knowledge_base
+        # Keep the module pointing at the dict everyone else holds
+        data_module.knowledge_base = knowledge_base
+    data = copy.deepcopy(data)
+    knowledge_base.clear()
+    knowledge_base.update(data)
+
+    KB_INDEX = KnowledgeIndex(knowledge_base)
+    static_responses.reset()
+    get_fact_retriever.reset()
+    KB_VERSION = knowledge_base_version(knowledge_base)
+    log.info("knowledge_base_reloaded", version=KB_VERSION)
+
+def warm_up():
+    """Load the tokenizer, precomputed answers and retriever ahead of the first request"""
+    get_tokenizer()
+    static_responses()
+    canned_responses()
+    get_fact_retriever()
+
 @app.get("/")
 async def root():
     return {"message": "Barbeque Nation Knowledge Base API"}
 
+@app.get("/stats")
+async def get_stats():
+    """Return cache statistics for monitoring"""
+    return {
+        "token_cache": get_token_cache_stats(),
+        "response_cache": RESPONSE_CACHE.stats(),
+        "load_times": dict(LOAD_TIMES),
+        "executor": executor_stats(),
+        "logging": logging_stats()
+    }
+
 @app.get("/cities")
 async def get_cities():
     """Return all available cities"""
@@ -190,11 +360,14 @@ async def get_menu_items(category: Optional[str] = None):
     if "menu" not in knowledge_base:
         raise HTTPException(status_code=404, detail="Menu information not found")
     
-    response = format_menu_response(knowledge_base["menu"], category)
+    if category not in knowledge_base["menu"]:
+        category = None
+    
+    def build():
+        source = f"menu.{category}" if category else "menu"
+        return data_body(static_responses()[source])
     
-    # Ensure response is within token limit
-    response_str = format_json_response(response, MAX_TOKENS)
-    return {"data": response, "token_count": count_tokens(response_str)}
+    return await cached_response(("menu", category), build)
 
 @app.get("/outlet/{city}/{outlet}")
 async def get_outlet_info(
@@ -210,11 +383,14 @@ async def get_outlet_info(
         raise HTTPException(status_code=404, detail=f"Outlet '{outlet}' not found in {city}")
     
     outlet_data = knowledge_base[city][outlet]
-    response = format_outlet_response(outlet_data, info_type)
+    if info_type not in outlet_data:
+        info_type = None
     
-    # Ensure response is within token limit
-    response_str = format_json_response(response, MAX_TOKENS)
-    return {"data": response, "token_count": count_tokens(response_str)}
+    def build():
+        source = f"{city}.{outlet}.{info_type}" if info_type else f"{city}.{outlet}"
+        return data_body(static_responses()[source])
+    
+    return await cached_response(("outlet", city, outlet, info_type), build)
 
 @app.post("/query")
 async def query_knowledge_base(request: QueryRequest):
@@ -222,6 +398,58 @@ async def query_knowledge_base(request: QueryRequest):
     Query the knowledge base with natural language.
     This endpoint analyzes the query to determine what information to return.
     """
+    return await cached_response(("query",) + query_key(request), lambda: resolve_query(request))
+
+def query_key(request: QueryRequest) -> tuple:
+    """
+    Normalize a query for caching and batch deduplication.
+
+    The city is kept as sent, since city answers repeat it.
+    """
+    return (
+        request.query.lower().strip(),
+        request.city,
+        request.outlet.lower().replace(" ", "_") if request.outlet else None,
+        request.mode
+    )
+
+@app.post("/query/batch")
+async def query_knowledge_base_batch(request: BatchQueryRequest):
+    """
+    Resolve several queries in one round trip, returning results in order.
+    Identical queries are resolved once, retrieval-mode queries are ranked in
+    a single batch, and max_tokens caps the combined size of the answers.
+    """
+    return json_response(await run_blocking(resolve_batch, request))
+
+def resolve_batch(request: BatchQueryRequest) -> bytes:
+    """Resolve a batch of queries into a serialized response body"""
+    unique = {}
+    for item in request.queries:
+        unique.setdefault(query_key(item), item)
+    
+    retrieval_queries = [key[0] for key in unique if key[3] == "retrieval"]
+    retrieval_hits = {}
+    retriever = get_fact_retriever() if retrieval_queries else None
+    if retriever is not None:
+        retrieval_hits = dict(zip(retrieval_queries, retriever.search_many(retrieval_queries, RETRIEVAL_TOP_K)))
+    
+    resolved = {
+        key: resolve_query(item, retrieval_hits.get(key[0]))
+        for key, item in unique.items()
+    }
+    results = [resolved[query_key(item)] for item in request.queries]
+    
+    if request.max_tokens is not None:
+        results = apply_token_budget(results, request.max_tokens)
+    
+    return dumps_json({
+        "results": jsonable_encoder(results),
+        "token_count": sum(result.token_count for result in results)
+    })
+
+def resolve_query(request: QueryRequest, retrieval_hits: Optional[List] = None) -> KBResponse:
+    """Work out the answer to a single knowledge base query"""
     query = request.query.lower()
     city = request.city
     outlet = request.outlet
@@ -229,30 +457,17 @@ async def query_knowledge_base(request: QueryRequest):
     # Check for hardcoded responses first
     response = get_hardcoded_response(query)
     if response:
-        return KBResponse(
-            answer=response,
-            source="predefined_answers",
-            token_count=count_tokens(response)
-        )
+        return canned_responses()[response]
     
-    response_data = {}
-    source = "knowledge_base"
+    if request.mode == "retrieval":
+        return retrieval_response(query, retrieval_hits)
     
-    # Check for menu-related queries
-    if any(keyword in query for keyword in ["menu", "food", "dish", "cuisine", "eat"]):
-        menu_data = knowledge_base["menu"]
-        
-        # Refine menu query if specific categories mentioned
-        for category in menu_data.keys():
-            normalized_category = category.replace("_", " ")
-            if normalized_category in query:
-                response_data = format_menu_response(menu_data, category)
-                source = f"menu.{category}"
-                break
-        else:
-            # No specific category mentioned
-            response_data = format_menu_response(menu_data)
-            source = "menu"
+    tokens = tokenize(query)
+    
+    # Check for menu-related queries, refined to the categories mentioned
+    if MENU_KEYWORDS.intersection(tokens):
+        category_tokens = [token for token in tokens if token not in MENU_KEYWORDS]
+        return index_response(KB_INDEX.search(category_tokens, scope="menu"), default="menu")
     
     # Check for outlet-specific queries
     elif city and outlet:
@@ -260,52 +475,90 @@ async def query_knowledge_base(request: QueryRequest):
         outlet_key = outlet.lower().replace(" ", "_")
         
         if city_key in knowledge_base and outlet_key in knowledge_base[city_key]:
-            outlet_data = knowledge_base[city_key][outlet_key]
-            
-            # Check for specific information
-            for info_type in ["hours", "facilities", "parking", "address", "special_features"]:
-                if info_type.replace("_", " ") in query:
-                    response_data = format_outlet_response(outlet_data, info_type)
-                    source = f"{city_key}.{outlet_key}.{info_type}"
-                    break
-            else:
-                # No specific information mentioned
-                response_data = format_outlet_response(outlet_data)
-                source = f"{city_key}.{outlet_key}"
+            # Check for specific information, or summarize the outlet
+            outlet_source = f"{city_key}.{outlet_key}"
+            return index_response(KB_INDEX.search(tokens, scope=outlet_source), default=outlet_source)
         else:
-            response_data = {"error": "Could not find information about this outlet"}
-            source = "error"
+            return error_response({"error": "Could not find information about this outlet"})
     
     # General city-level query
     elif city:
         city_key = city.lower()
         if city_key in knowledge_base:
-            response_data = {
-                "outlets": list(knowledge_base[city_key].keys()),
-                "summary": f"There are {len(knowledge_base[city_key])} Barbeque Nation outlets in {city}"
-            }
-            source = f"{city_key}"
+            sources = KB_INDEX.search(tokens, scope=city_key)
+            if not sources or sources == [city_key]:
+                return city_summary(city_key, city)
+            return index_response(sources, default=city_key)
         else:
-            response_data = {"error": f"Could not find information about {city}"}
-            source = "error"
-    
-    # Fallback for unrecognized queries
-    else:
-        response_data = {
-            "cities": list(knowledge_base.keys()),
-            "menu_categories": list(knowledge_base["menu"].keys()) if "menu" in knowledge_base else [],
-            "help": "Try asking about specific cities, outlets, or menu items"
-        }
-        source = "general"
-    
-    # Convert to string and ensure token limit
-    response_str = format_json_response(response_data, MAX_TOKENS)
+            return error_response({"error": f"Could not find information about {city}"})
     
-    return KBResponse(
-        answer=response_str,
-        source=source,
-        token_count=count_tokens(response_str)
-    )
+    # Anything else is looked up across the whole knowledge base
+    return index_response(KB_INDEX.search(tokens), default="general")
+
+def city_summary_data(city_key: str, city: str) -> Dict[str, Any]:
+    """The outlets of a city, summarized with the city name as given"""
+    return {
+        "outlets": list(knowledge_base[city_key].keys()),
+        "summary": f"There are {len(knowledge_base[city_key])} Barbeque Nation outlets in {city}"
+    }
+
+def city_summary(city_key: str, city: str) -> KBResponse:
+    """Answer a city-level query, naming the city the way the caller did"""
+    response_str, token_count = serialize_json_within_budget(city_summary_data(city_key, city), MAX_TOKENS)
+    return KBResponse(answer=response_str, source=city_key, token_count=token_count)
+
+def index_response(sources: List[str], default: str) -> KBResponse:
+    """Answer with the knowledge base nodes a query resolved to"""
+    if not sources:
+        return static_responses()[default]
+    if len(sources) == 1 and sources[0] in static_responses():
+        return static_responses()[sources[0]]
+    
+    # Several nodes matched equally well, e.g. "which outlets have valet parking"
+    response_data = {"results": {source: KB_INDEX.values[source] for source in sources}}
+    response_str, token_count = serialize_json_within_budget(response_data, MAX_TOKENS)
+    return KBResponse(answer=response_str, source="search", token_count=token_count)
+
+def retrieval_response(query: str, hits: Optional[List] = None) -> KBResponse:
+    """Answer with the top ranked fact passages, packed to the token limit"""
+    retriever = get_fact_retriever()
+    if retriever is None:
+        raise HTTPException(status_code=501, detail="Retrieval mode requires numpy and scikit-learn")
+    
+    if hits is None:
+        hits = retriever.search(query, RETRIEVAL_TOP_K)
+    if not hits:
+        return static_responses()["general"]
+    
+    response_data = {"passages": [{"source": source, "fact": fact} for source, fact, _ in hits]}
+    response_str, token_count = serialize_json_within_budget(response_data, MAX_TOKENS)
+    return KBResponse(answer=response_str, source="retrieval", token_count=token_count)
+
+def apply_token_budget(results: List[KBResponse], max_tokens: int) -> List[KBResponse]:
+    """Shrink answers, in order, so that together they fit in max_tokens"""
+    remaining = max_tokens
+    budgeted = []
+    for result in results:
+        if result.token_count > remaining:
+            answer, token_count = "", 0
+            if result.source == "predefined_answers":
+                # Leave room for the "..." truncate_to_token_limit appends
+                if remaining > 3:
+                    answer = truncate_to_token_limit(result.answer, remaining)
+                    token_count = count_tokens(answer)
+            elif remaining > 0:
+                answer, token_count = serialize_json_within_budget(json.loads(result.answer), remaining)
+            if token_count > remaining:
+                answer, token_count = "", 0
+            result = KBResponse(answer=answer, source=result.source, token_count=token_count)
+        remaining -= result.token_count
+        budgeted.append(result)
+    return budgeted
+
+def error_response(response_data: Dict[str, Any]) -> KBResponse:
+    """Serialize an error answer for /query"""
+    response_str, token_count = serialize_json_within_budget(response_data, MAX_TOKENS)
+    return KBResponse(answer=response_str, source="error", token_count=token_count)
 
 @app.post("/conversation")
 async def handle_conversation(request: ConversationRequest):
@@ -316,17 +569,14 @@ async def handle_conversation(request: ConversationRequest):
     query = request.message.lower()
     
     # Check for hardcoded responses first
-    for pattern, responses in HARDCODED_RESPONSES.items():
-        if re.search(pattern, query):
-            # Select a random response from the available options for variety
-            import random
-            response = random.choice(responses) if isinstance(responses, list) else responses
-            return {
-                "response": response,
-                "conversation_id": request.conversation_id or f"conv_{hash(request.message) % 10000}",
-                "source": "predefined_answers",
-                "finished": True
-            }
+    response = get_hardcoded_response(query)
+    if response:
+        return {
+            "response": response,
+            "conversation_id": request.conversation_id or f"conv_{hash(request.message) % 10000}",
+            "source": "predefined_answers",
+            "finished": True
+        }
     
     # Check for beverage query specifically
     if any(word in query for word in ["beverage", "drink", "mocktail", "juice", "soda", "coffee", "tea"]):
@@ -365,10 +615,11 @@ def get_hardcoded_response(query: str) -> Optional[str]:
     """Check if the query matches any predefined response patterns"""
     query = query.lower().strip()
     
-    for pattern, responses in HARDCODED_RESPONSES.items():
-        if re.search(pattern, query):
-            # If we have multiple responses, choose one randomly
-            import random
-            return random.choice(responses) if isinstance(responses, list) else responses
+    pattern = HARDCODED_MATCHER.search(query)
+    if pattern:
+        # If we have multiple responses, choose one randomly
+        import random
+        responses = HARDCODED_RESPONSES[pattern]
+        return random.choice(responses) if isinstance(responses, list) else responses
     
     return None 
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Response Cache
+
+This module contains a small thread-safe LRU cache with per-entry expiry,
+used to keep pre-serialized knowledge base responses between requests.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class ResponseCache:
+    """
+    LRU cache with a time-to-live and a knowledge base version.
+
+    Entries expire ``ttl`` seconds after they are stored, the least recently
+    used entry is evicted once ``max_size`` is reached, and the whole cache is
+    dropped as soon as it is accessed with a different data version.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0, version: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version: Optional[str]):
+        if version is not None and version != self.version:
+            self._entries.clear()
+            self.version = version
+            self.invalidations += 1
+
+    def get(self, key: Hashable, version: Optional[str] = None) -> Any:
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, version: Optional[str] = None):
+        """Store a value, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "version": self.version
+            }
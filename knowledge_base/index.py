@@ -0,0 +1,144 @@
+"""
+Knowledge Base Index
+
+This module builds an inverted keyword index over the knowledge base so that
+a free-text question can be resolved to knowledge base nodes with a single
+tokenization pass and a few dictionary lookups.
+
+Nodes are identified by dotted paths that match the ``source`` values used by
+the API, e.g. ``bangalore``, ``bangalore.indiranagar``,
+``bangalore.indiranagar.parking``, ``menu`` and ``menu.veg_starters``.
+"""
+
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Words that carry no routing information
+STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "at", "barbeque", "be", "can",
+    "do", "does", "for", "has", "have", "i", "in", "is", "it", "me", "my",
+    "nation", "of", "on", "or", "outlet", "outlets", "please", "restaurant",
+    "restaurants", "tell", "that", "the", "there", "this", "to", "we", "what",
+    "where", "which", "with", "you", "your"
+}
+
+def normalize_token(token: str) -> str:
+    """Strip common English plural endings from a lower-case word."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if len(token) > 2 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized tokens, dropping stopwords."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        word = match.group().lower()
+        if word not in STOPWORDS:
+            tokens.append(normalize_token(word))
+    return tokens
+
+def _leaf_text(value: Any) -> Iterable[str]:
+    """Yield every key and string found in a nested value."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key)
+            yield from _leaf_text(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _leaf_text(item)
+    elif value is not None:
+        yield str(value)
+
+class KnowledgeIndex:
+    """
+    Inverted index from tokens to knowledge base nodes.
+
+    Each node is indexed under the tokens of its own path (city, outlet,
+    field or menu category names) plus every word in its content, and
+    inherits the path tokens of its ancestors. Scores are IDF-weighted, so a
+    rare word such as "valet" outranks a common one such as "parking".
+    """
+
+    def __init__(self, knowledge_base: Dict[str, Any]):
+        self.values: Dict[str, Any] = {}
+        self.order: Dict[str, int] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.name_tokens: Dict[str, Set[str]] = {}
+
+        for top_key, top_value in knowledge_base.items():
+            if top_key == "menu":
+                self._add_node("menu", top_value, [], content=False)
+                for category, items in top_value.items():
+                    self._add_node(f"menu.{category}", items, ["menu"])
+                continue
+
+            self._add_node(top_key, top_value, [], content=False)
+            for outlet_key, outlet_data in top_value.items():
+                outlet_path = f"{top_key}.{outlet_key}"
+                self._add_node(outlet_path, outlet_data, [top_key], content=False)
+                for field, value in outlet_data.items():
+                    self._add_node(f"{outlet_path}.{field}", value, [top_key, outlet_key])
+
+        node_count = len(self.values)
+        self.idf = {
+            token: math.log(1 + node_count / len(nodes))
+            for token, nodes in self.postings.items()
+        }
+
+    def _add_node(self, path: str, value: Any, ancestors: List[str], content: bool = True):
+        self.values[path] = value
+        self.order[path] = len(self.order)
+
+        self.name_tokens[path] = set(tokenize(path.rsplit(".", 1)[-1]))
+        tokens = set(self.name_tokens[path])
+        for name in ancestors:
+            tokens.update(tokenize(name))
+        if content:
+            for text in _leaf_text(value):
+                tokens.update(tokenize(text))
+
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(path)
+
+    def search(self, tokens: Iterable[str], scope: Optional[str] = None) -> List[str]:
+        """
+        Return the best-scoring nodes for the query tokens.
+
+        Only nodes equal to or below ``scope`` are considered. Ties go to the
+        nodes whose own name is fully mentioned ("veg starters" picks
+        ``menu.veg_starters`` over ``menu.non_veg_starters``), and when a node
+        and some of its descendants tie, only the node is returned. Results
+        come back in knowledge base order; an empty list means no token matched.
+        """
+        tokens = set(tokens)
+        scores: Dict[str, float] = {}
+        for token in tokens:
+            for path in self.postings.get(token, ()):
+                if scope and path != scope and not path.startswith(scope + "."):
+                    continue
+                scores[path] = scores.get(path, 0.0) + self.idf[token]
+
+        if not scores:
+            return []
+
+        top = max(scores.values())
+        best = [path for path, score in scores.items() if math.isclose(score, top)]
+        unmatched = {path: len(self.name_tokens[path] - tokens) for path in best}
+        fewest = min(unmatched.values())
+        best = {path for path in best if unmatched[path] == fewest}
+        results = [
+            path for path in best
+            if not any(ancestor in best for ancestor in _ancestors(path))
+        ]
+        return sorted(results, key=self.order.__getitem__)
+
+def _ancestors(path: str) -> List[str]:
+    parts = path.split(".")
+    return [".".join(parts[:i]) for i in range(1, len(parts))]
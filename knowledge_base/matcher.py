@@ -0,0 +1,124 @@
+"""
+Pattern Matcher
+
+This module contains a keyword-prefiltered dispatcher for the predefined
+question patterns, so a message is only tested against the few patterns
+that can possibly match it instead of every pattern in turn.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+WORD_RE = re.compile(r"\w+")
+
+def _literal_runs(pattern: str) -> List[str]:
+    """
+    Return the runs of literal text that every match of the pattern contains.
+
+    Only top-level literals are considered; groups, branches, repeats and
+    classes end the current run. Patterns with flags that change how literals
+    compare (such as IGNORECASE) yield no runs.
+    """
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return []
+
+    runs = []
+    current = []
+    for op, arg in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(arg))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return runs
+
+def _anchor_for(pattern: str) -> Optional[tuple]:
+    """
+    Pick the keyword a message must contain for the pattern to match.
+
+    Returns ``(kind, keyword)`` where kind is "word" when the keyword is a
+    whole word, "prefix" when it starts a word and "suffix" when it ends one,
+    or None when the pattern has no usable literal.
+    """
+    best = None
+    for run in _literal_runs(pattern):
+        for match in WORD_RE.finditer(run):
+            left_closed = match.start() > 0
+            right_closed = match.end() < len(run)
+            if left_closed and right_closed:
+                kind = "word"
+            elif left_closed:
+                kind = "prefix"
+            elif right_closed:
+                kind = "suffix"
+            else:
+                continue
+            # Longer keywords are more selective; whole words get a small edge
+            score = len(match.group()) + (2 if kind == "word" else 0)
+            if best is None or score > best[0]:
+                best = (score, kind, match.group())
+    return best[1:] if best else None
+
+class PatternMatcher:
+    """
+    Match text against an ordered collection of regex patterns.
+
+    Each pattern is compiled once and indexed under a keyword that any
+    matching text must contain as a whole word, word prefix or word suffix.
+    A lookup tokenizes the text once, collects the candidate patterns with a
+    few dict lookups per word and only runs those regexes, in the original
+    pattern order. The first matching pattern wins, exactly as with a plain
+    loop of ``re.search`` calls.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        self.compiled = [re.compile(pattern) for pattern in self.patterns]
+        self.words: Dict[str, List[int]] = {}
+        self.prefixes: Dict[str, List[int]] = {}
+        self.suffixes: Dict[str, List[int]] = {}
+        self.unanchored: List[int] = []
+
+        tables = {"word": self.words, "prefix": self.prefixes, "suffix": self.suffixes}
+        for index, pattern in enumerate(self.patterns):
+            anchor = _anchor_for(pattern)
+            if anchor is None:
+                self.unanchored.append(index)
+            else:
+                kind, keyword = anchor
+                tables[kind].setdefault(keyword, []).append(index)
+
+        self.prefix_lengths = sorted({len(keyword) for keyword in self.prefixes})
+        self.suffix_lengths = sorted({len(keyword) for keyword in self.suffixes})
+
+    def candidates(self, text: str) -> List[int]:
+        """Return the indexes of the patterns that could match the text, in order."""
+        found: Set[int] = set(self.unanchored)
+        for word in set(WORD_RE.findall(text)):
+            found.update(self.words.get(word, ()))
+            for length in self.prefix_lengths:
+                if length > len(word):
+                    break
+                found.update(self.prefixes.get(word[:length], ()))
+            for length in self.suffix_lengths:
+                if length > len(word):
+                    break
+                found.update(self.suffixes.get(word[-length:], ()))
+        return sorted(found)
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first pattern that matches the text, or None."""
+        for index in self.candidates(text):
+            if self.compiled[index].search(text):
+                return self.patterns[index]
+        return None
@@ -0,0 +1,108 @@
+"""
+Knowledge Base Retrieval
+
+This module flattens the knowledge base into short fact passages and ranks
+them against free-text questions with BM25. Term weights are precomputed into
+a sparse matrix, so scoring any number of queries is a single sparse matrix
+product.
+
+Requires numpy and scikit-learn (see requirements.txt).
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from .index import tokenize
+
+def _label(key: str) -> str:
+    return key.replace("_", " ")
+
+def _fact_text(value: Any) -> str:
+    """Render a knowledge base value as a single line of text."""
+    if isinstance(value, dict):
+        return "; ".join(f"{_label(key)}: {_fact_text(item)}" for key, item in value.items())
+    if isinstance(value, list):
+        return ", ".join(_fact_text(item) for item in value)
+    return str(value)
+
+def build_fact_passages(knowledge_base: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Flatten the knowledge base into ``(source, passage)`` pairs.
+
+    Outlets yield one passage per field, list-valued menu categories one
+    passage per item and dict-valued categories one passage per entry.
+    """
+    passages = []
+    for top_key, top_value in knowledge_base.items():
+        if top_key == "menu":
+            for category, items in top_value.items():
+                source = f"menu.{category}"
+                if isinstance(items, dict):
+                    for key, item in items.items():
+                        passages.append((source, f"Menu {_label(category)} {_label(key)}: {_fact_text(item)}"))
+                else:
+                    for item in items:
+                        passages.append((source, f"Menu {_label(category)}: {_fact_text(item)}"))
+            continue
+
+        for outlet_key, outlet_data in top_value.items():
+            name = f"{_label(outlet_key).title()}, {top_key.title()}"
+            for field, value in outlet_data.items():
+                passages.append((f"{top_key}.{outlet_key}.{field}", f"{name} {_label(field)}: {_fact_text(value)}"))
+    return passages
+
+class FactRetriever:
+    """
+    BM25 ranking over fact passages.
+
+    The BM25 weight of every (term, passage) pair is computed once at build
+    time and stored in a CSR matrix of shape (terms, passages). A batch of
+    queries is vectorized into a binary (queries, terms) matrix and scored
+    with one sparse product.
+    """
+
+    def __init__(self, passages: Sequence[Tuple[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.sources = [source for source, _ in passages]
+        self.texts = [text for _, text in passages]
+
+        self.vectorizer = CountVectorizer(analyzer=tokenize)
+        counts = self.vectorizer.fit_transform(self.texts).tocsr().astype(np.float64)
+
+        doc_count = counts.shape[0]
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if doc_count else 1.0
+        doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log1p((doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        tf = counts.data
+        row_len = np.repeat(doc_len, np.diff(counts.indptr))
+        counts.data = idf[counts.indices] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * row_len / avg_len))
+        self.weights = counts.T.tocsr()
+
+    def search_many(self, queries: Sequence[str], top_k: int = 5) -> List[List[Tuple[str, str, float]]]:
+        """Return the top ``(source, passage, score)`` hits for each query."""
+        if not queries:
+            return []
+        query_matrix = self.vectorizer.transform(queries)
+        query_matrix.data[:] = 1.0
+        scores = (query_matrix @ self.weights).toarray()
+
+        top_k = min(top_k, scores.shape[1])
+        if top_k <= 0:
+            return [[] for _ in queries]
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+
+        results = []
+        for row, indexes in zip(scores, candidates):
+            ranked = indexes[np.argsort(-row[indexes], kind="stable")]
+            results.append([
+                (self.sources[i], self.texts[i], float(row[i]))
+                for i in ranked if row[i] > 0
+            ])
+        return results
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, str, float]]:
+        """Return the top ``(source, passage, score)`` hits for a query."""
+        return self.search_many([query], top_k)[0]
@@ -8,21 +8,105 @@ the 800 token limit.
 
 import os
 import json
-import tiktoken
-from typing import Dict, List, Any, Union, Optional
+import hashlib
+import threading
+import time
+from functools import lru_cache, wraps
+from typing import Dict, List, Any, Union, Optional, Tuple, Callable, TypeVar
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "800"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+# Compact mode drops the indentation whitespace from JSON answers
+COMPACT_JSON = os.getenv("COMPACT_JSON", "false").lower() == "true"
+JSON_INDENT = None if COMPACT_JSON else 2
+
+T = TypeVar("T")
+
+# Seconds spent in each lazy loader, for cold-start reporting
+LOAD_TIMES: Dict[str, float] = {}
+
+def load_once(build: Callable[[], T]) -> Callable[[], T]:
+    """
+    Turn a zero-argument builder into a thread-safe lazy loader.
+
+    The builder runs on the first call only and its result is returned on
+    every later call. How long it took is recorded in LOAD_TIMES. Calling
+    ``reset()`` on the loader makes the next call build again.
+    """
+    lock = threading.Lock()
+    loaded = []
+
+    @wraps(build)
+    def load() -> T:
+        if not loaded:
+            with lock:
+                if not loaded:
+                    start = time.perf_counter()
+                    loaded.append(build())
+                    LOAD_TIMES[build.__name__] = time.perf_counter() - start
+        return loaded[0]
 
-# Initialize tokenizer
-tokenizer = tiktoken.get_encoding("cl100k_base")
+    def reset():
+        with lock:
+            loaded.clear()
+
+    load.reset = reset
+    return load
+
+@load_once
+def get_tokenizer():
+    """Return the cl100k_base tokenizer, loading it on first use."""
+    # Loading the BPE ranks can mean a download, so it is kept off the import path
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _cached_token_count(text: str) -> int:
+    return len(get_tokenizer().encode(text))
 
 def count_tokens(text: str) -> int:
-    """Count the number of tokens in a text string."""
-    return len(tokenizer.encode(text))
+    """
+    Count the number of tokens in a text string.
+
+    Counts are memoized in a bounded LRU keyed by the string itself, since the
+    same canned answers and JSON fragments are counted on every request.
+    """
+    return _cached_token_count(text)
+
+def get_token_cache_stats() -> Dict[str, int]:
+    """Return hit/miss counters and occupancy of the token count cache."""
+    info = _cached_token_count.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize
+    }
+
+def clear_token_cache() -> None:
+    """Empty the token count cache and reset its counters."""
+    _cached_token_count.cache_clear()
+
+def knowledge_base_version(data: Any) -> str:
+    """Return a short content hash identifying a version of the knowledge base data."""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
+def dumps_json(data: Any) -> bytes:
+    """Serialize data to compact UTF-8 JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 def truncate_to_token_limit(text: str, max_tokens: int = MAX_TOKENS) -> str:
     """Truncate a text to fit within the token limit."""
+    tokenizer = get_tokenizer()
     tokens = tokenizer.encode(text)
     if len(tokens) <= max_tokens:
         return text
@@ -32,78 +116,163 @@ def truncate_to_token_limit(text: str, max_tokens: int = MAX_TOKENS) -> str:
 
 def format_json_response(data: Any, max_tokens: int = MAX_TOKENS) -> str:
     """Format JSON data as a string, ensuring it's under the token limit."""
-    json_str = json.dumps(data, ensure_ascii=False, indent=2)
-    if count_tokens(json_str) <= max_tokens:
-        return json_str
-    
-    # For complex objects, we need a smarter truncation strategy
-    if isinstance(data, dict):
-        return truncate_dict(data, max_tokens)
-    elif isinstance(data, list):
-        return truncate_list(data, max_tokens)
-    else:
-        return truncate_to_token_limit(json_str, max_tokens)
-
-def truncate_dict(data: Dict, max_tokens: int = MAX_TOKENS) -> str:
-    """Truncate a dictionary to fit within the token limit."""
-    result = {}
-    remaining_tokens = max_tokens
-    
-    # First pass: add keys until we hit the limit
-    for key, value in data.items():
-        value_str = json.dumps(value, ensure_ascii=False)
-        key_and_value = f'"{key}": {value_str}'
-        tokens_needed = count_tokens(key_and_value)
-        
-        if tokens_needed < remaining_tokens:
-            result[key] = value
-            remaining_tokens -= tokens_needed
-        else:
-            # If it's a complex value, try to truncate it
-            if isinstance(value, dict) or isinstance(value, list):
-                # For nested structures, we recursively truncate
-                if isinstance(value, dict):
-                    truncated_value = json.loads(truncate_dict(value, remaining_tokens - count_tokens(f'"{key}": ')))
-                else:
-                    truncated_value = json.loads(truncate_list(value, remaining_tokens - count_tokens(f'"{key}": ')))
-                result[key] = truncated_value
-                break
-            else:
-                # For simple values, we just skip if too large
-                continue
-    
-    # Convert back to JSON string
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    json_str, _ = serialize_json_within_budget(data, max_tokens)
+    return json_str
 
-def truncate_list(data: List, max_tokens: int = MAX_TOKENS) -> str:
-    """Truncate a list to fit within the token limit."""
-    result = []
-    remaining_tokens = max_tokens
-    
-    # Add items until we hit the limit
-    for item in data:
-        item_str = json.dumps(item, ensure_ascii=False)
-        tokens_needed = count_tokens(item_str) + 2  # +2 for comma and space
-        
-        if tokens_needed < remaining_tokens:
-            result.append(item)
-            remaining_tokens -= tokens_needed
-        else:
-            # For complex items, try to truncate
-            if isinstance(item, dict) or isinstance(item, list):
-                if isinstance(item, dict):
-                    truncated_item = json.loads(truncate_dict(item, remaining_tokens - 2))
+def serialize_json_within_budget(data: Any, max_tokens: int = MAX_TOKENS, indent: Optional[int] = JSON_INDENT) -> Tuple[str, int]:
+    """
+    Serialize data to JSON in a single pass while tracking a running token budget.
+
+    The output is written fragment by fragment (one fragment per line when
+    indenting), each fragment is tokenized exactly once and the running total
+    is checked against the budget before the fragment is committed. Room for
+    the brackets that close the open containers is always kept in reserve, so
+    the result is valid JSON. Payloads that fit are identical to
+    ``json.dumps(data, ensure_ascii=False, indent=indent)``, or to
+    ``dumps_json(data)`` when indent is None. A budget too small for even the
+    outer brackets gives an empty ``{}`` or ``[]``.
+
+    When indenting, every fragment ends with a newline, where the tokenizer
+    splits anyway, so the running total is the exact token count of the
+    result. Compact fragments run into each other (a "," merges with the
+    quote after it), so in compact mode the finished string is tokenized a
+    second time for its exact count, and written again with a smaller budget
+    in the rare case the count is over.
+
+    Returns the JSON string and its token count.
+    """
+    if not isinstance(data, (dict, list)):
+        json_str = json.dumps(data, ensure_ascii=False, indent=indent) if indent is not None else dumps_json(data).decode("utf-8")
+        json_str = truncate_to_token_limit(json_str, max_tokens)
+        return json_str, count_tokens(json_str)
+
+    budget = max_tokens
+    while True:
+        writer = _BudgetedJSONWriter(budget, indent)
+        writer.write_container(data, 0, "", "")
+        if not writer.parts:
+            json_str = "{}" if isinstance(data, dict) else "[]"
+            return json_str, count_tokens(json_str)
+        json_str = "".join(writer.parts)
+        if indent is not None:
+            return json_str, writer.used
+        token_count = count_tokens(json_str)
+        if token_count <= max_tokens or budget <= 0:
+            return json_str, token_count
+        budget -= token_count - max_tokens
+
+def _json_key(key: Any) -> str:
+    """Serialize a dictionary key the way json.dumps does."""
+    if not isinstance(key, str):
+        key = json.dumps(key)
+    return json.dumps(key, ensure_ascii=False)
+
+class _BudgetedJSONWriter:
+    """Incremental JSON writer used by serialize_json_within_budget."""
+
+    def __init__(self, max_tokens: int, indent: Optional[int]):
+        self.max_tokens = max_tokens
+        self.indent = indent
+        # Each fragment carries what follows it up to the next line: the
+        # separator, or the line end after the last item of a container.
+        self.separator = ",\n" if indent is not None else ","
+        self.end = "\n" if indent is not None else ""
+        self.key_separator = ": " if indent is not None else ":"
+        self.parts: List[str] = []
+        self.costs: List[int] = []
+        self.used = 0
+        self.reserved = 0
+
+    def _pad(self, level: int) -> str:
+        return " " * (self.indent * level) if self.indent is not None else ""
+
+    def _take(self, fragment: str, reserve: int = 0) -> bool:
+        """Commit a fragment if it fits in the budget left after the reserve."""
+        cost = count_tokens(fragment)
+        if self.used + cost + self.reserved + reserve > self.max_tokens:
+            return False
+        self.parts.append(fragment)
+        self.costs.append(cost)
+        self.used += cost
+        return True
+
+    def _drop(self, index: int) -> None:
+        """Take back the fragments from index on."""
+        self.used -= sum(self.costs[index:])
+        del self.parts[index:]
+        del self.costs[index:]
+
+    def _end_last_item(self) -> None:
+        """Swap the separator of the last fragment for a line end, when the items stopped early."""
+        fragment = self.parts[-1][:-len(self.separator)] + self.end
+        cost = count_tokens(fragment)
+        self.used += cost - self.costs[-1]
+        self.parts[-1] = fragment
+        self.costs[-1] = cost
+
+    def write_container(self, value: Union[Dict, List], level: int, head: str, tail: str) -> bool:
+        """
+        Write a dict or list preceded by ``head`` (indentation and key) and
+        followed by ``tail``.
+
+        Returns False when the budget ran out, in which case the caller stops
+        writing its own remaining items as well.
+        """
+        is_dict = isinstance(value, dict)
+        opener, closer = ("{", "}") if is_dict else ("[", "]")
+        if not value:
+            return self._take(head + opener + closer + tail)
+
+        closer = self._pad(level) + closer + tail
+        closer_cost = count_tokens(closer)
+        if not self._take(head + opener + ("\n" if self.indent is not None else ""), closer_cost):
+            return False
+        self.reserved += closer_cost
+
+        pad = self._pad(level + 1)
+        items = list(value.items()) if is_dict else [(None, item) for item in value]
+        starts: List[int] = []
+        last_tail = None
+        complete = True
+        for position, (key, item) in enumerate(items):
+            prefix = pad
+            if is_dict:
+                prefix += _json_key(key) + self.key_separator
+            item_tail = self.end if position == len(items) - 1 else self.separator
+            start = len(self.parts)
+
+            if isinstance(item, (dict, list)):
+                written = self.write_container(item, level + 1, prefix, item_tail)
+                if len(self.parts) > start:
+                    starts.append(start)
+                    last_tail = item_tail
+                if not written:
+                    complete = False
+                    break
+            elif self._take(prefix + json.dumps(item, ensure_ascii=False) + item_tail):
+                starts.append(start)
+                last_tail = item_tail
+            elif not is_dict:
+                # Indicate truncation, giving up the items before if that's what it takes
+                complete = False
+                last_tail = None
+                while not self._take(prefix + '"..."' + self.end):
+                    if not starts:
+                        break
+                    self._drop(starts.pop())
                 else:
-                    truncated_item = json.loads(truncate_list(item, remaining_tokens - 2))
-                result.append(truncated_item)
-                break
-            else:
-                # Indicate truncation
-                result.append("...")
+                    last_tail = self.end
                 break
-    
-    # Convert back to JSON string
-    return json.dumps(result, ensure_ascii=False, indent=2)
+            # Skip simple dict values that are too large
+
+        if starts and last_tail == self.separator:
+            self._end_last_item()
+
+        self.reserved -= closer_cost
+        self.parts.append(closer)
+        self.costs.append(closer_cost)
+        self.used += closer_cost
+        return complete
 
 def format_menu_response(menu_data: Dict, category: Optional[str] = None) -> Dict:
     """Format menu data for API response with token limiting."""
@@ -119,7 +288,7 @@ def format_menu_response(menu_data: Dict, category: Optional[str] = None) -> Dic
     return {
         "categories": list(menu_data.keys()),
         "sample_items": {
-            cat: items[:2] + (["..."] if len(items) > 2 else []) 
+            cat: list(items)[:2] + (["..."] if len(items) > 2 else []) 
             for cat, items in menu_data.items()
         }
     }
@@ -7,18 +7,22 @@ This script runs the combined FastAPI server that includes:
 """
 
 import os
+import threading
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 # Import APIs
-from knowledge_base import kb_app
+from knowledge_base import kb_app, warm_up as warm_up_knowledge_base
+from common.executor import get_cpu_executor, shutdown_executor
 from webhook.api import app as webhook_app
+from webhook.google_sheets import warm_up as warm_up_google_sheets, get_sheets_writer, stop_sheets_writer
 
 # Load environment variables
 load_dotenv()
 PORT = int(os.getenv("PORT", "8000"))
+WARM_UP = os.getenv("WARM_UP", "true").lower() == "true"
 
 # Create FastAPI app
 app = FastAPI(
@@ -40,6 +44,32 @@ app.add_middleware(
 app.mount("/kb", kb_app)
 app.mount("/webhook", webhook_app)
 
+def warm_up():
+    """Preload the tokenizer, precomputed answers, client libraries and worker processes"""
+    warm_up_knowledge_base()
+    warm_up_google_sheets()
+    get_cpu_executor().start("webhook.streaming")
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Run in the background so /health answers while heavy modules load
+    if WARM_UP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("startup")
+async def start_sheets_writer():
+    # Resume flushing rows queued before the last restart
+    get_sheets_writer()
+
+@app.on_event("shutdown")
+async def flush_sheets_writer():
+    stop_sheets_writer()
+
+@app.on_event("shutdown")
+async def stop_executor():
+    # Let in-flight blocking calls finish
+    shutdown_executor()
+
 @app.get("/")
 async def root():
     return {
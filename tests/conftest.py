@@ -0,0 +1,11 @@
+"""
+Shared test setup: makes the repository root importable, so the tests run
+with a plain ``pytest`` from the repository root.
+"""
+
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
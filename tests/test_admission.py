@@ -0,0 +1,126 @@
+"""
+Tests for webhook admission control: budget limits, rejection and timeout
+of queued events, and the 429/503 responses with Retry-After.
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webhook import api
+from webhook.admission import AdmissionBudget, Overloaded
+
+async def hold(budget, release):
+    async with budget.admit():
+        await release.wait()
+
+def test_admits_up_to_max_in_flight():
+    async def run():
+        budget = AdmissionBudget("test", max_in_flight=2, max_queued=1, queue_timeout=5)
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(budget, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert budget.in_flight == 2
+
+        # The third waits in the queue until a slot frees up
+        waiting = asyncio.create_task(hold(budget, release))
+        await asyncio.sleep(0)
+        assert budget.queued == 1
+        release.set()
+        await asyncio.gather(*holders, waiting)
+        return budget.stats()
+
+    stats = asyncio.run(run())
+    assert stats["admitted"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == 0
+    assert stats["rejected"] == 0
+
+def test_full_queue_is_rejected():
+    async def run():
+        budget = AdmissionBudget("test", max_in_flight=1, max_queued=1, queue_timeout=5, retry_after=7)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(budget, release))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold(budget, release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            async with budget.admit():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiting)
+        return budget, error.value
+
+    budget, error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.retry_after == 7
+    assert budget.rejected == 1
+    assert budget.admitted == 2
+
+def test_queue_timeout():
+    async def run():
+        budget = AdmissionBudget("test", max_in_flight=1, max_queued=1, queue_timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(budget, release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            async with budget.admit():
+                pass
+        release.set()
+        await holder
+        return budget, error.value
+
+    budget, error = asyncio.run(run())
+    assert error.status_code == 503
+    assert budget.timed_out == 1
+    assert budget.queued == 0
+    assert budget.in_flight == 0
+
+def test_slot_is_released_on_error():
+    async def run():
+        budget = AdmissionBudget("test", max_in_flight=1, max_queued=0)
+        with pytest.raises(RuntimeError):
+            async with budget.admit():
+                raise RuntimeError("handler failed")
+        async with budget.admit():
+            pass
+        return budget
+
+    budget = asyncio.run(run())
+    assert budget.admitted == 2
+    assert budget.in_flight == 0
+
+@pytest.fixture
+def client():
+    with TestClient(api.app) as client:
+        yield client
+
+def call_ended(client):
+    return client.post("/webhook", json={"event_type": "call_ended", "payload": {"call_id": "call-1", "turns": []}})
+
+def test_webhook_rejects_when_queue_is_full(client, monkeypatch):
+    monkeypatch.setattr(api, "EXPENSIVE_BUDGET", AdmissionBudget("expensive", 0, 0, retry_after=9))
+    response = call_ended(client)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "9"
+
+    response = client.post("/chatbot-log", json={"conversation_id": "chat-1", "transcript": "hi"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "9"
+
+def test_webhook_times_out_in_queue(client, monkeypatch):
+    monkeypatch.setattr(api, "EXPENSIVE_BUDGET", AdmissionBudget("expensive", 0, 1, queue_timeout=0.01, retry_after=3))
+    response = call_ended(client)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+def test_cheap_events_skip_the_expensive_budget(client, monkeypatch):
+    monkeypatch.setattr(api, "EXPENSIVE_BUDGET", AdmissionBudget("expensive", 0, 0))
+    response = client.post("/webhook", json={"event_type": "call_started", "payload": {"call_id": "call-1"}})
+    assert response.status_code == 200
+    assert response.json()["message"] == "Call started event received"
+
+    # Without event_type first the body can't be peeked, so it counts as expensive
+    response = client.post("/webhook", json={"payload": {"call_id": "call-1"}, "event_type": "call_started"})
+    assert response.status_code == 429
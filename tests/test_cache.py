@@ -0,0 +1,87 @@
+"""Tests for the response cache in knowledge_base.cache and its use by the KB API."""
+
+import copy
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from knowledge_base import api
+from knowledge_base.cache import ResponseCache
+from knowledge_base.data import knowledge_base
+
+def test_get_and_set():
+    cache = ResponseCache(max_size=4, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", b"1")
+    assert cache.get("a") == b"1"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_size=2, ttl=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert cache.evictions == 1
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("knowledge_base.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(max_size=4, ttl=10)
+    cache.set("a", b"1")
+    now[0] += 9
+    assert cache.get("a") == b"1"
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+def test_new_version_drops_everything():
+    cache = ResponseCache(max_size=4, ttl=60, version="v1")
+    cache.set("a", b"1", "v1")
+    assert cache.get("a", "v1") == b"1"
+    assert cache.get("a", "v2") is None
+    assert cache.invalidations == 1
+    assert cache.stats()["version"] == "v2"
+
+def test_zero_size_cache_stores_nothing():
+    cache = ResponseCache(max_size=0)
+    cache.set("a", b"1")
+    assert cache.get("a") is None
+
+@pytest.fixture
+def client():
+    yield TestClient(api.app)
+    # Back to the data in knowledge_base/data.py
+    api.reload_knowledge_base()
+
+def test_changed_knowledge_base_is_a_cache_miss(client):
+    def parking():
+        return client.get("/outlet/delhi/vasant_kunj", params={"info_type": "parking"}).json()["data"]["details"]
+
+    original = parking()
+    hits = api.RESPONSE_CACHE.hits
+    assert parking() == original
+    assert api.RESPONSE_CACHE.hits == hits + 1
+
+    data = copy.deepcopy(knowledge_base)
+    data["delhi"]["vasant_kunj"]["parking"] = "No parking"
+    old_version = api.KB_VERSION
+    api.reload_knowledge_base(data)
+    assert api.KB_VERSION != old_version
+
+    misses = api.RESPONSE_CACHE.misses
+    assert parking() == "No parking"
+    assert api.RESPONSE_CACHE.misses == misses + 1
+
+def test_reload_rereads_the_data_module(client):
+    api.reload_knowledge_base({"menu": {}, "delhi": {}})
+    assert client.get("/cities").json() == {"cities": ["menu", "delhi"]}
+    api.reload_knowledge_base()
+    from knowledge_base import data
+    assert data.knowledge_base is knowledge_base
+    assert "bangalore" in client.get("/cities").json()["cities"]
+    query = client.post("/query", json={"query": "parking", "city": "bangalore", "outlet": "indiranagar"}).json()
+    assert json.loads(query["answer"])["details"] == knowledge_base["bangalore"]["indiranagar"]["parking"]
@@ -0,0 +1,163 @@
+"""
+Tests for webhook.call_store: merging call records, paged queries and the
+/calls endpoints that serve them.
+"""
+
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webhook import api, call_store
+from webhook.call_store import CallStore, resolve_date
+
+def record(call_id, **fields):
+    return dict({
+        "call_id": call_id,
+        "modality": "Call",
+        "call_time": "2025-05-13 18:30:00",
+        "phone_number": "+919800000000",
+        "outcome": "Enquiry",
+        "booking_date": "NA",
+        "booking_time": "NA",
+        "customer_name": "NA",
+        "party_size": "NA",
+        "outlet": None,
+        "summary": "NA",
+        "transcript": "hello"
+    }, **fields)
+
+@pytest.fixture
+def store(tmp_path):
+    return CallStore(str(tmp_path / "calls.db"))
+
+def test_store_creates_missing_directory(tmp_path):
+    path = tmp_path / "data" / "calls.db"
+    CallStore(str(path)).add(record("call-1"))
+    assert path.exists()
+
+def test_default_paths_are_in_data_dir():
+    assert call_store.CALL_STORE_PATH.startswith(call_store.DATA_DIR)
+
+def test_merge_fills_in_missing_fields(store):
+    assert store.merge(record("call-1", transcript="hi"))
+    assert not store.merge(record(
+        "call-1",
+        call_time="2025-05-13 19:00:00",
+        modality="Chatbot",
+        outcome="Availability",
+        booking_date="2025-05-15",
+        customer_name="Priya",
+        summary="",
+        transcript=""
+    ))
+    stored = store.get("call-1")
+    assert stored["outcome"] == "Availability"
+    assert stored["booking_date"] == "2025-05-15"
+    assert stored["customer_name"] == "Priya"
+    # Empty and "NA" fields keep what was stored
+    assert stored["summary"] == "NA"
+    assert stored["transcript"] == "hi"
+    # Call time and modality never change
+    assert stored["call_time"] == "2025-05-13 18:30:00"
+    assert stored["modality"] == "Call"
+    assert store.count() == 1
+
+def test_merge_is_rolled_back_when_then_fails(store):
+    def fail(stored, is_new):
+        raise RuntimeError("queue down")
+    with pytest.raises(RuntimeError):
+        store.merge(record("call-1"), "call_ended", fail)
+    assert store.get("call-1") is None
+    assert not store.has_event("call-1", "call_ended")
+
+    seen = []
+    assert store.merge(record("call-1"), "call_ended", lambda stored, is_new: seen.append(is_new))
+    assert not store.merge(record("call-1", outcome="Enquiry"), "call_analyzed", lambda stored, is_new: seen.append(stored))
+    assert seen[0] is True
+    assert seen[1]["outcome"] == "Enquiry"
+    with pytest.raises(RuntimeError):
+        store.merge(record("call-1", outcome="Misc."), "chatbot_log", fail)
+    assert store.get("call-1")["outcome"] == "Enquiry"
+    assert not store.has_event("call-1", "chatbot_log")
+
+def test_merge_without_call_id_adds_rows(store):
+    assert store.merge(record(None))
+    assert store.merge(record(None))
+    assert store.count() == 2
+
+def test_query_pages_newest_first(store):
+    for i in range(7):
+        store.add(record(f"call-{i}"))
+    seen = []
+    cursor = None
+    while True:
+        calls, cursor = store.query(limit=3, cursor=cursor)
+        seen.extend(call["call_id"] for call in calls)
+        assert len(calls) <= 3
+        if cursor is None:
+            break
+    assert seen == [f"call-{i}" for i in reversed(range(7))]
+
+def test_query_exact_page_has_no_next_cursor(store):
+    for i in range(3):
+        store.add(record(f"call-{i}"))
+    calls, cursor = store.query(limit=3)
+    assert len(calls) == 3
+    assert cursor is None
+
+def test_query_filters(store):
+    store.add(record("a", outcome="Availability", booking_date="2025-05-17", outlet="indiranagar"))
+    store.add(record("b", outcome="Availability", booking_date="2025-05-17", outlet="jp_nagar"))
+    store.add(record("c", outcome="Enquiry", phone_number="+911111111111", call_time="2025-05-14 10:00:00"))
+
+    calls, _ = store.query(outcome="Availability", outlet="JP Nagar")
+    assert [call["call_id"] for call in calls] == ["b"]
+    calls, _ = store.query(booking_date_from="2025-05-16", booking_date_to="2025-05-18")
+    assert [call["call_id"] for call in calls] == ["b", "a"]
+    calls, _ = store.query(phone_number="+911111111111")
+    assert [call["call_id"] for call in calls] == ["c"]
+    calls, _ = store.query(since="2025-05-14 00:00:00")
+    assert [call["call_id"] for call in calls] == ["c"]
+    assert "transcript" not in calls[0]
+    calls, _ = store.query(since="2025-05-14 00:00:00", include_transcript=True)
+    assert calls[0]["transcript"] == "hello"
+
+def test_resolve_date():
+    tuesday = date(2025, 5, 13)
+    assert resolve_date("today", tuesday) == "2025-05-13"
+    assert resolve_date("Tomorrow", tuesday) == "2025-05-14"
+    assert resolve_date("saturday", tuesday) == "2025-05-17"
+    assert resolve_date("tuesday", tuesday) == "2025-05-13"
+    assert resolve_date("2025-06-01", tuesday) == "2025-06-01"
+    assert resolve_date(None, tuesday) is None
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(call_store, "_call_store", store)
+    with TestClient(api.app) as client:
+        yield client
+
+def test_calls_endpoint_pages(client, store):
+    for i in range(5):
+        store.add(record(f"call-{i}", outcome="Availability" if i % 2 else "Enquiry"))
+
+    body = client.get("/calls", params={"limit": 2}).json()
+    assert [call["call_id"] for call in body["calls"]] == ["call-4", "call-3"]
+    body = client.get("/calls", params={"limit": 2, "cursor": body["next_cursor"]}).json()
+    assert [call["call_id"] for call in body["calls"]] == ["call-2", "call-1"]
+    body = client.get("/calls", params={"limit": 2, "cursor": body["next_cursor"]}).json()
+    assert [call["call_id"] for call in body["calls"]] == ["call-0"]
+    assert body["next_cursor"] is None
+
+    body = client.get("/calls", params={"outcome": "Availability"}).json()
+    assert [call["call_id"] for call in body["calls"]] == ["call-3", "call-1"]
+
+def test_calls_endpoint_validates_limit(client):
+    assert client.get("/calls", params={"limit": 0}).status_code == 422
+    assert client.get("/calls", params={"limit": 501}).status_code == 422
+
+def test_call_endpoint(client, store):
+    store.add(record("call-1", customer_name="Priya"))
+    assert client.get("/calls/call-1").json()["customer_name"] == "Priya"
+    assert client.get("/calls/missing").status_code == 404
@@ -0,0 +1,164 @@
+"""
+Tests for conversation_flow.expressions, checked against eval() for the
+Python dialect, and for the local transitions and the Retell edges picking
+the same next state in the same conversation.
+"""
+
+import itertools
+
+import pytest
+
+from conversation_flow.expressions import compile_expression, parse_expression
+from conversation_flow.retell_integration import EDGES, get_retell_state_machine
+from conversation_flow.transitions import get_state_machine
+
+PYTHON_CONDITIONS = [
+    "context.get('city')",
+    "not context.get('city')",
+    "user_response and not context.get('city')",
+    "attempt_count > 2 and not context.get('intent')",
+    "context.get('intent') == 'inquiry'",
+    "context.get('restart') == True",
+    "context.get('end_conversation') == True or attempt_count > 2",
+    "context.get('party_size', 0) >= 4",
+    "1 < attempt_count <= 3",
+    "'book' in user_response.lower()",
+    "'Book' in user_response",
+    "'book' not in user_response.lower()",
+    "context.get('flag') is True",
+    "context.get('flag') is not None",
+    "context.get('flag') is None or attempt_count == 0",
+    "context.get('a') or context.get('b') or context.get('c')",
+    "context.get('a') and context.get('b') and not context.get('c')",
+]
+
+CONTEXTS = [
+    {},
+    {"city": "delhi", "intent": "inquiry", "party_size": 6},
+    {"city": "mumbai", "restart": True, "flag": True, "a": "x"},
+    {"city": "", "end_conversation": 1, "flag": 1, "b": "y", "c": 0},
+    {"intent": "new_reservation", "party_size": 2, "flag": False, "a": 1, "b": 1},
+]
+
+@pytest.mark.parametrize("condition", PYTHON_CONDITIONS)
+def test_python_dialect_matches_eval(condition):
+    predicate = compile_expression(condition)
+    for context, attempts, response in itertools.product(CONTEXTS, range(5), ["", "I want to Book", "hello"]):
+        variables = {"context": context, "attempt_count": attempts, "user_response": response}
+        expected = bool(eval(condition, {"__builtins__": {}}, variables))
+        assert predicate(context, attempts, response) == expected, (context, attempts, response)
+
+def test_is_means_identity():
+    # 1 == True, but 1 is not True
+    assert compile_expression("context.get('flag') == True")({"flag": 1}, 0, None)
+    assert not compile_expression("context.get('flag') is True")({"flag": 1}, 0, None)
+    assert compile_expression("context.get('flag') is not True")({"flag": 1}, 0, None)
+    assert compile_expression("context.get('flag') is None")({}, 0, None)
+    assert not compile_expression("context.get('flag') is False")({"flag": 0}, 0, None)
+
+@pytest.mark.parametrize("condition,dialect", [
+    ("context.get('city') in user_response", "python"),
+    ("'delhi' in context.get('city')", "python"),
+    ("context.get('names') in context.get('lookup')", "python"),
+    ("context.get('party_size') > 4", "python"),
+    ("context.get('party_size') > attempt_count", "python"),
+    ("user_response.lower() < 'm'", "python"),
+    ("transcript.includes(city)", "js"),
+    ("transcript.toLowerCase().includes(city.toLowerCase())", "js"),
+    ("city.includes('delhi')", "js"),
+    ("party_size >= 4 && transcript.includes('book')", "js"),
+])
+def test_missing_or_mismatched_values_never_raise(condition, dialect):
+    predicate = compile_expression(condition, dialect)
+    for context in ({}, {"city": None, "party_size": None}, {"city": 5, "party_size": "six", "names": ["x"],
+                                                              "lookup": {"x": 1}}):
+        for response in (None, "", "Book in Delhi", 7):
+            assert predicate(context, 3, response) in (True, False)
+
+def test_contains():
+    assert compile_expression("transcript.includes(city)", "js")({"city": "delhi"}, 0, "new delhi")
+    assert not compile_expression("transcript.includes(city)", "js")({}, 0, "new delhi")
+    assert not compile_expression("context.get('city') in user_response")({}, 0, "delhi")
+    assert compile_expression("context.get('city') in user_response")({"city": "delhi"}, 0, "new delhi")
+    assert compile_expression("'x' in context.get('slots')")({"slots": {"x": 1}}, 0, None)
+
+@pytest.mark.parametrize("condition,dialect", [
+    ("context['city']", "python"),
+    ("len(user_response) > 3", "python"),
+    ("context.get(city)", "python"),
+    ("attempt_count + 1 > 2", "python"),
+    ("lambda: True", "python"),
+    ("user_response.startswith('a')", "python"),
+    ("city = 'delhi'", "js"),
+    ("transcript.startsWith('a')", "js"),
+    ("city != null &&", "js"),
+    ("city == 'delhi' ;", "js"),
+])
+def test_unsupported_syntax_is_rejected(condition, dialect):
+    with pytest.raises(ValueError):
+        parse_expression(condition, dialect)
+
+def test_js_dialect():
+    assert compile_expression("city != null && transcript.toLowerCase().includes('delhi')", "js")(
+        {"city": "delhi"}, 0, "New DELHI please"
+    )
+    assert compile_expression("confirmation === 'yes'", "js")({"confirmation": "yes"}, 0, "")
+    assert compile_expression("!(outlet != null)", "js")({}, 0, "")
+    assert compile_expression("attempt_count > 1.5 || false", "js")({}, 2, "")
+
+# The same conversations, as the user's words and the context a speech model
+# would extract from them. The local flow reads the context and the Retell
+# flow mostly reads the words, so both should agree at every step.
+CONVERSATIONS = {
+    "inquiry": [
+        ("Hello", {}),
+        ("Bangalore please", {"city": "bangalore"}),
+        ("The indiranagar one", {"outlet": "indiranagar"}),
+        ("I'd like some information about the outlet", {"intent": "inquiry"}),
+        ("What are the timings?", {}),
+        ("Is there parking available?", {}),
+        ("Thanks, that's all", {"inquiry_complete": True}),
+    ],
+    "new_reservation": [
+        ("Hi there", {}),
+        ("Delhi", {"city": "delhi"}),
+        ("Connaught place", {"outlet": "connaught_place"}),
+        ("I want to book a table", {"intent": "new_reservation"}),
+        ("Tomorrow at 8 pm", {"date": "tomorrow", "time": "8 pm"}),
+        ("For 4 people", {"party_size": 4}),
+        ("My name is Asha", {"customer_name": "Asha"}),
+        ("My number is 9812345678", {"phone_number": "9812345678"}),
+        ("Yes, that's correct", {"reservation_confirmed": True}),
+    ],
+    "modify_reservation": [
+        ("Hello", {}),
+        ("Bangalore", {"city": "bangalore"}),
+        ("JP Nagar", {"outlet": "jp_nagar"}),
+        ("I need to change my booking", {"intent": "modify_reservation"}),
+        ("Move it to saturday please", {"date": "saturday"}),
+        ("Thanks, goodbye", {"modification_complete": True}),
+    ],
+    "cancel_reservation": [
+        ("Hello", {}),
+        ("Delhi", {"city": "delhi"}),
+        ("Connaught place", {"outlet": "connaught_place"}),
+        ("Please cancel my reservation", {"intent": "cancel_reservation"}),
+        ("Yes, cancel it", {"confirmation": "yes", "cancellation_complete": True}),
+    ],
+}
+
+@pytest.mark.parametrize("name", CONVERSATIONS)
+def test_local_and_retell_flows_agree(name):
+    local, retell = get_state_machine(), get_retell_state_machine()
+    state, context, attempts = "greeting", {}, 0
+    for text, slots in CONVERSATIONS[name]:
+        context.update(slots)
+        next_state = local.next_state(state, context, attempts, text)
+        assert retell.next_state(state, context, attempts, text) == next_state, (state, text)
+        attempts = attempts + 1 if next_state == state else 0
+        state = next_state
+    assert state == "farewell"
+
+def test_retell_edges_cover_local_states():
+    local_states = {state for state in get_state_machine().states() if state != "fallback"}
+    assert local_states <= {edge["source"] for edge in EDGES} | {"farewell"}
@@ -0,0 +1,139 @@
+"""Tests for the shared worksheet handle in webhook.google_sheets."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from webhook.google_sheets import WorksheetHandle, needs_reconnect
+
+class APIError(Exception):
+    def __init__(self, status_code=None):
+        super().__init__(f"status {status_code}")
+        self.response = SimpleNamespace(status_code=status_code) if status_code else None
+
+class FakeWorksheet:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.rows = []
+
+    def append_rows(self, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.rows.extend(rows)
+
+    def append_row(self, row):
+        self.append_rows([row])
+
+class FakeConnect:
+    """Opens a new FakeWorksheet per connection, failing each with the given errors."""
+
+    def __init__(self, *errors_per_connection):
+        self.errors = list(errors_per_connection)
+        self.worksheets = []
+
+    def __call__(self):
+        worksheet = FakeWorksheet(self.errors.pop(0) if self.errors else ())
+        self.worksheets.append(worksheet)
+        return SimpleNamespace(expired=False), worksheet
+
+def test_connects_lazily_once():
+    connect = FakeConnect()
+    handle = WorksheetHandle(connect)
+    assert connect.worksheets == []
+    handle.append_row(["a"])
+    handle.append_rows([["b"], ["c"]])
+    assert len(connect.worksheets) == 1
+    assert connect.worksheets[0].rows == [["a"], ["b"], ["c"]]
+    assert handle.stats()["connects"] == 1
+
+def test_connects_once_across_threads():
+    connect = FakeConnect()
+    handle = WorksheetHandle(connect)
+    threads = [threading.Thread(target=handle.append_row, args=([i],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connect.worksheets) == 1
+    assert len(connect.worksheets[0].rows) == 8
+
+def refused():
+    return requests.exceptions.ConnectionError(
+        MaxRetryError(None, "/v4/spreadsheets", NewConnectionError(None, "Connection refused"))
+    )
+
+@pytest.mark.parametrize("error", [
+    APIError(401), APIError(403), APIError(404), ConnectionRefusedError(), refused(),
+    requests.exceptions.ConnectTimeout()
+])
+def test_reconnects_and_retries_once(error):
+    connect = FakeConnect([error])
+    handle = WorksheetHandle(connect)
+    handle.append_row(["a"])
+    assert len(connect.worksheets) == 2
+    assert connect.worksheets[1].rows == [["a"]]
+    stats = handle.stats()
+    assert (stats["connects"], stats["reconnects"], stats["errors"]) == (2, 1, 1)
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_quota_and_server_errors_are_raised_without_reconnecting(status):
+    connect = FakeConnect([APIError(status)])
+    handle = WorksheetHandle(connect)
+    with pytest.raises(APIError):
+        handle.append_row(["a"])
+    assert len(connect.worksheets) == 1
+    assert handle.stats()["reconnects"] == 0
+
+class AppliedWorksheet(FakeWorksheet):
+    """Applies the append, then fails as if the response never arrived."""
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        raise self.errors.pop(0)
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ReadTimeout(), requests.exceptions.ConnectionError("Connection reset by peer"),
+    ConnectionResetError(), TimeoutError(), RuntimeError("unexpected")
+])
+def test_errors_after_sending_are_not_retried(error):
+    """The append may have been applied, so it isn't sent again on a fresh connection."""
+    worksheets = []
+
+    def connect():
+        worksheets.append(AppliedWorksheet([error]))
+        return SimpleNamespace(expired=False), worksheets[-1]
+
+    handle = WorksheetHandle(connect)
+    with pytest.raises(type(error)):
+        handle.append_rows([["a"], ["b"]])
+    assert len(worksheets) == 1
+    assert worksheets[0].rows == [["a"], ["b"]]
+    assert handle.stats()["reconnects"] == 0
+
+def test_second_failure_is_raised():
+    connect = FakeConnect([APIError(401)], [APIError(401)])
+    handle = WorksheetHandle(connect)
+    with pytest.raises(APIError):
+        handle.append_row(["a"])
+    assert handle.stats()["reconnects"] == 1
+
+def test_expired_token_is_refreshed():
+    refreshed = []
+    credentials = SimpleNamespace(expired=True, refresh=lambda request: refreshed.append(request))
+    handle = WorksheetHandle(lambda: (credentials, FakeWorksheet()))
+    handle.get()
+    pytest.importorskip("google.auth.transport.requests")
+    handle.get()
+    assert len(refreshed) == 1
+    assert handle.stats()["token_refreshes"] == 1
+
+def test_needs_reconnect():
+    assert needs_reconnect(ConnectionRefusedError())
+    assert needs_reconnect(refused())
+    assert needs_reconnect(APIError(401))
+    assert not needs_reconnect(APIError(429))
+    assert not needs_reconnect(ConnectionError())
+    assert not needs_reconnect(requests.exceptions.ReadTimeout())
@@ -0,0 +1,43 @@
+"""Tests for the inverted keyword index in knowledge_base.index."""
+
+import pytest
+
+from knowledge_base.data import knowledge_base
+from knowledge_base.index import KnowledgeIndex, normalize_token, tokenize
+
+@pytest.fixture(scope="module")
+def index():
+    return KnowledgeIndex(knowledge_base)
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("What are the Dessert options at the outlet?") == ["dessert", "option"]
+    assert normalize_token("facilities") == "facility"
+    assert normalize_token("glass") == "glass"
+
+def test_nodes_use_api_source_paths(index):
+    assert {"menu", "menu.desserts", "bangalore", "bangalore.indiranagar", "bangalore.indiranagar.parking"} <= set(index.values)
+    assert index.values["bangalore.indiranagar.parking"] == knowledge_base["bangalore"]["indiranagar"]["parking"]
+
+@pytest.mark.parametrize("question, scope, expected", [
+    ("desserts", "menu", ["menu.desserts"]),
+    ("veg starters", "menu", ["menu.veg_starters"]),
+    ("non veg starters", "menu", ["menu.non_veg_starters"]),
+    ("parking", "bangalore.indiranagar", ["bangalore.indiranagar.parking"]),
+    ("what are the hours", "delhi.connaught_place", ["delhi.connaught_place.hours"]),
+    ("indiranagar", "bangalore", ["bangalore.indiranagar"]),
+])
+def test_search_resolves_questions(index, question, scope, expected):
+    assert index.search(tokenize(question), scope=scope) == expected
+
+def test_search_stays_in_scope(index):
+    results = index.search(tokenize("valet parking"), scope="delhi")
+    assert results
+    assert all(path.startswith("delhi.") for path in results)
+
+def test_search_without_matches(index):
+    assert index.search(tokenize("zzz qqq")) == []
+    assert index.search([]) == []
+
+def test_results_come_back_in_knowledge_base_order(index):
+    results = index.search(tokenize("valet parking"))
+    assert results == sorted(results, key=list(index.values).index)
@@ -0,0 +1,132 @@
+"""Tests for the knowledge base API in knowledge_base.api."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from knowledge_base import api
+from knowledge_base.data import knowledge_base
+from knowledge_base.utils import count_tokens, format_json_response, format_menu_response, format_outlet_response
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+def query(client, text, **fields):
+    response = client.post("/query", json=dict(query=text, **fields))
+    assert response.status_code == 200
+    return response.json()
+
+def test_static_responses_cover_every_node():
+    responses = api.static_responses()
+    menu = knowledge_base["menu"]
+    assert "menu" in responses and "general" in responses
+    assert all(f"menu.{category}" in responses for category in menu)
+    for city, outlets in knowledge_base.items():
+        if city == "menu":
+            continue
+        assert city in responses
+        for outlet, outlet_data in outlets.items():
+            assert f"{city}.{outlet}" in responses
+            assert all(f"{city}.{outlet}.{info_type}" in responses for info_type in outlet_data)
+
+def test_static_responses_match_fresh_serialization():
+    responses = api.static_responses()
+    menu = knowledge_base["menu"]
+    outlet_data = knowledge_base["delhi"]["vasant_kunj"]
+    for source, data in (
+        ("menu", format_menu_response(menu)),
+        ("menu.desserts", format_menu_response(menu, "desserts")),
+        ("delhi.vasant_kunj", format_outlet_response(outlet_data)),
+        ("delhi.vasant_kunj.parking", format_outlet_response(outlet_data, "parking")),
+    ):
+        answer = format_json_response(data, api.MAX_TOKENS)
+        assert responses[source].answer == answer
+        assert responses[source].source == source
+        assert responses[source].token_count == count_tokens(answer)
+
+def test_endpoints_serve_precomputed_answers(client):
+    static = api.static_responses()
+    body = client.get("/menu", params={"category": "desserts"}).json()
+    assert body == {"data": json.loads(static["menu.desserts"].answer), "token_count": static["menu.desserts"].token_count}
+
+    body = client.get("/outlet/bangalore/indiranagar", params={"info_type": "hours"}).json()
+    assert body["data"] == json.loads(static["bangalore.indiranagar.hours"].answer)
+
+    result = query(client, "Show me the dessert menu")
+    assert result == static["menu.desserts"].model_dump()
+
+def test_predefined_answers_are_token_counted(client):
+    result = query(client, "Can I get Jain food?")
+    assert result["source"] == "predefined_answers"
+    assert result["answer"] in api.HARDCODED_RESPONSES[r"(?:can i get )?jain food"]
+    assert result["token_count"] == count_tokens(result["answer"])
+
+@pytest.mark.parametrize("city", ["Bangalore", "bangalore", "BANGALORE"])
+def test_city_summary_names_the_city_as_sent(client, city):
+    result = query(client, "which outlets do you have", city=city)
+    assert result["source"] == "bangalore"
+    assert json.loads(result["answer"])["summary"].endswith(f"outlets in {city}")
+
+def batch(client, queries, **fields):
+    response = client.post("/query/batch", json=dict(queries=queries, **fields))
+    assert response.status_code == 200
+    return response.json()
+
+def test_batch_returns_results_in_order(client):
+    queries = [
+        {"query": "what are the hours", "city": "bangalore", "outlet": "indiranagar"},
+        {"query": "Show me the dessert menu"},
+        {"query": "is there parking", "city": "delhi", "outlet": "Connaught Place"},
+    ]
+    body = batch(client, queries)
+    assert [result["source"] for result in body["results"]] == [
+        "bangalore.indiranagar.hours", "menu.desserts", "delhi.connaught_place.parking"
+    ]
+    for item, result in zip(queries, body["results"]):
+        fields = {key: value for key, value in item.items() if key != "query"}
+        assert result == query(client, item["query"], **fields)
+    assert body["token_count"] == sum(result["token_count"] for result in body["results"])
+
+def test_batch_resolves_equivalent_queries_once(client, monkeypatch):
+    calls = []
+    resolve_query = api.resolve_query
+    monkeypatch.setattr(api, "resolve_query", lambda item, hits=None: calls.append(item) or resolve_query(item, hits))
+    body = batch(client, [
+        {"query": "Is there parking?", "city": "delhi", "outlet": "Connaught Place"},
+        {"query": "  is there parking?", "city": "delhi", "outlet": "connaught_place"},
+        {"query": "which outlets", "city": "Delhi"},
+        {"query": "which outlets", "city": "delhi"},
+    ])
+    # Outlet spellings and query case are normalized as /query does; cities
+    # are kept as sent because the answer repeats them
+    assert len(calls) == 3
+    results = body["results"]
+    assert results[0] == results[1]
+    assert json.loads(results[2]["answer"])["summary"].endswith("in Delhi")
+    assert json.loads(results[3]["answer"])["summary"].endswith("in delhi")
+
+def test_batch_token_budget(client):
+    queries = [{"query": "Show me the dessert menu"}, {"query": "what are the hours", "city": "bangalore", "outlet": "indiranagar"}]
+    full = batch(client, queries)
+    budget = full["results"][0]["token_count"] + 5
+    body = batch(client, queries, max_tokens=budget)
+    assert body["results"][0] == full["results"][0]
+    assert body["token_count"] <= budget
+    second = body["results"][1]
+    assert second["token_count"] <= 5
+    assert second["answer"] == "" or json.loads(second["answer"]) is not None
+
+def test_data_body_splices_the_answer_bytes():
+    static = api.static_responses()["bangalore.koramangala.facilities"]
+    body = api.data_body(static)
+    assert body.startswith(b'{"data":' + static.answer.encode("utf-8"))
+    assert json.loads(body) == {"data": json.loads(static.answer), "token_count": static.token_count}
+    # The reported count is the count of exactly the answer that is sent
+    assert static.token_count == count_tokens(static.answer)
+
+def test_query_bodies_are_compact_json(client):
+    response = client.post("/query", json={"query": "Show me the dessert menu"})
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == json.dumps(response.json(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
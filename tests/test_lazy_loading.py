@@ -0,0 +1,65 @@
+"""Tests for lazy loading: load_once, and what importing the apps loads."""
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from knowledge_base.utils import LOAD_TIMES, load_once
+
+from conftest import ROOT
+
+def test_load_once_builds_on_first_call_only():
+    builds = []
+
+    @load_once
+    def build_thing():
+        builds.append(1)
+        return object()
+
+    assert not builds
+    first = build_thing()
+    assert build_thing() is first
+    assert len(builds) == 1
+    assert "build_thing" in LOAD_TIMES
+
+    build_thing.reset()
+    assert build_thing() is not first
+    assert len(builds) == 2
+
+def test_load_once_is_thread_safe():
+    builds = []
+    started = threading.Barrier(8)
+
+    @load_once
+    def slow_thing():
+        builds.append(1)
+        return len(builds)
+
+    def call():
+        started.wait()
+        results.append(slow_thing())
+
+    results = []
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [1]
+    assert results == [1] * 8
+
+@pytest.mark.parametrize("module, heavy", [
+    ("knowledge_base", ["sklearn"]),
+    ("webhook.api", ["gspread", "google.oauth2"]),
+])
+def test_import_loads_nothing_heavy(module, heavy):
+    code = (
+        f"import sys, {module}; "
+        "from knowledge_base.utils import LOAD_TIMES; "
+        f"print(sorted(LOAD_TIMES), [name for name in {heavy!r} if name in sys.modules])"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[] []"
@@ -0,0 +1,67 @@
+"""Tests for the keyword-indexed pattern dispatch in knowledge_base.matcher."""
+
+import re
+
+import pytest
+
+from knowledge_base.api import HARDCODED_RESPONSES
+from knowledge_base.matcher import PatternMatcher
+
+MESSAGES = [
+    "what are the veg starters",
+    "what about vegetarian starters?",
+    "what vegetarian dishes are served",
+    "can i get jain food",
+    "jain food please",
+    "what type of fish do you have",
+    "what flavors of kulfi are there",
+    "what non-veg starters are available that are not seafood",
+    "what is the address of the barbeque nation in indiranagar",
+    "does the indiranagar outlet have these facilities",
+    "what are the lunch timings on saturday at indiranagar",
+    "tell me about the desserts",
+    "what are complimentary beverages",
+    "do you have rooftop seating",
+    "what are weekend offers",
+    "do you have gluten-free options",
+    "how much does the buffet cost",
+    "how many does the buffet cost",
+    "hello",
+    "",
+    "desserts",
+    "the lunch timings on saturday in indiranagar",
+]
+
+def first_match(patterns, text):
+    """What the matcher replaces: try every pattern in order."""
+    for pattern in patterns:
+        if re.search(pattern, text):
+            return pattern
+    return None
+
+@pytest.mark.parametrize("text", MESSAGES)
+def test_matches_like_a_plain_loop(text):
+    matcher = PatternMatcher(HARDCODED_RESPONSES)
+    assert matcher.search(text) == first_match(list(HARDCODED_RESPONSES), text)
+
+def test_only_anchored_patterns_are_tried():
+    matcher = PatternMatcher(HARDCODED_RESPONSES)
+    assert matcher.candidates("hello there") == matcher.unanchored
+    kulfi = list(HARDCODED_RESPONSES).index(r"what flavors of kulfi")
+    assert kulfi in matcher.candidates("what flavors of kulfi")
+
+@pytest.mark.parametrize("pattern, text, expected", [
+    (r"\bprefix", "prefixes", True),       # keyword starts a word
+    (r"suffix\b", "the suffix", True),     # keyword ends a word
+    (r"a+b", "aaab", True),                # no literal keyword at all
+    (r"(?i)hello world", "HELLO WORLD", True),
+    (r"hello world", "hello  world", False),
+])
+def test_patterns_of_every_kind(pattern, text, expected):
+    matcher = PatternMatcher([pattern])
+    assert (matcher.search(text) == pattern) is expected
+
+def test_first_pattern_in_order_wins():
+    matcher = PatternMatcher([r"book a table", r"table", r"book"])
+    assert matcher.search("i want to book a table") == r"book a table"
+    assert matcher.search("a table for two") == r"table"
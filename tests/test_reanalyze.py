@@ -0,0 +1,99 @@
+"""
+Tests for webhook.reanalyze checkpoints: resuming an interrupted run,
+refusing a checkpoint from a different run and cleaning up when done.
+"""
+
+import csv
+import json
+
+import pytest
+
+from webhook import reanalyze
+
+def write_inputs(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "call_id": f"call-{i}",
+                "transcript": f"Book a table for {i % 9 + 2} people tomorrow at 8 pm, name is Guest{i}",
+                "call_time": "2025-05-13T18:30:00"
+            }) + "\n")
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+def run(inputs, output, *extra):
+    reanalyze.main([str(inputs), "-o", str(output), "--workers", "1", "--chunk-size", "3", *extra])
+
+@pytest.fixture
+def inputs(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    write_inputs(path, 10)
+    return path
+
+def test_finished_run_removes_checkpoint(tmp_path, inputs):
+    output = tmp_path / "results.csv"
+    run(inputs, output)
+    rows = read_rows(output)
+    assert rows[0] == reanalyze.OUTPUT_COLUMNS
+    assert [row[0] for row in rows[1:]] == [f"call-{i}" for i in range(10)]
+    assert not (tmp_path / "results.csv.checkpoint").exists()
+
+    # A second run starts over instead of resuming past the end
+    run(inputs, output)
+    assert read_rows(output) == rows
+
+def test_interrupted_run_resumes(tmp_path, inputs, monkeypatch):
+    expected_output = tmp_path / "expected.csv"
+    run(inputs, expected_output)
+
+    output = tmp_path / "results.csv"
+    checkpoint_path = tmp_path / "results.csv.checkpoint"
+    write_next = reanalyze.write_next
+    calls = []
+
+    def interrupted(*args):
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(1)
+        return write_next(*args)
+
+    monkeypatch.setattr(reanalyze, "write_next", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run(inputs, output)
+    monkeypatch.setattr(reanalyze, "write_next", write_next)
+
+    checkpoint = json.loads(checkpoint_path.read_text())
+    assert checkpoint["records"] == 6
+    assert checkpoint["format"] == "csv"
+
+    run(inputs, output)
+    assert read_rows(output) == read_rows(expected_output)
+    assert not checkpoint_path.exists()
+
+def test_checkpoint_for_other_format_is_rejected(tmp_path, inputs):
+    output = tmp_path / "results"
+    checkpoint_path = tmp_path / "results.checkpoint"
+    checkpoint_path.write_text(json.dumps({
+        "inputs": [str(inputs)],
+        "output": str(output),
+        "format": "parquet",
+        "records": 3,
+        "position": 1
+    }))
+    with pytest.raises(SystemExit, match="different run"):
+        run(inputs, output, "--format", "csv")
+    assert checkpoint_path.exists()
+
+def test_checkpoint_without_format_is_rejected(tmp_path, inputs):
+    output = tmp_path / "results.csv"
+    checkpoint_path = tmp_path / "results.csv.checkpoint"
+    checkpoint_path.write_text(json.dumps({
+        "inputs": [str(inputs)],
+        "output": str(output),
+        "records": 3,
+        "position": 100
+    }))
+    with pytest.raises(SystemExit, match="different run"):
+        run(inputs, output)
@@ -0,0 +1,169 @@
+"""
+Tests for call event ingestion in webhook.api: call_ended followed by
+call_analyzed gives one stored record and one spreadsheet row, with the
+analysis fields merged in, and retried events are ignored even after a
+restart.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from webhook import api, call_store, google_sheets
+from webhook.call_store import CallStore
+from webhook.dedup import SeenEvents
+from webhook.google_sheets import retell_analysis_fields
+from webhook.sheets_writer import SheetsWriter
+
+TRANSCRIPT = "Can I book a table for 6 tomorrow at 8 pm at Indiranagar? Name's Priya."
+
+class FakeWorksheet:
+    def __init__(self):
+        self.rows = []
+
+    def append_rows(self, rows):
+        first = len(self.rows) + 1
+        self.rows.extend(rows)
+        return {"updates": {"updatedRange": f"Sheet1!A{first}:N{len(self.rows)}"}}
+
+    def batch_update(self, data):
+        for update in data:
+            self.rows[int(update["range"].split(":")[0][1:]) - 1] = update["values"][0]
+
+@pytest.fixture
+def worksheet():
+    return FakeWorksheet()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, worksheet):
+    monkeypatch.setattr(call_store, "_call_store", CallStore(str(tmp_path / "calls.db")))
+    # Not started, so rows stay queued until a test flushes them
+    writer = SheetsWriter(str(tmp_path / "queue.db"), lambda: worksheet)
+    monkeypatch.setattr(google_sheets, "_sheets_writer", writer)
+    monkeypatch.setattr(api, "SEEN_EVENTS", SeenEvents())
+    with TestClient(api.app) as client:
+        yield client
+
+def send(client, event_type, **payload):
+    payload.setdefault("call_id", "call-1")
+    response = client.post("/webhook", json={"event_type": event_type, "payload": payload})
+    assert response.status_code == 200
+    return response.json()
+
+def call_ended(client):
+    turns = [{"role": "user", "transcript": TRANSCRIPT}]
+    return send(client, "call_ended", phone_number="+919800000000", turns=turns)
+
+def call_analyzed(client, **analysis):
+    return send(client, "call_analyzed", phone_number="+919800000000", transcript=TRANSCRIPT, analysis=analysis)
+
+def restart(monkeypatch):
+    monkeypatch.setattr(api, "SEEN_EVENTS", SeenEvents())
+
+def test_call_analyzed_merges_into_call_ended(client, worksheet):
+    assert call_ended(client)["message"] == "Call queued for logging"
+    stored = call_store.get_call_store().get("call-1")
+    assert stored["party_size"] == "6"
+    assert stored["outlet"] == "indiranagar"
+
+    body = call_analyzed(
+        client,
+        call_summary="Priya booked a table for six at Indiranagar.",
+        custom_analysis_data={"customer_name": "Priya Sharma"}
+    )
+    assert body["message"] == "Call record updated"
+
+    store = call_store.get_call_store()
+    assert store.count() == 1
+    stored = store.get("call-1")
+    assert stored["summary"] == "Priya booked a table for six at Indiranagar."
+    assert stored["customer_name"] == "Priya Sharma"
+    # Fields Retell didn't report keep the transcript analysis
+    assert stored["party_size"] == "6"
+
+    # The queued row was replaced, not joined by a second one
+    writer = google_sheets.get_sheets_writer()
+    assert writer.pending == 1
+    writer.flush()
+    assert len(worksheet.rows) == 1
+    row = dict(zip(google_sheets.RECORD_FIELDS, worksheet.rows[0]))
+    assert row["summary"] == "Priya booked a table for six at Indiranagar."
+    assert row["customer_name"] == "Priya Sharma"
+    assert row["call_time"] == stored["call_time"]
+
+def test_call_analyzed_after_flush_updates_the_written_row(client, worksheet):
+    call_ended(client)
+    writer = google_sheets.get_sheets_writer()
+    writer.flush()
+
+    assert call_analyzed(client, call_summary="Booked for six.")["message"] == "Call record updated"
+    assert call_store.get_call_store().get("call-1")["summary"] == "Booked for six."
+    assert writer.pending == 1
+    writer.flush()
+    assert len(worksheet.rows) == 1
+    row = dict(zip(google_sheets.RECORD_FIELDS, worksheet.rows[0]))
+    assert row["summary"] == "Booked for six."
+    assert row["party_size"] == "6"
+
+def test_call_analyzed_first(client, worksheet):
+    assert call_analyzed(client, call_summary="Booked for six.")["message"] == "Call queued for logging"
+    assert call_ended(client)["message"] == "Call record updated"
+    store = call_store.get_call_store()
+    assert store.count() == 1
+    assert store.get("call-1")["summary"] == "Booked for six."
+    google_sheets.get_sheets_writer().flush()
+    assert len(worksheet.rows) == 1
+
+def test_retried_events_are_ignored(client, monkeypatch):
+    call_ended(client)
+    call_analyzed(client, call_summary="Booked for six.")
+    assert call_ended(client)["message"] == "Duplicate event ignored"
+
+    # After a restart the call store still knows both events
+    restart(monkeypatch)
+    assert call_ended(client)["message"] == "Duplicate event ignored"
+    assert call_analyzed(client, call_summary="Something else.")["message"] == "Duplicate event ignored"
+    assert call_store.get_call_store().get("call-1")["summary"] == "Booked for six."
+    assert google_sheets.get_sheets_writer().pending == 1
+
+def test_weekday_booking_is_found_by_weekday(client):
+    turns = [{"role": "user", "transcript": "A table for 4 this Saturday at Indiranagar, please."}]
+    send(client, "call_ended", phone_number="+919800000000", turns=turns)
+    body = client.get("/calls", params={"booking_date": "saturday", "outlet": "Indiranagar"}).json()
+    assert [call["call_id"] for call in body["calls"]] == ["call-1"]
+
+def test_retry_is_processed_when_the_row_was_not_queued(client, monkeypatch):
+    writer = google_sheets.get_sheets_writer()
+    enqueue = writer.enqueue
+    def fail(row, call_id=None):
+        raise OSError("disk full")
+    monkeypatch.setattr(writer, "enqueue", fail)
+    turns = [{"role": "user", "transcript": TRANSCRIPT}]
+    response = client.post("/webhook", json={
+        "event_type": "call_ended", "payload": {"call_id": "call-1", "phone_number": "+919800000000", "turns": turns}
+    })
+    assert response.status_code == 500
+    assert call_store.get_call_store().get("call-1") is None
+    assert not call_store.get_call_store().has_event("call-1", "call_ended")
+
+    # Retell retries, after a restart here to show the call store let it through
+    monkeypatch.setattr(writer, "enqueue", enqueue)
+    restart(monkeypatch)
+    assert call_ended(client)["message"] == "Call queued for logging"
+    assert writer.pending == 1
+
+def test_chatbot_log_is_deduplicated(client, monkeypatch):
+    data = {"conversation_id": "chat-1", "transcript": TRANSCRIPT}
+    assert client.post("/chatbot-log", json=data).json()["message"] == "Call queued for logging"
+    restart(monkeypatch)
+    assert client.post("/chatbot-log", json=data).json()["message"] == "Duplicate event ignored"
+    assert call_store.get_call_store().count() == 1
+
+def test_retell_analysis_fields():
+    assert retell_analysis_fields(None) == {}
+    assert retell_analysis_fields({
+        "call_summary": "Summary",
+        "outcome": "Availability",
+        "call_time": "ignored",
+        "customer_name": "NA",
+        "custom_analysis_data": {"party_size": 4, "booking_date": ""}
+    }) == {"summary": "Summary", "outcome": "Availability", "party_size": "4"}
@@ -0,0 +1,36 @@
+"""Tests for BM25 fact retrieval in knowledge_base.retrieval."""
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+from knowledge_base.data import knowledge_base
+from knowledge_base.retrieval import FactRetriever, build_fact_passages
+
+@pytest.fixture(scope="module")
+def retriever():
+    return FactRetriever(build_fact_passages(knowledge_base))
+
+def test_passages_are_one_fact_each():
+    passages = build_fact_passages(knowledge_base)
+    sources = {source for source, _ in passages}
+    assert "bangalore.indiranagar.parking" in sources
+    assert ("bangalore.indiranagar.parking", "Indiranagar, Bangalore parking: Valet Parking Available") in passages
+
+def test_search_ranks_the_matching_fact_first(retriever):
+    hits = retriever.search("is there valet parking at indiranagar", top_k=3)
+    assert hits[0][0] == "bangalore.indiranagar.parking"
+    scores = [score for _, _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+def test_search_many_matches_search(retriever):
+    queries = ["kulfi flavors", "wheelchair access koramangala", "nothing matches zzz"]
+    assert retriever.search_many(queries, 4) == [retriever.search(query, 4) for query in queries]
+
+def test_no_hits_without_shared_terms(retriever):
+    assert retriever.search("zzz qqq") == []
+    assert retriever.search_many([]) == []
+
+def test_top_k_is_capped(retriever):
+    assert len(retriever.search("parking", top_k=2)) == 2
+    assert retriever.search("parking", top_k=0) == []
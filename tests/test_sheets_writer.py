@@ -0,0 +1,292 @@
+"""Tests for the durable, batched Google Sheets writer in webhook.sheets_writer."""
+
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from webhook.sheets_writer import SheetsWriter, appended_at, is_rejection, row_range
+
+class FakeWorksheet:
+    """Records appended rows; fails the next ``fail`` calls to append_rows."""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.batches = []
+        self.calls = 0
+        self.appended = threading.Event()
+
+    def append_rows(self, rows):
+        self.calls += 1
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("Sheets API unavailable")
+        self.batches.append(rows)
+        self.appended.set()
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.response = SimpleNamespace(status_code=status_code)
+
+class RejectingWorksheet(FakeWorksheet):
+    """Rejects every batch holding a "bad" row, as Sheets does with a 400."""
+
+    def __init__(self, status_code=400):
+        super().__init__()
+        self.status_code = status_code
+
+    def append_rows(self, rows):
+        self.calls += 1
+        if any("bad" in row for row in rows):
+            raise APIError(self.status_code)
+        self.batches.append(rows)
+        self.appended.set()
+
+class Sheet:
+    """A worksheet that reports where rows were appended and can overwrite them."""
+
+    def __init__(self):
+        self.rows = [["Modality", "Call ID", "Summary"]]
+        self.updates = 0
+
+    def append_rows(self, rows):
+        first = len(self.rows) + 1
+        self.rows.extend(rows)
+        return {"updates": {"updatedRange": f"'Call Log'!A{first}:C{len(self.rows)}", "updatedRows": len(rows)}}
+
+    def batch_update(self, data):
+        self.updates += 1
+        for update in data:
+            start, end = update["range"].split(":")
+            assert start[0] == "A" and start[1:] == end[1:]
+            self.rows[int(start[1:]) - 1] = update["values"][0]
+
+def make_writer(path, worksheet, **options):
+    return SheetsWriter(str(path), lambda: worksheet, **options)
+
+def test_flush_appends_in_batches(tmp_path):
+    worksheet = FakeWorksheet()
+    writer = make_writer(tmp_path / "queue.db", worksheet, batch_size=2)
+    for i in range(5):
+        writer.enqueue(["Call", i])
+    assert writer.flush() == 5
+    assert [len(batch) for batch in worksheet.batches] == [2, 2, 1]
+    assert worksheet.rows == [["Call", i] for i in range(5)]
+    assert writer.stats()["pending"] == 0
+
+def test_failed_flush_keeps_rows_for_a_retry(tmp_path):
+    worksheet = FakeWorksheet(fail=1)
+    writer = make_writer(tmp_path / "queue.db", worksheet)
+    writer.enqueue(["Call", 1])
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert writer.pending == 1
+    assert writer.flush() == 1
+    assert worksheet.rows == [["Call", 1]]
+
+def test_rows_queued_before_a_restart_are_replayed(tmp_path):
+    path = tmp_path / "queue.db"
+    writer = make_writer(path, FakeWorksheet(fail=1))
+    writer.enqueue(["Call", 1])
+    writer.enqueue(["Call", 2])
+    # The process dies before a flush succeeds
+    writer.stop(flush=True)
+
+    worksheet = FakeWorksheet()
+    restarted = make_writer(path, worksheet, flush_interval=60)
+    assert restarted.pending == 2
+    restarted.start()
+    try:
+        assert worksheet.appended.wait(5)
+    finally:
+        restarted.stop()
+    assert worksheet.rows == [["Call", 1], ["Call", 2]]
+
+class LostResponseWorksheet(FakeWorksheet):
+    """Applies the first append, then fails as if the response was lost."""
+
+    def append_rows(self, rows):
+        super().append_rows(rows)
+        if self.calls == 1:
+            raise TimeoutError("response lost")
+
+def test_delivery_is_at_least_once(tmp_path):
+    """A batch that may have been appended is sent again rather than lost."""
+    path = tmp_path / "queue.db"
+    worksheet = LostResponseWorksheet()
+    writer = make_writer(path, worksheet)
+    writer.enqueue(["Call", 1])
+    with pytest.raises(TimeoutError):
+        writer.flush()
+    writer.stop(flush=False)
+
+    restarted = make_writer(path, worksheet)
+    assert restarted.flush() == 1
+    assert worksheet.rows == [["Call", 1], ["Call", 1]]
+    assert restarted.flush() == 0
+
+def test_full_batch_wakes_the_writer(tmp_path):
+    worksheet = FakeWorksheet()
+    writer = make_writer(tmp_path / "queue.db", worksheet, batch_size=3, flush_interval=60)
+    writer.start()
+    try:
+        for i in range(3):
+            writer.enqueue(["Call", i])
+        assert worksheet.appended.wait(5)
+    finally:
+        writer.stop(flush=False)
+    assert len(worksheet.rows) == 3
+
+def test_full_batch_waits_for_the_retry_backoff(tmp_path, monkeypatch):
+    worksheet = FakeWorksheet(fail=1)
+    writer = make_writer(tmp_path / "queue.db", worksheet, batch_size=2, flush_interval=0.05, max_backoff=60)
+    monkeypatch.setattr(writer, "_backoff", lambda: 1.0)
+    writer.enqueue(["Call", 0])
+    writer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while writer.failures == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert writer.failures == 1
+        failed_at = time.monotonic()
+
+        # A full batch is waiting, but the retry isn't due for another second
+        writer.enqueue(["Call", 1])
+        assert worksheet.appended.wait(5)
+        assert time.monotonic() - failed_at >= 0.8
+        assert worksheet.calls == 2
+    finally:
+        writer.stop(flush=False)
+    assert worksheet.rows == [["Call", 0], ["Call", 1]]
+
+def test_replace_updates_a_queued_row(tmp_path):
+    worksheet = FakeWorksheet()
+    writer = make_writer(tmp_path / "queue.db", worksheet)
+    writer.enqueue(["Call", "call-1", "NA"], "call-1")
+    writer.enqueue(["Call", "call-2", "NA"], "call-2")
+    assert writer.replace("call-1", ["Call", "call-1", "Summary"])
+    assert writer.pending == 2
+    writer.flush()
+    assert worksheet.rows == [["Call", "call-2", "NA"], ["Call", "call-1", "Summary"]]
+    assert writer.pending == 0
+
+    # Once written, if the worksheet didn't say where, the row is left alone
+    assert not writer.replace("call-1", ["Call", "call-1", "Later"])
+    assert writer.pending == 0
+    writer.flush()
+    assert len(worksheet.rows) == 2
+
+def test_replace_overwrites_a_written_row(tmp_path):
+    path = tmp_path / "queue.db"
+    sheet = Sheet()
+    writer = make_writer(path, sheet)
+    for call_id in ("call-1", "call-2"):
+        writer.enqueue(["Call", call_id, "NA"], call_id)
+    writer.enqueue(["Chatbot", None, "NA"])
+    writer.flush()
+
+    assert writer.replace("call-1", ["Call", "call-1", "Booked"])
+    assert writer.replace("call-1", ["Call", "call-1", "Booked for six"])
+    assert writer.pending == 1
+    assert writer.flush() == 1
+    assert sheet.rows[1:] == [["Call", "call-1", "Booked for six"], ["Call", "call-2", "NA"], ["Chatbot", None, "NA"]]
+    assert sheet.updates == 1
+    assert writer.stats()["rows_updated"] == 1
+
+    # Where each call's row went is kept across restarts
+    writer.stop(flush=False)
+    writer = make_writer(path, sheet)
+    assert writer.replace("call-2", ["Call", "call-2", "Enquiry"])
+    writer.flush()
+    assert sheet.rows[1:] == [["Call", "call-1", "Booked for six"], ["Call", "call-2", "Enquiry"], ["Chatbot", None, "NA"]]
+
+def test_written_rows_are_forgotten(tmp_path):
+    sheet = Sheet()
+    writer = make_writer(tmp_path / "queue.db", sheet, remember_rows_for=0)
+    writer.enqueue(["Call", "call-1", "NA"], "call-1")
+    writer.flush()
+    assert not writer.replace("call-1", ["Call", "call-1", "Booked"])
+    writer.flush()
+    assert sqlite3.connect(tmp_path / "queue.db").execute("SELECT COUNT(*) FROM written_rows").fetchone() == (0,)
+
+def test_appended_at():
+    assert appended_at({"updates": {"updatedRange": "Sheet1!A5:N7"}}) == 5
+    assert appended_at({"updates": {"updatedRange": "'Call Log'!A12:N12"}}) == 12
+    assert appended_at({}) is None
+    assert appended_at(None) is None
+
+def test_row_range():
+    assert row_range(5, 3) == "A5:C5"
+    assert row_range(2, 26) == "A2:Z2"
+    assert row_range(9, 28) == "A9:AB9"
+
+def test_queue_without_call_ids_is_upgraded(tmp_path):
+    path = tmp_path / "queue.db"
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE pending_rows (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, enqueued_at REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO pending_rows (row, enqueued_at) VALUES (?, ?)", ('["Call", 0]', time.time()))
+    db.commit()
+    db.close()
+
+    worksheet = FakeWorksheet()
+    writer = make_writer(path, worksheet)
+    assert writer.pending == 1
+    writer.enqueue(["Call", 1], "call-1")
+    assert writer.replace("call-1", ["Call", 2])
+    writer.flush()
+    assert worksheet.rows == [["Call", 0], ["Call", 2]]
+
+def test_rejected_row_goes_to_dead_rows(tmp_path):
+    worksheet = RejectingWorksheet()
+    writer = make_writer(tmp_path / "queue.db", worksheet, batch_size=8)
+    rows = [["Call", i] for i in range(7)]
+    rows.insert(4, ["Call", "bad"])
+    for row in rows:
+        writer.enqueue(row, f"call-{row[1]}")
+    assert writer.flush() == 7
+    # Every good row got through, in order, past the one that keeps failing
+    assert worksheet.rows == [row for row in rows if "bad" not in row]
+    stats = writer.stats()
+    assert (stats["pending"], stats["rows_rejected"], stats["dead_rows"]) == (0, 1, 1)
+
+    calls = worksheet.calls
+    assert writer.flush() == 0
+    assert worksheet.calls == calls
+    dead = sqlite3.connect(tmp_path / "queue.db").execute("SELECT row, call_id, error FROM dead_rows").fetchall()
+    assert dead == [('["Call", "bad"]', "call-bad", "status 400")]
+
+def test_rejections_survive_a_restart(tmp_path):
+    path = tmp_path / "queue.db"
+    writer = make_writer(path, RejectingWorksheet())
+    writer.enqueue(["Call", "bad"])
+    writer.flush()
+    writer.stop(flush=False)
+    assert make_writer(path, FakeWorksheet()).stats()["dead_rows"] == 1
+
+@pytest.mark.parametrize("status", [401, 403, 404, 408, 429, 500, 503])
+def test_retryable_errors_keep_the_batch(tmp_path, status):
+    worksheet = RejectingWorksheet(status)
+    writer = make_writer(tmp_path / "queue.db", worksheet)
+    writer.enqueue(["Call", 1])
+    writer.enqueue(["Call", "bad"])
+    with pytest.raises(APIError):
+        writer.flush()
+    assert worksheet.calls == 1
+    assert writer.pending == 2
+    assert writer.stats()["dead_rows"] == 0
+
+def test_is_rejection():
+    assert is_rejection(APIError(400))
+    assert is_rejection(APIError(413))
+    assert not is_rejection(APIError(429))
+    assert not is_rejection(APIError(500))
+    assert not is_rejection(ConnectionError())
@@ -0,0 +1,125 @@
+"""
+Tests for conversation_flow.simulator: scripted and random users through the
+local flow, the knowledge base stage and driving the Go chatbot.
+"""
+
+import asyncio
+import random
+
+import httpx
+
+from conversation_flow.simulator import (
+    QUESTIONS, ConversationSimulator, SimulationReport, UserTurn, random_user, scripted_user
+)
+from knowledge_base import kb_app
+
+BOOKING = [
+    UserTurn("Hi", {}),
+    UserTurn("Bangalore please", {"city": "bangalore"}),
+    UserTurn("The indiranagar one", {"outlet": "indiranagar"}),
+    UserTurn("I want to book a table", {"intent": "new_reservation"}),
+    UserTurn("Tomorrow at 8 pm", {"date": "tomorrow", "time": "8 pm"}),
+    UserTurn("For 4 people", {"party_size": 4}),
+    UserTurn("Asha, 9812345678", {"customer_name": "Asha", "phone_number": "9812345678"}),
+    UserTurn("Yes, that's correct", {"reservation_confirmed": True}),
+]
+
+INQUIRY = [
+    UserTurn("Hello", {}),
+    UserTurn("Delhi", {"city": "delhi"}),
+    UserTurn("Connaught place", {"outlet": "connaught_place"}),
+    UserTurn("I'd like some information", {"intent": "inquiry"}),
+    UserTurn(QUESTIONS[0]),
+    UserTurn(QUESTIONS[1]),
+    UserTurn("Thanks, that's all", {"inquiry_complete": True}),
+]
+
+def run(simulator, users, **options):
+    return asyncio.run(simulator.run(users, **options))
+
+def test_scripted_booking_reaches_farewell():
+    simulator = ConversationSimulator()
+    report = SimulationReport()
+    session = asyncio.run(simulator.run_conversation(scripted_user(BOOKING), report))
+    assert session.finished
+    assert session.state == "farewell"
+    assert session.turns == len(BOOKING)
+    assert session.context["party_size"] == 4
+
+    summary = report.summary()
+    assert summary["conversations"] == 1
+    assert summary["turns"] == len(BOOKING)
+    assert summary["final_states"] == {"farewell": 1}
+    assert summary["stages"]["transition"]["count"] == len(BOOKING)
+    assert summary["stages"]["render"]["count"] == len(BOOKING)
+    # No knowledge base client, so nothing was looked up
+    assert "kb" not in summary["stages"]
+    prompts = summary["prompt_tokens"]
+    assert {"city_collection", "new_reservation", "reservation_confirmation", "farewell"} <= set(prompts)
+    assert prompts["new_reservation"]["renders"] == 3
+    assert all(stats["max"] > 0 for stats in prompts.values())
+
+def test_unhelpful_user_falls_back_to_farewell():
+    report = run(ConversationSimulator(), [scripted_user([UserTurn("hmm")] * 20)])
+    assert report.final_states == {"farewell": 1}
+    assert "fallback" in report.prompt_tokens
+
+def test_max_turns():
+    report = run(ConversationSimulator(max_turns=3), [scripted_user(BOOKING)])
+    assert report.turns == 3
+    assert report.final_states == {"intent_identification": 1}
+
+def test_random_users():
+    rng = random.Random(11)
+    users = [random_user(rng) for _ in range(200)]
+    report = run(ConversationSimulator(), users, concurrency=20)
+    summary = report.summary()
+    assert summary["conversations"] == 200
+    assert sum(summary["final_states"].values()) == 200
+    assert summary["final_states"].get("farewell", 0) > 150
+    assert summary["turns_per_second"] > 0
+    assert summary["stages"]["transition"]["p50"] <= summary["stages"]["transition"]["max"]
+
+def test_questions_go_to_the_knowledge_base():
+    async def simulate():
+        transport = httpx.ASGITransport(app=kb_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://kb") as client:
+            return await ConversationSimulator(client, kb_path="").run([scripted_user(INQUIRY)])
+
+    report = asyncio.run(simulate())
+    assert report.final_states == {"farewell": 1}
+    assert len(report.latencies["kb"]) == 2
+
+class FakeGoResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+class FakeGoClient:
+    """Answers like /chatbot/state-flow, moving through a fixed list of states."""
+
+    STATES = ["city", "outlet", "intent", "end"]
+
+    def __init__(self):
+        self.requests = []
+
+    async def post(self, url, json):
+        self.requests.append((url, json))
+        next_state = self.STATES[len(self.requests) - 1]
+        return FakeGoResponse({"next_state": next_state, "context": {"turns": len(self.requests)}})
+
+def test_go_chatbot():
+    client = FakeGoClient()
+    report = run(ConversationSimulator(client, go_url="http://go/chatbot/state-flow"), [random_user(random.Random(1), 0)])
+    assert report.final_states == {"end": 1}
+    assert report.turns == 4
+    assert [request["current_state"] for _, request in client.requests] == ["greeting", "city", "outlet", "intent"]
+    assert client.requests[-1][1]["context"] == {"turns": 3}
+    # Nothing is rendered for the Go chatbot
+    assert not report.prompt_tokens
+    assert len(report.latencies["transition"]) == 4
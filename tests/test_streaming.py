@@ -0,0 +1,107 @@
+"""
+Tests for webhook.streaming: incremental parsing of large webhook bodies
+against decoding them in one go, parsing off the event loop, and peeking at
+the event type.
+"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from webhook import streaming
+from webhook.streaming import parse_webhook_body, parse_webhook_event, peek_event_type
+
+pytest.importorskip("ijson")
+
+def make_body(turns):
+    rng = random.Random(turns)
+    return json.dumps({
+        "event_type": "call_ended",
+        "payload": {
+            "call_id": "call-1",
+            "phone_number": "+919800000000",
+            "turns": [
+                {
+                    "role": "user" if i % 2 else "agent",
+                    "transcript": f"Turn {i}: book a table for {rng.randint(2, 12)} at 8 pm, name is Guest{i}",
+                    "words": [{"word": "turn", "start": i, "end": i + 0.5}] * 5
+                }
+                for i in range(turns)
+            ],
+            "metadata": {"outlet": "indiranagar"}
+        }
+    }).encode()
+
+async def chunked(body, size):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def parse(body, size):
+    return asyncio.run(parse_webhook_event(chunked(body, size)))
+
+@pytest.mark.parametrize("turns,size", [(0, 7), (3, 1), (50, 97), (2000, 4096), (2000, 1 << 20)])
+def test_streaming_matches_decoding(turns, size):
+    body = make_body(turns)
+    expected = parse_webhook_body(body)
+    parsed = parse(body, size)
+    assert parsed.event == expected.event
+    assert "turns" not in parsed.event["payload"]
+    assert parsed.transcript == expected.transcript
+    assert parsed.turns.turns == turns
+    assert parsed.turns.analysis() == expected.turns.analysis()
+
+def test_body_without_turns():
+    body = json.dumps({"event_type": "call_analyzed", "payload": {"call_id": "call-1", "transcript": "hi"}}).encode()
+    parsed = parse(body, 5)
+    assert parsed.event == json.loads(body)
+    assert parsed.turns is None
+    assert parsed.transcript is None
+
+def test_large_body_is_parsed_off_the_event_loop(monkeypatch):
+    batches = []
+
+    async def fake_run_blocking(function, *args):
+        batches.append(len(args[0]))
+        return function(*args)
+
+    monkeypatch.setattr(streaming, "run_blocking", fake_run_blocking)
+    monkeypatch.setattr(streaming, "WEBHOOK_PARSE_BATCH_BYTES", 10000)
+    body = make_body(500)
+    parsed = parse(body, 1000)
+    assert parsed.turns.turns == 500
+    # Every full batch went to the pool; only the tail was parsed inline
+    assert batches and all(size >= 10000 for size in batches)
+    assert len(body) - sum(batches) < 10000
+
+def test_small_body_is_parsed_inline(monkeypatch):
+    async def fail(*args):
+        raise AssertionError("parsed on the pool")
+
+    monkeypatch.setattr(streaming, "run_blocking", fail)
+    assert parse(make_body(3), 64).turns.turns == 3
+
+@pytest.mark.parametrize("body", [b'{"event_type": "call_ended", "payload": {', b"[1, 2]", b"not json"])
+def test_invalid_body(body):
+    with pytest.raises(ValueError):
+        parse(body, 4)
+
+def test_without_ijson(monkeypatch):
+    monkeypatch.setattr(streaming, "ijson", None)
+    body = make_body(20)
+    parsed = parse(body, 100)
+    assert parsed.event == parse_webhook_body(body).event
+    assert parsed.turns.turns == 20
+
+def test_peek_event_type():
+    async def peek(body, size):
+        event_type, chunks = await peek_event_type(chunked(body, size))
+        return event_type, b"".join([chunk async for chunk in chunks])
+
+    body = make_body(2)
+    assert asyncio.run(peek(body, 64)) == ("call_ended", body)
+    # The event type has to be in the first chunk
+    assert asyncio.run(peek(body, 8)) == (None, body)
+    later = json.dumps({"payload": {}, "event_type": "call_started"}).encode()
+    assert asyncio.run(peek(later, 64)) == (None, later)
@@ -0,0 +1,100 @@
+"""Tests for the compiled conversation flow templates in conversation_flow.templates: the
+bytecode cache, rendered prompts and keeping them within the token budget."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from conversation_flow.templates import render_prompt, template_variables
+from knowledge_base.utils import count_tokens
+
+RENDER = "from conversation_flow.templates import render_prompt; render_prompt('new_reservation', {'city': 'Delhi'})"
+
+def render_in_subprocess(cwd, **env):
+    """Render a prompt in a fresh process; env values of None unset the variable."""
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    environment.update(env)
+    environment = {name: value for name, value in environment.items() if value is not None}
+    subprocess.run([sys.executable, "-c", RENDER], cwd=cwd, env=environment, check=True)
+
+@pytest.mark.parametrize("cache_dir", ["", None])
+def test_default_bytecode_cache_is_not_the_working_directory(tmp_path, cache_dir):
+    cwd = tmp_path / "cwd"
+    temp = tmp_path / "temp"
+    cwd.mkdir()
+    temp.mkdir()
+    render_in_subprocess(cwd, TEMPLATE_CACHE_DIR=cache_dir, TMPDIR=str(temp))
+    assert list(cwd.iterdir()) == []
+    assert any(temp.rglob("__jinja2_*"))
+
+def test_bytecode_cache_directory(tmp_path):
+    render_in_subprocess(tmp_path, TEMPLATE_CACHE_DIR=str(tmp_path / "cache"))
+    assert [path.name for path in tmp_path.iterdir()] == ["cache"]
+    assert any((tmp_path / "cache").glob("__jinja2_*.cache"))
+
+def test_bytecode_cache_off(tmp_path):
+    temp = tmp_path / "temp"
+    temp.mkdir()
+    render_in_subprocess(tmp_path, TEMPLATE_CACHE_DIR="off", TMPDIR=str(temp))
+    assert not any(tmp_path.rglob("__jinja2_*"))
+
+BOOKING = {
+    "city": "Delhi", "outlet": "Connaught Place", "date": "tomorrow", "time": "8 pm",
+    "party_size": 4, "customer_name": "Asha", "phone_number": "9812345678"
+}
+
+def test_rendered_prompt():
+    prompt = render_prompt("outlet_collection", {"city": "Delhi", "outlet": "Vasant Kunj"}, budget=1000)
+    assert prompt.text == (
+        "You are a voice assistant for Barbeque Nation restaurants. Your name is BBQ Assistant.\n"
+        "\n"
+        "The customer is interested in Barbeque Nation in Delhi.\n"
+        "\n"
+        "They have indicated interest in the Vasant Kunj outlet.\n"
+        "\n"
+        "Delhi outlets: Connaught Place, Vasant Kunj, and Janakpuri.\n"
+        "Bangalore outlets: Indiranagar, JP Nagar, Electronic City, and Koramangala.\n"
+        "\n"
+        "If they've specified an outlet, confirm it and ask how you can help them today with options like:\n"
+        "- Information about the restaurant\n"
+        "- Making a new reservation\n"
+        "- Modifying an existing reservation\n"
+        "- Cancelling a reservation\n"
+        "\n"
+        "If they haven't specified an outlet, ask which outlet they're interested in."
+    )
+    assert prompt.tokens == count_tokens(prompt.text)
+    assert not prompt.trimmed
+
+def test_rendered_prompt_without_global():
+    prompt = render_prompt("reservation_confirmation", BOOKING, include_global=False)
+    assert prompt.text.startswith("You have collected all the reservation details:\n- Outlet: Connaught Place in Delhi\n")
+    assert "- Party size: 4\n- Name: Asha\n- Phone: 9812345678\n\nConfirm" in prompt.text
+    assert "{{" not in prompt.text and "{%" not in prompt.text
+
+def test_template_variables():
+    assert template_variables("outlet_collection") == ("city", "outlet")
+    assert template_variables("greeting") == ()
+
+def test_over_budget_trims_the_context():
+    full = render_prompt("reservation_confirmation", BOOKING, budget=1000)
+    context = dict(BOOKING, customer_name="Asha " * 400)
+    prompt = render_prompt("reservation_confirmation", context, budget=full.tokens + 100)
+    assert prompt.trimmed
+    assert prompt.tokens <= full.tokens + 100
+    assert prompt.tokens == count_tokens(prompt.text)
+    # Only the name was cut; the instructions and the other values are all there
+    assert "Asha Asha" in prompt.text and "..." in prompt.text
+    for line in full.text.splitlines():
+        if "Asha" not in line:
+            assert line in prompt.text
+    assert context["customer_name"] == "Asha " * 400
+
+def test_instructions_over_budget_raise():
+    with pytest.raises(ValueError):
+        render_prompt("reservation_confirmation", dict(BOOKING, customer_name="Asha " * 400), budget=20)
+    with pytest.raises(ValueError):
+        render_prompt("greeting", {}, budget=10)
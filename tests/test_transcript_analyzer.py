@@ -0,0 +1,132 @@
+"""
+Tests for webhook.transcript_analyzer, checked against the original
+per-field extractors in webhook.google_sheets.
+"""
+
+import random
+from datetime import datetime
+
+import pytest
+
+from webhook import google_sheets
+from webhook.transcript_analyzer import STREAM_WINDOW, TranscriptStream, analyze_transcript
+
+NOW = datetime(2025, 5, 13, 18, 30)
+
+TRANSCRIPTS = [
+    "",
+    "Hello, I would like to make a reservation for 4 people on 2023-05-15 at 7:30 PM. My name is John.",
+    "Can I book a table for 6 tomorrow at 8 pm? Name's Priya.",
+    "I want to cancel my existing booking on 15/06/2025, name is Ravi",
+    "Please change my reservation to 12 am for 3 guests",
+    "What are your opening hours on sunday?",
+    "Where is the address of the Indiranagar outlet?",
+    "Is there parking available?",
+    "Do you have a menu for kids?",
+    "I just wanted to say thanks",
+    "party of 8 today at 12:45",
+    "booking for 5 at 9am, table for 2 also works",
+    "we are 10 people, 7 person maybe, 9   guests",
+    "modify my booking: 1/2/2024 at 11 PM for 12 people",
+    "Café reservation at 7 pm for 4 people, my name is José",
+    "update the existing order",
+    "I'm Alex and I am calling about location",
+    "for 3 person at 10:15am on 2024-01-01 2024-02-02",
+    "My Name Is Meera, my number is 9876543210",
+    "table for 20 at 8:00pm, 1234-56-78 is not a date",
+    # Fields that overlap or start inside a longer number
+    "table for 4 people at 123:45pm",
+    "on 2024-01-01 people, at 2024 pm",
+    "booking for 12345 people, party of 3 guests",
+    "12/3/2024-05-06 at 11:30am for 2 person",
+    "my name is my name's asha",
+    "Book a table for 2 this Saturday at 8 pm, or Sunday",
+    "friday or today, whichever is free",
+]
+
+FRAGMENTS = [
+    "hello", "I want to book a table", "for 4 people", "party of 6", "table for 2", "booking for 3",
+    "at 7 pm", "at 19:30", "at 12 am", "at 12:15 PM", "on 2025-06-01", "on 3/4/2025", "today",
+    "tomorrow", "my name is Asha", "name's Ravi", "name is Kiran", "cancel it", "change the time",
+    "what is the menu", "opening hours", "the address", "parking", "8 guests", "5 person", "9   people",
+    "ok", "thanks", "¿qué tal?", "1", "22", "x9y", "room 404", "call me at 98765 43210",
+    "2025", "-06-01", "/2025", ":30", "pm", "people", "for", "table for", "party of", "name is",
+    "on Saturday", "this friday", "monday", "someday",
+]
+
+def random_transcripts(count, seed=13):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 25))) for _ in range(count)]
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+def baseline_analysis(transcript):
+    """Run the google_sheets extractors one after another."""
+    outcome = google_sheets.get_call_outcome(transcript)
+    date = google_sheets.extract_booking_date(transcript)
+    time = google_sheets.extract_booking_time(transcript)
+    party_size = google_sheets.extract_party_size(transcript)
+    return (
+        outcome, date, time, party_size,
+        google_sheets.extract_customer_name(transcript),
+        google_sheets.generate_call_summary(transcript, outcome, date, time, party_size),
+    )
+
+@pytest.fixture
+def frozen_now(monkeypatch):
+    monkeypatch.setattr(google_sheets, "datetime", FixedDatetime)
+
+@pytest.mark.parametrize("transcript", TRANSCRIPTS + random_transcripts(300))
+def test_matches_the_google_sheets_extractors(transcript, frozen_now):
+    assert tuple(analyze_transcript(transcript, NOW)) == baseline_analysis(transcript)
+
+def test_long_call(frozen_now):
+    transcript = " ".join(random_transcripts(400, seed=7))
+    assert tuple(analyze_transcript(transcript, NOW)) == baseline_analysis(transcript)
+
+def test_weekday_is_the_next_such_day():
+    # NOW is a Tuesday
+    assert analyze_transcript("table for 2 on Saturday", NOW).booking_date == "2025-05-17"
+    assert analyze_transcript("table for 2 on Tuesday", NOW).booking_date == "2025-05-13"
+    assert analyze_transcript("monday, no, tomorrow", NOW).booking_date == "2025-05-14"
+
+def split_into_turns(transcript, rng):
+    words = transcript.split(" ")
+    turns, current = [], []
+    for word in words:
+        current.append(word)
+        if rng.random() < 0.2:
+            turns.append(" ".join(current))
+            current = []
+    return turns + [" ".join(current)]
+
+@pytest.mark.parametrize("seed", range(40))
+def test_stream_matches_analyze_transcript(seed):
+    rng = random.Random(seed)
+    # Long enough that most of it is scanned before the last turn
+    transcript = " ".join(random_transcripts(rng.randint(1, 60), seed=seed))
+    turns = split_into_turns(transcript, rng)
+    stream = TranscriptStream()
+    for turn in turns:
+        stream.add_turn(turn)
+        assert len(stream._text) <= 2 * STREAM_WINDOW + len(turn) + 1
+    assert stream.turns == len(turns)
+    assert stream.analysis(NOW) == analyze_transcript(" ".join(turns), NOW)
+
+def test_stream_analysis_so_far():
+    stream = TranscriptStream()
+    stream.add_turn("I'd like to book a table")
+    assert stream.analysis(NOW).outcome == "Availability"
+    assert stream.analysis(NOW).party_size == "NA"
+    stream.add_turn("for 4 people at 8 pm, my name is Asha")
+    analysis = stream.analysis(NOW)
+    assert (analysis.party_size, analysis.booking_time, analysis.customer_name) == ("4", "20:00", "Asha")
+
+def test_stream_match_across_turns():
+    stream = TranscriptStream()
+    stream.add_turn("x" * 1000 + " party of")
+    stream.add_turn("6 " + "y" * 1000)
+    assert stream.analysis(NOW).party_size == "6"
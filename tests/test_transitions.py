@@ -0,0 +1,79 @@
+"""
+Tests for the compiled conversation flow transitions in
+conversation_flow.transitions, checked against eval() of the condition
+strings.
+"""
+
+import random
+
+import pytest
+
+from conversation_flow.transitions import get_next_state, get_state_machine, get_transitions_from_state, transitions
+
+INTENTS = ["inquiry", "new_reservation", "modify_reservation", "cancel_reservation", None]
+FLAGS = [
+    "inquiry_complete", "reservation_confirmed", "modification_complete",
+    "cancellation_complete", "change_intent", "restart", "end_conversation"
+]
+
+def reference_next_state(current_state, context, attempt_count, user_response):
+    for transition in get_transitions_from_state(current_state):
+        variables = {"context": context, "attempt_count": attempt_count, "user_response": user_response}
+        if eval(transition["condition"], {"__builtins__": {}}, variables):
+            return transition["destination"]
+    return current_state
+
+@pytest.mark.parametrize("context,user_response,expected", [
+    ({}, None, "greeting"),
+    ({}, "", "greeting"),
+    ({}, "hello", "city_collection"),
+    ({"city": "bangalore"}, "hello", "city_collection"),
+    ({"city": "bangalore"}, None, "city_collection"),
+])
+def test_greeting(context, user_response, expected):
+    assert get_next_state("greeting", context, 0, user_response) == expected
+
+def test_user_response_is_required():
+    with pytest.raises(TypeError):
+        get_next_state("greeting", {}, 0)
+    with pytest.raises(TypeError):
+        get_state_machine().next_state("greeting", {}, 0)
+
+@pytest.mark.parametrize("state,context,attempts,expected", [
+    ("city_collection", {"city": "delhi"}, 0, "outlet_collection"),
+    ("city_collection", {}, 3, "fallback"),
+    ("city_collection", {}, 2, "city_collection"),
+    ("outlet_collection", {"city": "delhi", "outlet": "connaught_place"}, 0, "intent_identification"),
+    ("intent_identification", {"intent": "cancel_reservation"}, 0, "cancel_reservation"),
+    ("new_reservation", {"date": "x", "time": "x", "party_size": "x", "customer_name": "x"}, 0, "new_reservation"),
+    ("new_reservation", {"date": "x", "time": "x", "party_size": "x", "customer_name": "x", "phone_number": "x"}, 0,
+     "reservation_confirmation"),
+    ("information_inquiry", {"inquiry_complete": "yes"}, 0, "information_inquiry"),
+    ("information_inquiry", {"inquiry_complete": True}, 0, "farewell"),
+    ("fallback", {"restart": True, "end_conversation": True}, 0, "city_collection"),
+    ("fallback", {}, 3, "farewell"),
+    ("farewell", {}, 10, "farewell"),
+])
+def test_transitions(state, context, attempts, expected):
+    assert get_next_state(state, context, attempts, "ok") == expected
+
+def test_every_state_is_compiled():
+    sources = {transition["source"] for transition in transitions}
+    assert set(get_state_machine().tables) == sources
+    assert "farewell" in get_state_machine().states()
+
+def test_matches_eval_of_conditions():
+    rng = random.Random(3)
+    states = get_state_machine().states()
+    for _ in range(5000):
+        context = {}
+        for key in ("city", "outlet", "date", "time", "party_size", "customer_name", "phone_number"):
+            if rng.random() < 0.4:
+                context[key] = rng.choice(["x", ""])
+        if rng.random() < 0.5:
+            context["intent"] = rng.choice(INTENTS)
+        for flag in FLAGS:
+            if rng.random() < 0.15:
+                context[flag] = rng.choice([True, False, "yes"])
+        step = (rng.choice(states), context, rng.randint(0, 7), rng.choice([None, "", "hello"]))
+        assert get_next_state(*step) == reference_next_state(*step), step
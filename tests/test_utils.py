@@ -0,0 +1,120 @@
+"""Tests for the token counting and JSON serialization in knowledge_base.utils."""
+
+import json
+
+import pytest
+
+from knowledge_base.data import knowledge_base
+from knowledge_base.utils import (
+    clear_token_cache,
+    count_tokens,
+    dumps_json,
+    format_json_response,
+    format_menu_response,
+    format_outlet_response,
+    get_token_cache_stats,
+    get_tokenizer,
+    serialize_json_within_budget,
+)
+
+PAYLOADS = [
+    {},
+    [],
+    {"a": 1, "b": [1, 2, 3], "c": {"d": None, "e": True}},
+    [{"name": "Paneer Tikka", "veg": True}, [], {}, "naïve ₹800"],
+    {"nested": {"deeper": {"deepest": ["x", {"y": 1.5}]}}, 10: "int key"},
+    format_menu_response(knowledge_base["menu"]),
+    format_outlet_response(knowledge_base["bangalore"]["indiranagar"]),
+    format_outlet_response(knowledge_base["delhi"]["connaught_place"], "hours"),
+]
+
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_in_budget_matches_json_dumps(data):
+    """Payloads that fit come out exactly as format_json_response used to write them."""
+    expected = json.dumps(data, ensure_ascii=False, indent=2)
+    json_str, token_count = serialize_json_within_budget(data, 100000, indent=2)
+    assert json_str == expected
+    assert token_count == count_tokens(expected)
+
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_format_json_response_parity(data):
+    assert format_json_response(data, 100000) == serialize_json_within_budget(data, 100000)[0]
+
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_compact_matches_compact_json_dumps(data):
+    json_str, token_count = serialize_json_within_budget(data, 100000, indent=None)
+    assert json_str == json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    assert token_count == count_tokens(json_str)
+
+@pytest.mark.parametrize("indent", [2, None])
+@pytest.mark.parametrize("budget", [5, 20, 50, 120])
+def test_over_budget_is_valid_json_within_budget(indent, budget):
+    data = {category: items for category, items in knowledge_base["menu"].items()}
+    json_str, token_count = serialize_json_within_budget(data, budget, indent=indent)
+    parsed = json.loads(json_str)
+    assert isinstance(parsed, dict)
+    assert token_count == count_tokens(json_str)
+    assert token_count <= budget
+    # Whatever was kept is a prefix of the original keys
+    assert list(parsed) == list(data)[:len(parsed)]
+
+def test_over_budget_list_marks_truncation():
+    data = [f"item number {i}" for i in range(200)]
+    json_str, _ = serialize_json_within_budget(data, 60, indent=2)
+    parsed = json.loads(json_str)
+    assert parsed[-1] == "..."
+    assert parsed[:-1] == data[:len(parsed) - 1]
+
+@pytest.mark.parametrize("data, empty", [({"a": 1}, "{}"), ([1, 2], "[]")])
+@pytest.mark.parametrize("indent", [2, None])
+def test_tiny_budget_returns_empty_container(data, empty, indent):
+    json_str, token_count = serialize_json_within_budget(data, 0, indent=indent)
+    assert json_str == empty
+    assert token_count == count_tokens(empty)
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    try:
+        return get_tokenizer()
+    except Exception as error:
+        pytest.skip(f"cl100k_base is not available: {error}")
+
+@pytest.mark.parametrize("indent", [2, None])
+@pytest.mark.parametrize("budget", [3, 8, 20, 45, 90, 200, 100000])
+@pytest.mark.parametrize("data", PAYLOADS + [
+    knowledge_base["menu"],
+    [f"item number {i}" for i in range(200)],
+    {"outlets": [knowledge_base["bangalore"], "skipped", {"x": "y" * 3000}], "tail": ["a", {"b": []}]},
+])
+def test_token_count_is_the_tokenizers(tokenizer, data, budget, indent):
+    """The count that comes back is the tokenizer's count of the output, also for cut short payloads."""
+    json_str, token_count = serialize_json_within_budget(data, budget, indent=indent)
+    json.loads(json_str)
+    assert token_count == len(tokenizer.encode(json_str))
+    assert token_count <= max(budget, 1)
+
+def test_token_counts_are_memoized():
+    clear_token_cache()
+    text = "What are the lunch timings on Saturday at Indiranagar?"
+    first = count_tokens(text)
+    assert count_tokens(text) == first
+    stats = get_token_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+    clear_token_cache()
+    stats = get_token_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (0, 0, 0)
+
+def test_token_cache_is_bounded():
+    clear_token_cache()
+    max_size = get_token_cache_stats()["max_size"]
+    for i in range(max_size + 10):
+        count_tokens(f"distinct text {i}")
+    assert get_token_cache_stats()["size"] == max_size
+
+@pytest.mark.parametrize("data", PAYLOADS[:4] + PAYLOADS[5:])
+def test_dumps_json_is_the_same_with_and_without_orjson(data, monkeypatch):
+    expected = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert dumps_json(data) == expected
+    monkeypatch.setattr("knowledge_base.utils.orjson", None)
+    assert dumps_json(data) == expected
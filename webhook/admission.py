@@ -0,0 +1,87 @@
+"""
+Webhook Admission Control
+
+This module limits how much webhook work runs at once, so a burst of events
+at peak hours is turned away with a retry hint instead of piling up behind
+call analysis and logging until requests time out.
+
+Each budget allows a bounded number of events in flight and a bounded number
+waiting for a slot. An event that finds the queue full is rejected straight
+away (429), and one that waits longer than the queue timeout gives up (503);
+both tell Retell when to retry. Cheap events such as call_started get their
+own budget, so they are still acknowledged while expensive ones queue.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+class Overloaded(Exception):
+    """Raised when a budget has no room for another event."""
+
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionBudget:
+    """Bounded in-flight and queued event limits for one class of webhook events."""
+
+    def __init__(self, name: str, max_in_flight: int, max_queued: int, queue_timeout: float = 10.0, retry_after: int = 5):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block, waiting in the queue if needed.
+
+        Raises Overloaded with status 429 if the queue is full, or 503 if no
+        slot freed up within the queue timeout.
+        """
+        # Only queue when every slot is taken
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise Overloaded(429, self.retry_after, f"Too many {self.name} events queued")
+            self.queued += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                waited = time.monotonic() - started
+                raise Overloaded(503, self.retry_after, f"Timed out after {waited:.1f}s waiting for a {self.name} slot")
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
@@ -4,18 +4,54 @@ Webhook API
 This module implements the FastAPI endpoints for Retell webhooks.
 """
 
-from fastapi import FastAPI, Request, HTTPException, Body
+from fastapi import FastAPI, Request, HTTPException, Body, Query
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
 import json
 import os
 from dotenv import load_dotenv
+from common.executor import run_blocking, executor_stats
+from common.logs import RequestIdMiddleware, get_logger, logging_stats
 
 # Import local modules
-from .google_sheets import log_call_to_sheets
+from .google_sheets import (
+    queue_call_to_sheets, update_queued_call, get_sheets_writer, get_worksheet, build_call_record,
+    retell_analysis_fields
+)
+from .call_store import get_call_store, detect_outlet, normalize_outlet
+from .dedup import SeenEvents
+from .streaming import LiveCalls, parse_webhook_event, peek_event_type
+from .admission import AdmissionBudget, Overloaded
 
 # Load environment variables
 load_dotenv()
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "3600"))
+WEBHOOK_DEDUP_MAX_SIZE = int(os.getenv("WEBHOOK_DEDUP_MAX_SIZE", "10000"))
+LIVE_CALL_TTL = float(os.getenv("LIVE_CALL_TTL", "900"))
+LIVE_CALL_MAX = int(os.getenv("LIVE_CALL_MAX", "1000"))
+WEBHOOK_CHEAP_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_CHEAP_MAX_IN_FLIGHT", "64"))
+WEBHOOK_CHEAP_MAX_QUEUED = int(os.getenv("WEBHOOK_CHEAP_MAX_QUEUED", "256"))
+WEBHOOK_EXPENSIVE_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_EXPENSIVE_MAX_IN_FLIGHT", "8"))
+WEBHOOK_EXPENSIVE_MAX_QUEUED = int(os.getenv("WEBHOOK_EXPENSIVE_MAX_QUEUED", "32"))
+WEBHOOK_QUEUE_TIMEOUT = float(os.getenv("WEBHOOK_QUEUE_TIMEOUT", "10"))
+WEBHOOK_RETRY_AFTER = int(os.getenv("WEBHOOK_RETRY_AFTER", "5"))
+
+# Events already processed, keyed on (call ID, event type)
+SEEN_EVENTS = SeenEvents(WEBHOOK_DEDUP_TTL, WEBHOOK_DEDUP_MAX_SIZE)
+
+# Transcript streams of calls in progress, fed by "turn" events
+LIVE_CALLS = LiveCalls(LIVE_CALL_TTL, LIVE_CALL_MAX)
+
+# Separate limits for events that are acknowledged straight away and events
+# that are analyzed and logged, so a backlog of the latter doesn't hold up
+# the former
+CHEAP_EVENTS = {"call_started", "turn"}
+CHEAP_BUDGET = AdmissionBudget(
+    "cheap", WEBHOOK_CHEAP_MAX_IN_FLIGHT, WEBHOOK_CHEAP_MAX_QUEUED, WEBHOOK_QUEUE_TIMEOUT, WEBHOOK_RETRY_AFTER
+)
+EXPENSIVE_BUDGET = AdmissionBudget(
+    "expensive", WEBHOOK_EXPENSIVE_MAX_IN_FLIGHT, WEBHOOK_EXPENSIVE_MAX_QUEUED, WEBHOOK_QUEUE_TIMEOUT, WEBHOOK_RETRY_AFTER
+)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -23,45 +59,187 @@ app = FastAPI(
     description="API for handling Retell webhooks and post-call logging",
     version="1.0.0"
 )
+app.add_middleware(RequestIdMiddleware)
+log = get_logger("webhook.api")
 
 # Define webhook event types
 class WebhookEvent(BaseModel):
     event_type: str
     payload: Dict[str, Any]
 
+class SheetsQueueError(Exception):
+    """A call's spreadsheet row could not be queued or updated."""
+
+def record_call(call_data, event_type, analysis=None):
+    """
+    Analyze a call, keep it in the local call store and queue it for Google Sheets.
+    
+    Each (call ID, event type) is handled once, even across restarts. A call
+    that is already stored (call_analyzed after call_ended) has the new
+    event's fields merged into its record, and its spreadsheet row is
+    updated, so each call gets one row.
+    
+    The row is queued inside the call store's transaction: if that fails,
+    neither the record nor the event is kept and SheetsQueueError is raised,
+    so the handler answers with a 500 and Retell's retry is processed.
+    """
+    call_id = call_data.get("call_id")
+    transcript = call_data.get("transcript", "")
+    
+    try:
+        if call_id and get_call_store().has_event(call_id, event_type):
+            return {"status": "success", "message": "Duplicate event ignored"}
+        existing = get_call_store().get(call_id) if call_id else None
+    except Exception as e:
+        log.error("call_store_read_failed", call_id=call_id, error=str(e))
+        existing = None
+    
+    if existing is not None and (not transcript or transcript == existing["transcript"]):
+        # Nothing new to analyze, but the event may carry Retell's analysis
+        record = retell_analysis_fields(call_data.get("analysis"))
+    else:
+        record = build_call_record(call_data, analysis)
+    
+    def write_row(stored, is_new):
+        try:
+            if is_new:
+                result = queue_call_to_sheets(call_data, record)
+                if "error" in result:
+                    raise RuntimeError(result["error"])
+            else:
+                update_queued_call(call_id, stored)
+        except Exception as e:
+            raise SheetsQueueError(str(e)) from e
+    
+    try:
+        is_new = get_call_store().merge(dict(
+            record,
+            call_id=call_id,
+            outlet=normalize_outlet(call_data.get("outlet")) or detect_outlet(transcript),
+            transcript=transcript
+        ), event_type, write_row)
+    except SheetsQueueError:
+        raise
+    except Exception as e:
+        # The call store is down; the sheet still gets new calls
+        log.error("call_store_write_failed", call_id=call_id, error=str(e))
+        is_new = existing is None
+        if is_new:
+            write_row(record, True)
+    
+    if is_new:
+        return {"status": "success", "message": "Call queued for logging"}
+    return {"status": "success", "message": "Call record updated"}
+
+def overloaded_error(error: Overloaded) -> HTTPException:
+    """Turn a rejected event into a response telling the sender when to retry."""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
 @app.get("/")
 async def root():
     return {"message": "Barbeque Nation Webhook API"}
 
+@app.get("/stats")
+async def get_stats():
+    """Return Google Sheets queue, connection, call store and executor statistics for monitoring"""
+    return {
+        "sheets_writer": get_sheets_writer().stats(),
+        "sheets_connection": get_worksheet().stats(),
+        "stored_calls": get_call_store().count(),
+        "webhook_events": SEEN_EVENTS.stats(),
+        "live_calls": len(LIVE_CALLS),
+        "admission": {"cheap": CHEAP_BUDGET.stats(), "expensive": EXPENSIVE_BUDGET.stats()},
+        "executor": executor_stats(),
+        "logging": logging_stats()
+    }
+
 @app.post("/webhook")
-async def handle_webhook(event: WebhookEvent):
-    """Handle incoming webhook events from Retell."""
+async def handle_webhook(request: Request):
+    """
+    Handle incoming webhook events from Retell.
+    
+    The body is a WebhookEvent. It is parsed as it arrives, and the turns of
+    a call_ended payload are analyzed one by one instead of being decoded
+    into memory all at once.
+    
+    Events are admitted under the budget for their type, read from the start
+    of the body, or the expensive budget if it isn't there. When the budget
+    is used up the response is 429 or 503 with a Retry-After header.
+    """
+    peeked_type, chunks = await peek_event_type(request.stream())
+    budget = CHEAP_BUDGET if peeked_type in CHEAP_EVENTS else EXPENSIVE_BUDGET
+    try:
+        async with budget.admit():
+            # call_started is only acknowledged, so its body isn't even parsed
+            if peeked_type == "call_started":
+                log.sample("call_started")
+                return {"status": "success", "message": "Call started event received"}
+            return await process_webhook_event(chunks)
+    except Overloaded as e:
+        log.warning("webhook_rejected", event_type=peeked_type, status=e.status_code, reason=str(e))
+        raise overloaded_error(e)
+
+async def process_webhook_event(chunks):
+    """Parse and handle one admitted webhook event."""
+    try:
+        parsed = await parse_webhook_event(chunks)
+        event = WebhookEvent(**parsed.event)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     
     event_type = event.event_type
     payload = event.payload
     
+    # Acknowledge retried call events without processing them again. Turns
+    # can only be told apart by their index.
+    event_key = (payload.get("call_id"), event_type, payload.get("turn_index"))
+    deduplicate = event_type in ("call_ended", "call_analyzed") or (event_type == "turn" and event_key[2] is not None)
+    if deduplicate and event_key[0] is not None:
+        if not SEEN_EVENTS.add(event_key):
+            return {"status": "success", "message": "Duplicate event ignored"}
+    
     if event_type == "call_started":
-        # Just log call started event
-        print(f"Call started: {payload}")
+        # Nothing to do until the call ends
+        log.sample("call_started", call_id=payload.get("call_id"))
         return {"status": "success", "message": "Call started event received"}
     
+    elif event_type == "turn":
+        # Analyze a call in progress one turn at a time
+        if payload.get("call_id") is None:
+            raise HTTPException(status_code=422, detail="Turn events need a call_id")
+        stream = LIVE_CALLS.get(payload["call_id"])
+        stream.add_turn(payload.get("transcript", ""))
+        log.sample("turn", call_id=payload["call_id"], turns=stream.turns)
+        return {"status": "success", "turns": stream.turns, "analysis": stream.analysis()._asdict()}
+    
     elif event_type == "call_ended":
         # Process and log call data
         try:
-            # Extract call information
+            LIVE_CALLS.pop(payload.get("call_id"))
+            
+            # Extract call information; the turns were analyzed while parsing
             call_data = {
                 "modality": "Call",
+                "call_id": payload.get("call_id"),
+                "outlet": payload.get("outlet"),
                 "phone_number": payload.get("phone_number", "NA"),
-                "transcript": " ".join([turn.get("transcript", "") for turn in payload.get("turns", [])]),
+                "transcript": parsed.transcript or "",
             }
+            analysis = parsed.turns.analysis() if parsed.turns is not None else None
             
-            # Log call to Google Sheets
-            result = log_call_to_sheets(call_data)
+            # Store call locally and queue it for Google Sheets
+            result = await run_blocking(record_call, call_data, "call_ended", analysis)
             
             return result
         
         except Exception as e:
-            print(f"Error processing call_ended event: {e}")
+            log.exception("call_ended_failed", call_id=payload.get("call_id"), error=str(e))
+            # Let Retell's retry be processed
+            SEEN_EVENTS.discard(event_key)
             raise HTTPException(status_code=500, detail=str(e))
     
     elif event_type == "call_analyzed":
@@ -70,18 +248,22 @@ async def handle_webhook(event: WebhookEvent):
             # Extract call information
             call_data = {
                 "modality": "Call",
+                "call_id": payload.get("call_id"),
+                "outlet": payload.get("outlet"),
                 "phone_number": payload.get("phone_number", "NA"),
                 "transcript": payload.get("transcript", ""),
                 "analysis": payload.get("analysis", {})
             }
             
-            # Log call to Google Sheets
-            result = log_call_to_sheets(call_data)
+            # Store call locally and queue it for Google Sheets
+            result = await run_blocking(record_call, call_data, "call_analyzed")
             
             return result
         
         except Exception as e:
-            print(f"Error processing call_analyzed event: {e}")
+            log.exception("call_analyzed_failed", call_id=payload.get("call_id"), error=str(e))
+            # Let Retell's retry be processed
+            SEEN_EVENTS.discard(event_key)
             raise HTTPException(status_code=500, detail=str(e))
     
     else:
@@ -96,19 +278,80 @@ async def log_chatbot_conversation(
     Log chatbot conversation to Google Sheets.
     This endpoint is called when a chatbot conversation ends.
     """
+    try:
+        async with EXPENSIVE_BUDGET.admit():
+            return await process_chatbot_log(data)
+    except Overloaded as e:
+        log.warning("webhook_rejected", event_type="chatbot_log", status=e.status_code, reason=str(e))
+        raise overloaded_error(e)
+
+async def process_chatbot_log(data: Dict[str, Any]):
+    """Store and queue one admitted chatbot conversation."""
+    # Acknowledge retried logs without processing them again
+    event_key = (data.get("conversation_id"), "chatbot_log")
+    if event_key[0] is not None and not SEEN_EVENTS.add(event_key):
+        return {"status": "success", "message": "Duplicate event ignored"}
+    
     try:
         # Extract chatbot conversation information
         call_data = {
             "modality": "Chatbot",
+            "call_id": data.get("conversation_id"),
+            "outlet": data.get("outlet"),
             "phone_number": data.get("phone_number", "NA"),
             "transcript": data.get("transcript", "")
         }
         
-        # Log chatbot conversation to Google Sheets
-        result = log_call_to_sheets(call_data)
+        # Store chatbot conversation locally and queue it for Google Sheets
+        result = await run_blocking(record_call, call_data, "chatbot_log")
         
         return result
     
     except Exception as e:
-        print(f"Error logging chatbot conversation: {e}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        log.exception("chatbot_log_failed", conversation_id=data.get("conversation_id"), error=str(e))
+        SEEN_EVENTS.discard(event_key)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/calls")
+async def list_calls(
+    phone_number: Optional[str] = None,
+    outcome: Optional[str] = None,
+    booking_date: Optional[str] = None,
+    booking_date_from: Optional[str] = None,
+    booking_date_to: Optional[str] = None,
+    outlet: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = None,
+    include_transcript: bool = False
+):
+    """
+    Page through stored calls, newest first.
+    For example ?outcome=Availability&booking_date=saturday&outlet=indiranagar
+    lists this Saturday's bookings at Indiranagar. Pass next_cursor back as
+    cursor to get the next page.
+    """
+    calls, next_cursor = await run_blocking(
+        get_call_store().query,
+        phone_number=phone_number,
+        outcome=outcome,
+        booking_date=booking_date,
+        booking_date_from=booking_date_from,
+        booking_date_to=booking_date_to,
+        outlet=outlet,
+        since=since,
+        until=until,
+        limit=limit,
+        cursor=cursor,
+        include_transcript=include_transcript
+    )
+    return {"calls": calls, "next_cursor": next_cursor}
+
+@app.get("/calls/{call_id}")
+async def get_call(call_id: str):
+    """Return the stored record for a call ID."""
+    call = await run_blocking(get_call_store().get, call_id)
+    if call is None:
+        raise HTTPException(status_code=404, detail=f"Call '{call_id}' not found")
+    return call
@@ -0,0 +1,271 @@
+"""
+Call Store
+
+This module keeps every logged call and chatbot conversation in a local
+SQLite database, so call analytics can be answered with indexed queries
+instead of downloading the whole Google Sheet.
+
+Calls are indexed by call time, phone number, outcome and booking date (with
+the outlet), and every query pages through results newest first with a
+keyset cursor, so no page needs a full scan or an OFFSET.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from .transcript_analyzer import WEEKDAYS, next_weekday
+
+# Load environment variables
+load_dotenv()
+DATA_DIR = os.getenv("DATA_DIR", "data")
+CALL_STORE_PATH = os.getenv("CALL_STORE_PATH", os.path.join(DATA_DIR, "calls.db"))
+
+STORE_FIELDS = [
+    "call_id",
+    "modality",
+    "call_time",
+    "phone_number",
+    "outcome",
+    "booking_date",
+    "booking_time",
+    "customer_name",
+    "party_size",
+    "outlet",
+    "summary",
+    "transcript"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_id TEXT,
+    modality TEXT NOT NULL,
+    call_time TEXT NOT NULL,
+    phone_number TEXT,
+    outcome TEXT,
+    booking_date TEXT,
+    booking_time TEXT,
+    customer_name TEXT,
+    party_size TEXT,
+    outlet TEXT,
+    summary TEXT,
+    transcript TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_calls_call_time ON calls (call_time);
+CREATE INDEX IF NOT EXISTS idx_calls_phone_number ON calls (phone_number);
+CREATE INDEX IF NOT EXISTS idx_calls_outcome ON calls (outcome);
+CREATE INDEX IF NOT EXISTS idx_calls_booking ON calls (booking_date, outlet);
+CREATE INDEX IF NOT EXISTS idx_calls_call_id ON calls (call_id);
+CREATE TABLE IF NOT EXISTS call_events (
+    call_id TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    PRIMARY KEY (call_id, event_type)
+);
+"""
+
+_outlet_pattern = None
+
+def detect_outlet(transcript: str) -> Optional[str]:
+    """Return the knowledge base key of the first outlet named in a transcript."""
+    global _outlet_pattern
+    if _outlet_pattern is None:
+        from knowledge_base.data import knowledge_base
+        names = {
+            outlet.replace("_", " "): outlet
+            for city, outlets in knowledge_base.items() if city != "menu"
+            for outlet in outlets
+        }
+        _outlet_pattern = (re.compile("|".join(sorted(map(re.escape, names), key=len, reverse=True))), names)
+    pattern, names = _outlet_pattern
+    match = pattern.search(transcript.lower().replace("_", " "))
+    return names[match.group()] if match else None
+
+def normalize_outlet(outlet: Optional[str]) -> Optional[str]:
+    """Turn "JP Nagar" into the knowledge base key "jp_nagar"."""
+    return outlet.strip().lower().replace(" ", "_") if outlet else None
+
+def resolve_date(value: Optional[str], today: Optional[date] = None) -> Optional[str]:
+    """
+    Resolve "today", "tomorrow" or a weekday name to a YYYY-MM-DD date.
+
+    Weekdays mean the next such day, counting today. Anything else is
+    returned unchanged.
+    """
+    if not value:
+        return None
+    today = today or date.today()
+    word = value.strip().lower()
+    if word == "today":
+        return today.isoformat()
+    if word == "tomorrow":
+        return (today + timedelta(days=1)).isoformat()
+    if word in WEEKDAYS:
+        return next_weekday(word, today).isoformat()
+    return value
+
+class CallStore:
+    """SQLite store of call records with indexed, paged queries."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> int:
+        """Insert a call record and return its row id."""
+        with self._lock:
+            with self._db:
+                return self._insert(record)
+
+    def _insert(self, record: Dict[str, Any]) -> int:
+        cursor = self._db.execute(
+            f"INSERT INTO calls ({', '.join(STORE_FIELDS)}) VALUES ({', '.join('?' * len(STORE_FIELDS))})",
+            [record.get(field) for field in STORE_FIELDS]
+        )
+        return cursor.lastrowid
+
+    def merge(
+        self,
+        record: Dict[str, Any],
+        event_type: Optional[str] = None,
+        then: Optional[Callable[[Dict[str, Any], bool], None]] = None
+    ) -> bool:
+        """
+        Store a call record, merging it into the existing record for its call ID.
+
+        Retell reports a call in both call_ended and call_analyzed; the second
+        fills in what the first was missing instead of adding a row. Fields
+        the new record leaves empty or "NA" keep their stored values, and the
+        call time and modality are never changed. Returns True if the record
+        was new.
+
+        The event type, if given, is recorded with the merge so that
+        has_event can tell a retried event apart, even after a restart.
+
+        ``then``, if given, is called with the merged record and whether it
+        is new before anything is committed. If it raises, the merge and the
+        event are rolled back and the error is passed on, so the event is
+        handled again when it is retried.
+        """
+        call_id = record.get("call_id")
+        with self._lock:
+            row = None
+            if call_id is not None:
+                row = self._db.execute(
+                    "SELECT id FROM calls WHERE call_id = ? ORDER BY id DESC LIMIT 1", (call_id,)
+                ).fetchone()
+            with self._db:
+                if call_id is not None and event_type is not None:
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO call_events (call_id, event_type) VALUES (?, ?)",
+                        (call_id, event_type)
+                    )
+                if row is None:
+                    self._insert(record)
+                    if then is not None:
+                        then(record, True)
+                    return True
+
+                updates = {
+                    field: record[field] for field in STORE_FIELDS
+                    if field not in ("call_id", "call_time", "modality") and record.get(field) not in (None, "", "NA")
+                }
+                if updates:
+                    self._db.execute(
+                        f"UPDATE calls SET {', '.join(f'{field} = ?' for field in updates)} WHERE id = ?",
+                        list(updates.values()) + [row["id"]]
+                    )
+                if then is not None:
+                    then(dict(self._db.execute("SELECT * FROM calls WHERE id = ?", (row["id"],)).fetchone()), False)
+                return False
+
+    def has_event(self, call_id: str, event_type: str) -> bool:
+        """Return True if this event has already been merged for the call."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM call_events WHERE call_id = ? AND event_type = ?", (call_id, event_type)
+            ).fetchone() is not None
+
+    def get(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """Return the latest record for a call ID."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM calls WHERE call_id = ? ORDER BY id DESC LIMIT 1", (call_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def query(
+        self,
+        phone_number: Optional[str] = None,
+        outcome: Optional[str] = None,
+        booking_date: Optional[str] = None,
+        booking_date_from: Optional[str] = None,
+        booking_date_to: Optional[str] = None,
+        outlet: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None,
+        include_transcript: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return one page of matching calls, newest first, and the next cursor.
+
+        Dates are YYYY-MM-DD (booking dates also accept "today", "tomorrow"
+        and weekday names) and call times compare as "YYYY-MM-DD HH:MM:SS"
+        strings. Pass the returned cursor back to get the next page; it is
+        None on the last page.
+        """
+        conditions = []
+        params: List[Any] = []
+        for column, operator, value in (
+            ("phone_number", "=", phone_number),
+            ("outcome", "=", outcome),
+            ("booking_date", "=", resolve_date(booking_date)),
+            ("booking_date", ">=", resolve_date(booking_date_from)),
+            ("booking_date", "<=", resolve_date(booking_date_to)),
+            ("outlet", "=", normalize_outlet(outlet)),
+            ("call_time", ">=", since),
+            ("call_time", "<=", until),
+            ("id", "<", cursor)
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+
+        columns = ["id"] + [field for field in STORE_FIELDS if include_transcript or field != "transcript"]
+        sql = f"SELECT {', '.join(columns)} FROM calls"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # Fetch one extra row to know whether there is another page
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = [dict(row) for row in self._db.execute(sql, params)]
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+
+_call_store = None
+_call_store_lock = threading.Lock()
+
+def get_call_store() -> CallStore:
+    """Return the process-wide call store, opening it on first use."""
+    global _call_store
+    with _call_store_lock:
+        if _call_store is None:
+            _call_store = CallStore(CALL_STORE_PATH)
+        return _call_store
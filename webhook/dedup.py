@@ -0,0 +1,58 @@
+"""
+Webhook Deduplication
+
+This module remembers which webhook events have already been processed, so
+events that Retell retries are acknowledged without being analyzed or logged
+again.
+
+Events are keyed on the call ID and event type and kept for a limited time in
+a bounded, insertion-ordered set, so memory stays flat however many calls
+come in. Duplicates that arrive after an event has expired, or after a
+restart, are caught by the call store instead (see CallStore.has_event).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+class SeenEvents:
+    """Bounded set of recently processed event keys that expire after a TTL."""
+
+    def __init__(self, ttl: float = 3600.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def add(self, key: Hashable) -> bool:
+        """
+        Mark an event as seen.
+
+        Returns False if it was already seen and has not expired, in which
+        case it should be skipped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Keys are in insertion order, so expired ones are at the front
+            while self._seen:
+                oldest, added = next(iter(self._seen.items()))
+                if now - added < self.ttl and len(self._seen) < self.max_size:
+                    break
+                del self._seen[oldest]
+
+            if key in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[key] = now
+            return True
+
+    def discard(self, key: Hashable):
+        """Forget an event, e.g. because processing it failed and it should be retried."""
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tracked": len(self._seen), "duplicates": self.duplicates}
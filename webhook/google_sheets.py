@@ -6,18 +6,27 @@ This module handles the integration with Google Sheets API for post-call logging
 
 import os
 import json
+import threading
 from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-import gspread
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
+from common.logs import get_logger
+
+# Import local modules
+from .transcript_analyzer import analyze_transcript, next_weekday
 
 # Load environment variables
 load_dotenv()
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
 GOOGLE_SERVICE_ACCOUNT_EMAIL = os.getenv("GOOGLE_SERVICE_ACCOUNT_EMAIL")
 GOOGLE_PRIVATE_KEY = os.getenv("GOOGLE_PRIVATE_KEY", "").replace("\\n", "\n")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SHEETS_QUEUE_PATH = os.getenv("SHEETS_QUEUE_PATH", os.path.join(DATA_DIR, "sheets_queue.db"))
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "50"))
+SHEETS_FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "5"))
+SHEETS_MAX_BACKOFF = float(os.getenv("SHEETS_MAX_BACKOFF", "300"))
+
+log = get_logger("webhook.google_sheets")
 
 # Define spreadsheet columns
 COLUMNS = [
@@ -32,33 +41,66 @@ COLUMNS = [
     "Call Summary"
 ]
 
-def init_google_sheets_client():
+# Call record keys, in COLUMNS order
+RECORD_FIELDS = [
+    "modality",
+    "call_time",
+    "phone_number",
+    "outcome",
+    "booking_date",
+    "booking_time",
+    "customer_name",
+    "party_size",
+    "summary"
+]
+
+def import_google_clients():
+    """Import the Google client libraries, which are slow to load."""
+    from google.oauth2.service_account import Credentials
+    import gspread
+    return Credentials, gspread
+
+def warm_up():
+    """Preload the Google client libraries ahead of the first logged call."""
+    try:
+        import_google_clients()
+    except ImportError as e:
+        log.error("sheets_import_failed", error=str(e))
+
+def create_credentials():
+    """Create the service account credentials for the Sheets API."""
+    # Imported here so the webhook app starts without loading them
+    Credentials, _ = import_google_clients()
+    
+    # Create credentials
+    scopes = ['https://www.googleapis.com/auth/spreadsheets']
+    credentials = {
+        "type": "service_account",
+        "project_id": "bbq-nation-chatbot",
+        "private_key_id": "private_key_id",
+        "private_key": GOOGLE_PRIVATE_KEY,
+        "client_email": GOOGLE_SERVICE_ACCOUNT_EMAIL,
+        "client_id": "client_id",
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{GOOGLE_SERVICE_ACCOUNT_EMAIL}"
+    }
+    
+    # Create a Credentials object
+    return Credentials.from_service_account_info(credentials, scopes=scopes)
+
+def init_google_sheets_client(creds=None):
     """Initialize the Google Sheets client."""
     try:
-        # Create credentials
-        scopes = ['https://www.googleapis.com/auth/spreadsheets']
-        credentials = {
-            "type": "service_account",
-            "project_id": "bbq-nation-chatbot",
-            "private_key_id": "private_key_id",
-            "private_key": GOOGLE_PRIVATE_KEY,
-            "client_email": GOOGLE_SERVICE_ACCOUNT_EMAIL,
-            "client_id": "client_id",
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{GOOGLE_SERVICE_ACCOUNT_EMAIL}"
-        }
-        
-        # Create a Credentials object
-        creds = Credentials.from_service_account_info(credentials, scopes=scopes)
+        _, gspread = import_google_clients()
         
         # Create gspread client
-        client = gspread.authorize(creds)
+        client = gspread.authorize(creds or create_credentials())
         
         return client
     except Exception as e:
-        print(f"Error initializing Google Sheets client: {e}")
+        log.error("sheets_client_failed", error=str(e))
         return None
 
 def get_call_outcome(transcript):
@@ -112,9 +154,14 @@ def extract_booking_date(transcript):
     if "today" in transcript.lower():
         return datetime.now().strftime("%Y-%m-%d")
     elif "tomorrow" in transcript.lower():
-        tomorrow = datetime.now() + datetime.timedelta(days=1)
+        tomorrow = datetime.now() + timedelta(days=1)
         return tomorrow.strftime("%Y-%m-%d")
     
+    # Then a weekday name, meaning the next such day
+    weekday = re.search(r'(?:mon|tues|wednes|thurs|fri|satur|sun)day', transcript.lower())
+    if weekday:
+        return next_weekday(weekday.group(), datetime.now().date()).isoformat()
+    
     return "NA"
 
 def extract_booking_time(transcript):
@@ -233,64 +280,254 @@ def generate_call_summary(transcript, outcome, date, time, party_size):
     
     return summary
 
-def log_call_to_sheets(call_data):
+def build_call_record(call_data, analysis=None):
     """
-    Log call data to Google Sheets.
+    Analyze a call into a record keyed by RECORD_FIELDS.
     
     call_data should be a dictionary with:
     - modality: "Call" or "Chatbot"
     - phone_number: Customer's phone number
     - transcript: Full call transcript
+    - analysis: Retell's post-call analysis, if any (optional)
+    
+    Pass the transcript's analysis if it is already known, e.g. from a
+    TranscriptStream. Fields from Retell's analysis take precedence over the
+    ones extracted from the transcript.
+    """
+    # Process the call data
+    modality = call_data.get("modality", "Call")
+    phone_number = call_data.get("phone_number", "NA")
+    transcript = call_data.get("transcript", "")
+    call_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Determine outcome, booking details and summary in one pass
+    analysis = analysis or analyze_transcript(transcript)
+    
+    record = {
+        "modality": modality,
+        "call_time": call_time,
+        "phone_number": phone_number,
+        "outcome": analysis.outcome,
+        "booking_date": analysis.booking_date,
+        "booking_time": analysis.booking_time,
+        "customer_name": analysis.customer_name,
+        "party_size": analysis.party_size,
+        "summary": analysis.summary
+    }
+    record.update(retell_analysis_fields(call_data.get("analysis")))
+    return record
+
+def retell_analysis_fields(analysis):
+    """
+    Map Retell's post-call analysis onto RECORD_FIELDS.
+    
+    The call summary becomes the summary, and keys named after a record field,
+    at the top level or in custom_analysis_data, fill in that field. Empty
+    and "NA" values are left out.
+    """
+    if not isinstance(analysis, dict):
+        return {}
+    custom = analysis.get("custom_analysis_data")
+    sources = [{"summary": analysis.get("call_summary")}, analysis, custom if isinstance(custom, dict) else {}]
+    return {
+        field: str(source[field])
+        for source in sources
+        for field in RECORD_FIELDS
+        if field not in ("modality", "call_time", "phone_number") and source.get(field) not in (None, "", "NA")
+    }
+
+def build_call_row(call_data, record=None):
+    """Build the spreadsheet row for a call, in COLUMNS order."""
+    record = record or build_call_record(call_data)
+    return [record[field] for field in RECORD_FIELDS]
+
+def connect_worksheet():
+    """Authorize a new client and open the worksheet that call rows are appended to."""
+    creds = create_credentials()
+    client = init_google_sheets_client(creds)
+    if not client:
+        raise RuntimeError("Failed to initialize Google Sheets client")
+    return creds, client.open_by_key(GOOGLE_SHEET_ID).sheet1
+
+def failed_before_sending(error):
+    """Return True if a request failed while connecting, so Sheets never saw it."""
+    from requests.exceptions import ConnectTimeout, ConnectionError as RequestsConnectionError
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(error, (ConnectTimeout, ConnectionRefusedError, NewConnectionError)):
+        return True
+    # requests wraps DNS failures and refused connections in a MaxRetryError
+    if isinstance(error, RequestsConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+def needs_reconnect(error):
+    """Return True for errors that a fresh client and worksheet could fix, and that are safe to retry at once."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    # 401/403/404 mean the token or the sheet handle went stale. Without a
+    # status only a connection that failed before the request was sent is
+    # retried: a read timeout or a reset may come after Sheets applied the
+    # append. Those, like quota and server errors, are left to the caller.
+    if status is not None:
+        return status in (401, 403, 404)
+    return failed_before_sending(error)
+
+class WorksheetHandle:
+    """
+    Process-wide gspread client and worksheet, shared by every request.
+    
+    The connection is opened lazily on first use, under a lock, so appends
+    cost a single API call. An expired access token is refreshed before use,
+    and an append that fails with an auth error, or before it was sent, drops
+    the connection, reconnects and is retried once.
+    """
+    
+    def __init__(self, connect):
+        self.connect = connect
+        self.credentials = None
+        self.worksheet = None
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reconnects = 0
+        self.token_refreshes = 0
+        self.errors = 0
+        self.last_error = None
+    
+    def get(self):
+        """Return the open worksheet, connecting or refreshing the token first if needed."""
+        with self._lock:
+            if self.worksheet is None:
+                self.credentials, self.worksheet = self.connect()
+                self.connects += 1
+            elif getattr(self.credentials, "expired", False):
+                from google.auth.transport.requests import Request
+                self.credentials.refresh(Request())
+                self.token_refreshes += 1
+            return self.worksheet
+    
+    def reset(self):
+        """Drop the connection so the next use reconnects."""
+        with self._lock:
+            self.credentials = None
+            self.worksheet = None
+    
+    def _call(self, method, *args):
+        try:
+            return getattr(self.get(), method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            if not needs_reconnect(e):
+                raise
+            log.warning("sheets_reconnecting", error=str(e))
+            self.reset()
+            self.reconnects += 1
+            return getattr(self.get(), method)(*args)
+    
+    def append_row(self, row):
+        """Append a single row."""
+        return self._call("append_row", row)
+    
+    def append_rows(self, rows):
+        """Append several rows in one API call."""
+        return self._call("append_rows", rows)
+    
+    def batch_update(self, data):
+        """Write values to several ranges in one API call."""
+        return self._call("batch_update", data)
+    
+    def stats(self):
+        """Return how often the connection was opened, refreshed and recreated."""
+        return {
+            "connected": self.worksheet is not None,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "token_refreshes": self.token_refreshes,
+            "errors": self.errors,
+            "last_error": self.last_error
+        }
+
+# Shared by the queued writer and direct logging
+WORKSHEET = WorksheetHandle(connect_worksheet)
+
+def get_worksheet():
+    """Return the shared worksheet handle."""
+    return WORKSHEET
+
+def log_call_to_sheets(call_data):
+    """
+    Log call data to Google Sheets immediately, bypassing the queue.
+    
+    See build_call_record for the expected call_data fields.
     """
     try:
-        # Initialize Google Sheets client
-        client = init_google_sheets_client()
-        if not client:
-            return {"error": "Failed to initialize Google Sheets client"}
-        
-        # Open the spreadsheet
-        sheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
-        
-        # Process the call data
-        modality = call_data.get("modality", "Call")
-        phone_number = call_data.get("phone_number", "NA")
-        transcript = call_data.get("transcript", "")
-        call_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Determine call outcome
-        outcome = get_call_outcome(transcript)
-        
-        # Extract booking details
-        booking_date = extract_booking_date(transcript)
-        booking_time = extract_booking_time(transcript)
-        party_size = extract_party_size(transcript)
-        customer_name = extract_customer_name(transcript)
-        
-        # Generate call summary
-        call_summary = generate_call_summary(transcript, outcome, booking_date, booking_time, party_size)
-        
-        # Prepare row data
-        row_data = [
-            modality,
-            call_time,
-            phone_number,
-            outcome,
-            booking_date,
-            booking_time,
-            customer_name,
-            party_size,
-            call_summary
-        ]
-        
         # Append row to spreadsheet
-        sheet.append_row(row_data)
+        get_worksheet().append_row(build_call_row(call_data))
         
         return {"status": "success", "message": "Call logged successfully"}
     
     except Exception as e:
-        print(f"Error logging call to Google Sheets: {e}")
+        log.error("sheets_log_failed", call_id=call_data.get("call_id"), error=str(e))
         return {"error": str(e)}
 
+_sheets_writer = None
+_sheets_writer_lock = threading.Lock()
+
+def get_sheets_writer():
+    """Return the process-wide queued writer, starting it on first use."""
+    global _sheets_writer
+    with _sheets_writer_lock:
+        if _sheets_writer is None:
+            from .sheets_writer import SheetsWriter
+            _sheets_writer = SheetsWriter(
+                SHEETS_QUEUE_PATH,
+                get_worksheet,
+                batch_size=SHEETS_BATCH_SIZE,
+                flush_interval=SHEETS_FLUSH_INTERVAL,
+                max_backoff=SHEETS_MAX_BACKOFF
+            )
+            _sheets_writer.start()
+        return _sheets_writer
+
+def stop_sheets_writer():
+    """Flush queued rows and stop the writer, if it was started."""
+    global _sheets_writer
+    with _sheets_writer_lock:
+        if _sheets_writer is not None:
+            _sheets_writer.stop()
+            _sheets_writer = None
+
+def queue_call_to_sheets(call_data, record=None):
+    """
+    Queue call data for a batched append to Google Sheets.
+    
+    The row is stored in the local queue before this returns, so it is
+    written even if the process restarts before the next flush. Pass a
+    record from build_call_record to avoid analyzing the call again.
+    """
+    try:
+        get_sheets_writer().enqueue(build_call_row(call_data, record), call_data.get("call_id"))
+        
+        return {"status": "success", "message": "Call queued for logging"}
+    
+    except Exception as e:
+        log.error("sheets_queue_failed", call_id=call_data.get("call_id"), error=str(e))
+        return {"error": str(e)}
+
+def update_queued_call(call_id, record):
+    """
+    Replace a call's row with its updated record, queued or already written.
+    
+    Returns False if the row was written somewhere the writer doesn't know,
+    in which case only the call store has the update. Errors from the queue
+    are logged and raised.
+    """
+    try:
+        return get_sheets_writer().replace(call_id, build_call_row({}, record))
+    
+    except Exception as e:
+        log.error("sheets_update_failed", call_id=call_id, error=str(e))
+        raise
+
 # Example usage
 if __name__ == "__main__":
     # Test with a sample call
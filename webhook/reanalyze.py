@@ -0,0 +1,225 @@
+"""
+Bulk Transcript Re-analysis
+
+This script re-runs the post-call extraction (outcome, booking date and time,
+party size, customer name and summary) over stored transcripts, for example
+after the rules in transcript_analyzer.py change.
+
+Transcripts are streamed from JSONL or CSV files in chunks, analyzed in a
+process pool and written out in order, either to a CSV file or, when pyarrow
+is installed, to a directory of Parquet part files. Memory stays bounded by
+the chunk size and the number of chunks in flight. Progress is checkpointed
+after every chunk, so an interrupted run picks up where it stopped when
+started again with the same arguments. The checkpoint is removed once a run
+finishes, so running it again starts over.
+
+Usage: python -m webhook.reanalyze calls.jsonl [more.csv ...] -o results.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .transcript_analyzer import TranscriptAnalysis, analyze_transcript
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+OUTPUT_COLUMNS = ["call_id"] + list(TranscriptAnalysis._fields)
+
+# Transcripts can be far longer than the csv module's default field limit
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+Record = Tuple[str, str, Optional[str]]
+
+def read_records(path: str, id_field: str, transcript_field: str, time_field: str) -> Iterator[Record]:
+    """Yield ``(call_id, transcript, call_time)`` from a JSONL or CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows: Iterable[Dict] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            call_id = row.get(id_field) or f"{os.path.basename(path)}:{index}"
+            yield str(call_id), row.get(transcript_field) or "", row.get(time_field) or None
+
+def parse_call_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse a stored call time, used as the reference for "today" and "tomorrow"."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def analyze_chunk(records: List[Record]) -> List[List[str]]:
+    """Analyze one chunk of records; runs in a worker process."""
+    return [
+        [call_id] + list(analyze_transcript(transcript, parse_call_time(call_time)))
+        for call_id, transcript, call_time in records
+    ]
+
+def chunked(records: Iterator[Record], size: int) -> Iterator[List[Record]]:
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+class CSVOutput:
+    """Single CSV file, truncated back to the last checkpoint on resume."""
+
+    def __init__(self, path: str, resume_bytes: Optional[int]):
+        self.path = path
+        if resume_bytes is None:
+            self.file = open(path, "w", newline="", encoding="utf-8")
+            csv.writer(self.file).writerow(OUTPUT_COLUMNS)
+        else:
+            self.file = open(path, "r+", newline="", encoding="utf-8")
+            # Drop rows written after the last checkpoint
+            self.file.truncate(resume_bytes)
+            self.file.seek(resume_bytes)
+        self.writer = csv.writer(self.file)
+
+    def write(self, rows: List[List[str]]):
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def position(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+class ParquetOutput:
+    """Directory of Parquet files, one per chunk, named in input order."""
+
+    def __init__(self, path: str, resume_parts: Optional[int]):
+        if pyarrow is None:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = resume_parts or 0
+
+    def write(self, rows: List[List[str]]):
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(OUTPUT_COLUMNS)}
+        part = os.path.join(self.path, f"part-{self.parts:06d}.parquet")
+        pyarrow.parquet.write_table(pyarrow.table(columns), part)
+        self.parts += 1
+
+    def position(self) -> int:
+        return self.parts
+
+    def close(self):
+        pass
+
+def load_checkpoint(path: str, run: Dict) -> Optional[Dict]:
+    """
+    Return the saved progress for this exact run, if any.
+
+    ``run`` holds the inputs, output and format; the saved position is a
+    byte offset for CSV and a part count for Parquet, so all three must match.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if any(checkpoint.get(key) != value for key, value in run.items()):
+        raise SystemExit(f"Checkpoint {path} belongs to a different run; remove it to start over")
+    return checkpoint
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="JSONL or CSV files with one transcript per record")
+    parser.add_argument("-o", "--output", required=True, help="CSV file, or directory for --format parquet")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", help="Progress file (default: <output>.checkpoint)")
+    parser.add_argument("--id-field", default="call_id")
+    parser.add_argument("--transcript-field", default="transcript")
+    parser.add_argument("--time-field", default="call_time")
+    args = parser.parse_args(argv)
+
+    output_path = os.path.abspath(args.output)
+    run = {
+        "inputs": [os.path.abspath(path) for path in args.inputs],
+        "output": output_path,
+        "format": args.format
+    }
+    checkpoint_path = args.checkpoint or output_path.rstrip(os.sep) + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path, run)
+
+    done = checkpoint["records"] if checkpoint else 0
+    position = checkpoint["position"] if checkpoint else None
+    if args.format == "csv":
+        output = CSVOutput(output_path, position)
+    else:
+        output = ParquetOutput(output_path, position)
+    if done:
+        print(f"Resuming after {done} records")
+
+    records = (
+        record
+        for path in run["inputs"]
+        for record in read_records(path, args.id_field, args.transcript_field, args.time_field)
+    )
+    chunks = chunked(islice(records, done, None), args.chunk_size)
+
+    start = time.perf_counter()
+    processed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Keep a bounded window of chunks in flight and write them in order
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(analyze_chunk, chunk)))
+            if len(pending) < args.workers * 2:
+                continue
+            processed += write_next(pending, output, checkpoint_path, run, done + processed)
+            report(processed, start)
+        while pending:
+            processed += write_next(pending, output, checkpoint_path, run, done + processed)
+            report(processed, start)
+    output.close()
+    # Finished, so a later run with the same arguments starts over
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"\nAnalyzed {processed} transcripts in {elapsed:.1f}s ({rate:.0f} transcripts/s); "
+          f"{done + processed} total written to {output_path}")
+
+def write_next(pending: deque, output, checkpoint_path: str, run: Dict, done: int) -> int:
+    """Write the oldest chunk once it is ready and checkpoint past it."""
+    count, future = pending.popleft()
+    output.write(future.result())
+    save_checkpoint(checkpoint_path, dict(run, records=done + count, position=output.position()))
+    return count
+
+def report(processed: int, start: float):
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"\r{processed} transcripts, {rate:.0f} transcripts/s", end="", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Sheets Writer
+
+This module contains a background writer that queues spreadsheet rows in a
+local SQLite file and appends them to Google Sheets in batches, so webhook
+handlers return as soon as a row is stored instead of waiting on the Sheets
+API.
+
+Rows survive restarts: they are only deleted from the queue once
+``append_rows`` has succeeded, so delivery is at least once. The worksheet is
+obtained through a callable, which makes the writer easy to run against a
+fake client that only implements ``append_rows(rows)``, plus
+``batch_update(data)`` to overwrite rows already written.
+
+Quota, server and connection errors are retried with backoff. A batch that
+Sheets rejects outright (a 400 for a bad value, say) is split until the rows
+at fault are found; those are moved to a dead_rows table instead of holding
+up every row queued behind them.
+
+Rows can be queued under a call ID, so a call whose record changes
+(call_analyzed arriving after call_ended) has one row: a queued row is
+replaced, and a row already appended is overwritten where it landed in the
+sheet, which append_rows reports.
+"""
+
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from common.logs import get_logger
+
+log = get_logger("webhook.sheets_writer")
+
+# Client errors that retrying the same rows can fix: a stale token or sheet
+# handle, a timeout and the rate limit
+RETRYABLE_CLIENT_ERRORS = (401, 403, 404, 408, 429)
+
+def appended_at(response: Any) -> Optional[int]:
+    """Return the sheet row of the first row written by append_rows, if it says."""
+    updated_range = (response or {}).get("updates", {}).get("updatedRange", "") if isinstance(response, dict) else ""
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+def row_range(sheet_row: int, width: int) -> str:
+    """Return the A1 range of the first width cells of a sheet row."""
+    column = ""
+    while width:
+        width, rest = divmod(width - 1, 26)
+        column = chr(ord("A") + rest) + column
+    return f"A{sheet_row}:{column}{sheet_row}"
+
+def is_rejection(error: Exception) -> bool:
+    """Return True for errors that sending the same rows again won't fix."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in RETRYABLE_CLIENT_ERRORS
+
+class SheetsWriter:
+    """
+    Durable, batched appender for spreadsheet rows.
+
+    ``enqueue`` stores a row and returns immediately. A background thread
+    flushes the queue with one ``append_rows`` call per batch of up to
+    ``batch_size`` rows, either as soon as a full batch is waiting or every
+    ``flush_interval`` seconds. Failed flushes are retried with exponential
+    backoff capped at ``max_backoff`` seconds, even when a full batch is
+    waiting. Rows Sheets rejects are moved to the dead_rows table.
+
+    The sheet row each call was appended to is kept for ``remember_rows_for``
+    seconds, so that ``replace`` can overwrite it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        get_worksheet: Callable[[], Any],
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+        max_backoff: float = 300.0,
+        remember_rows_for: float = 86400.0
+    ):
+        self.get_worksheet = get_worksheet
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.remember_rows_for = remember_rows_for
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pending_rows ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "row TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "call_id TEXT)"
+        )
+        # Queues created before rows were keyed on call ID, or could update
+        # a written row (sheet_row is set for those)
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(pending_rows)")]
+        if "call_id" not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN call_id TEXT")
+        if "sheet_row" not in columns:
+            self._db.execute("ALTER TABLE pending_rows ADD COLUMN sheet_row INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_pending_rows_call_id ON pending_rows (call_id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_rows ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "row TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "call_id TEXT, "
+            "rejected_at REAL NOT NULL, "
+            "error TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS written_rows ("
+            "call_id TEXT PRIMARY KEY, "
+            "sheet_row INTEGER NOT NULL, "
+            "written_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.pending = self._db.execute("SELECT COUNT(*) FROM pending_rows").fetchone()[0]
+        self.rows_written = 0
+        self.rows_updated = 0
+        self.batches_written = 0
+        self.rows_rejected = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+
+    def enqueue(self, row: List[Any], call_id: Optional[str] = None):
+        """Store a row for the next flush, optionally under a call ID for ``replace``."""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO pending_rows (row, enqueued_at, call_id) VALUES (?, ?, ?)",
+                    (json.dumps(row), time.time(), call_id)
+                )
+            self.pending += 1
+            full = self.pending >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def replace(self, call_id: str, row: List[Any]) -> bool:
+        """
+        Replace the row for a call, whether it is still queued or written.
+
+        A queued row is swapped for the new one, which goes to the back of
+        the queue. A row already appended is queued to be overwritten in
+        place. Returns False, leaving the queue unchanged, if the call has no
+        queued row and where its row was written is unknown (the worksheet
+        didn't say, or it was longer ago than ``remember_rows_for``). If the
+        old row was being appended at the time, both are written, in keeping
+        with at-least-once delivery.
+        """
+        with self._lock:
+            with self._db:
+                queued = self._db.execute(
+                    "SELECT sheet_row FROM pending_rows WHERE call_id = ? ORDER BY id DESC LIMIT 1", (call_id,)
+                ).fetchone()
+                if queued is not None:
+                    sheet_row = queued[0]
+                else:
+                    written = self._db.execute(
+                        "SELECT sheet_row FROM written_rows WHERE call_id = ? AND written_at >= ?",
+                        (call_id, time.time() - self.remember_rows_for)
+                    ).fetchone()
+                    if written is None:
+                        return False
+                    sheet_row = written[0]
+                replaced = self._db.execute(
+                    "DELETE FROM pending_rows WHERE call_id = ?", (call_id,)
+                ).rowcount
+                self._db.execute(
+                    "INSERT INTO pending_rows (row, enqueued_at, call_id, sheet_row) VALUES (?, ?, ?, ?)",
+                    (json.dumps(row), time.time(), call_id, sheet_row)
+                )
+            self.pending += 1 - replaced
+        return True
+
+    def flush(self) -> int:
+        """
+        Write every queued row to the worksheet, one batch at a time.
+
+        New rows are appended, and rows replacing written ones overwrite them
+        with one batch_update. Returns the number of rows written. Errors from
+        the worksheet are raised after the batches that did succeed have been
+        removed, except rejections, whose rows are moved to dead_rows.
+        """
+        written = 0
+        with self._flush_lock:
+            self._forget_old_rows()
+            while True:
+                with self._lock:
+                    batch = self._db.execute(
+                        "SELECT id, row, call_id, sheet_row FROM pending_rows ORDER BY id LIMIT ?",
+                        (self.batch_size,)
+                    ).fetchall()
+                if not batch:
+                    return written
+                appends = [entry for entry in batch if entry[3] is None]
+                updates = [entry for entry in batch if entry[3] is not None]
+                if appends:
+                    written += self._write(appends, self._append)
+                if updates:
+                    written += self._write(updates, self._update)
+
+    def _write(self, batch: List[Tuple], send: Callable[[List[Tuple]], List[Tuple[str, int]]]) -> int:
+        """
+        Send a batch and take it off the queue, returning the rows written.
+
+        A rejected batch is split in half and each half sent on its own,
+        down to the single rows at fault.
+        """
+        try:
+            remember = send(batch)
+        except Exception as e:
+            if not is_rejection(e):
+                raise
+            if len(batch) == 1:
+                self._reject(batch[0][0], e)
+                return 0
+            middle = len(batch) // 2
+            return self._write(batch[:middle], send) + self._write(batch[middle:], send)
+
+        with self._lock:
+            with self._db:
+                # Rows replaced while the batch was sent are already gone
+                self.pending -= self._db.execute(
+                    f"DELETE FROM pending_rows WHERE id IN ({','.join('?' * len(batch))})",
+                    [entry[0] for entry in batch]
+                ).rowcount
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO written_rows (call_id, sheet_row, written_at) VALUES (?, ?, ?)",
+                    [(call_id, sheet_row, time.time()) for call_id, sheet_row in remember]
+                )
+            self.rows_written += len(batch)
+            self.batches_written += 1
+        return len(batch)
+
+    def _append(self, batch: List[Tuple]) -> List[Tuple[str, int]]:
+        """Append new rows, returning the sheet row of each one queued under a call ID."""
+        response = self.get_worksheet().append_rows([json.loads(entry[1]) for entry in batch])
+        first = appended_at(response)
+        if first is None:
+            return []
+        return [(entry[2], first + offset) for offset, entry in enumerate(batch) if entry[2] is not None]
+
+    def _update(self, batch: List[Tuple]) -> List[Tuple[str, int]]:
+        """Overwrite written rows with their replacements."""
+        data = []
+        for entry in batch:
+            row = json.loads(entry[1])
+            data.append({"range": row_range(entry[3], len(row)), "values": [row]})
+        self.get_worksheet().batch_update(data)
+        with self._lock:
+            self.rows_updated += len(batch)
+        return []
+
+    def _forget_old_rows(self):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "DELETE FROM written_rows WHERE written_at < ?", (time.time() - self.remember_rows_for,)
+                )
+
+    def _reject(self, row_id: int, error: Exception):
+        """Move a row Sheets won't take from the queue to dead_rows."""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO dead_rows (row, enqueued_at, call_id, rejected_at, error) "
+                    "SELECT row, enqueued_at, call_id, ?, ? FROM pending_rows WHERE id = ?",
+                    (time.time(), str(error), row_id)
+                )
+                self.pending -= self._db.execute("DELETE FROM pending_rows WHERE id = ?", (row_id,)).rowcount
+            self.rows_rejected += 1
+        log.error("sheets_row_rejected", row_id=row_id, pending=self.pending, error=str(error))
+
+    def _backoff(self) -> float:
+        delay = min(self.max_backoff, self.flush_interval * 2 ** self.consecutive_failures)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            self._wake.wait(max(0.0, next_flush - time.monotonic()))
+            self._wake.clear()
+            if self._stopping.is_set():
+                return
+            # A full batch flushes early, but never before a retry is due
+            if self.consecutive_failures and time.monotonic() < next_flush:
+                continue
+            try:
+                self.flush()
+                self.consecutive_failures = 0
+                next_flush = time.monotonic() + self.flush_interval
+            except Exception as e:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                delay = self._backoff()
+                next_flush = time.monotonic() + delay
+                log.error("sheets_flush_failed", retry_in=round(delay), pending=self.pending, error=str(e))
+
+    def start(self):
+        """Start the background flush thread; rows left from a previous run go first."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+        if self.pending:
+            self._wake.set()
+
+    def stop(self, flush: bool = True, timeout: float = 10.0):
+        """Stop the background thread, making a last flush attempt by default."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if flush:
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("sheets_flush_on_shutdown_failed", pending=self.pending, error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and write counters."""
+        with self._lock:
+            oldest = self._db.execute("SELECT MIN(enqueued_at) FROM pending_rows").fetchone()[0]
+            dead_rows = self._db.execute("SELECT COUNT(*) FROM dead_rows").fetchone()[0]
+        return {
+            "pending": self.pending,
+            "oldest_pending_age": time.time() - oldest if oldest is not None else None,
+            "rows_written": self.rows_written,
+            "rows_updated": self.rows_updated,
+            "batches_written": self.batches_written,
+            "rows_rejected": self.rows_rejected,
+            "dead_rows": dead_rows,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,207 @@
+"""
+Streaming Webhook Parsing
+
+This module reads webhook request bodies as they arrive. The turns of a
+call_ended payload are fed into a TranscriptStream while they are parsed and
+are never decoded into Python objects, so a long call only costs its
+transcript text rather than the whole decoded payload (word timings and all).
+
+Incremental parsing needs ijson (pip install ijson), and trades CPU time for
+memory: yajl events cost more to handle than one json.loads. A long body is
+parsed a batch of chunks at a time on the shared thread pool, so it doesn't
+hold up the event loop; only the last batch is parsed inline. Without ijson
+the body is decoded in one go, in a worker process when the CPU executor has
+any, and the turns are fed to the analyzer from the decoded payload.
+
+The module also keeps the transcript streams of calls in progress, which are
+fed one turn at a time by live "turn" events.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+
+from common.executor import run_blocking, run_cpu_bound
+from .transcript_analyzer import TranscriptStream
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:  # Streaming parsing is optional
+    ijson = None
+
+# Load environment variables
+load_dotenv()
+# Bytes of body parsed per call on the thread pool
+WEBHOOK_PARSE_BATCH_BYTES = int(os.getenv("WEBHOOK_PARSE_BATCH_BYTES", "65536"))
+
+# An event type given as the first key of the body
+EVENT_TYPE_PREFIX = re.compile(rb'\s*\{\s*"event_type"\s*:\s*"([A-Za-z_]+)"')
+
+class ParsedEvent(NamedTuple):
+    """A webhook event with the payload turns taken out and analyzed."""
+    event: Dict[str, Any]
+    turns: Optional[TranscriptStream]
+    transcript: Optional[str]
+
+class WebhookEventParser:
+    """
+    Incremental parser for one webhook body, fed chunk by chunk (needs ijson).
+
+    Everything but payload["turns"] is built as usual; the turns only yield
+    their transcripts, which are analyzed as they are parsed.
+    """
+
+    def __init__(self):
+        self._builder = ObjectBuilder()
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        self._stream: Optional[TranscriptStream] = None
+        self._texts = []
+        self._text = ""
+
+    def feed(self, chunk: bytes):
+        """Parse the next chunk of the body."""
+        # An empty chunk would tell the parser the body has ended
+        if not chunk:
+            return
+        try:
+            self._parser.send(chunk)
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        self._handle_events()
+
+    def _handle_events(self):
+        for prefix, event, value in self._events:
+            # Most events are inside the turns, so check for those first
+            if prefix.startswith("payload.turns") and (len(prefix) == 13 or prefix[13] == "."):
+                if prefix == "payload.turns.item":
+                    if event == "start_map":
+                        self._text = ""
+                    elif event == "end_map":
+                        self._stream.add_turn(self._text)
+                        self._texts.append(self._text)
+                elif prefix == "payload.turns.item.transcript" and event == "string":
+                    self._text = value
+            elif prefix == "payload" and event == "map_key" and value == "turns":
+                self._stream = TranscriptStream()
+            else:
+                self._builder.event(event, value)
+        del self._events[:]
+
+    def close(self) -> ParsedEvent:
+        """Finish parsing and return the event."""
+        try:
+            self._parser.close()
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        self._handle_events()
+        event = getattr(self._builder, "value", None)
+        if not isinstance(event, dict):
+            raise ValueError("Webhook body must be a JSON object")
+        transcript = " ".join(self._texts) if self._stream is not None else None
+        return ParsedEvent(event, self._stream, transcript)
+
+def parse_webhook_body(body: bytes) -> ParsedEvent:
+    """Decode a whole webhook body and analyze its payload turns."""
+    event = json.loads(body)
+    if not isinstance(event, dict):
+        raise ValueError("Webhook body must be a JSON object")
+    payload = event.get("payload")
+    turns = payload.pop("turns", None) if isinstance(payload, dict) else None
+    if turns is None:
+        return ParsedEvent(event, None, None)
+    stream = TranscriptStream()
+    texts = []
+    for turn in turns:
+        text = turn.get("transcript", "")
+        stream.add_turn(text)
+        texts.append(text)
+    return ParsedEvent(event, stream, " ".join(texts))
+
+async def parse_webhook_event(chunks: AsyncIterator[bytes]) -> ParsedEvent:
+    """
+    Parse a webhook body, analyzing payload["turns"] on the way.
+
+    ``turns`` and ``transcript`` are None when the payload has no turns.
+    Raises ValueError for a body that is not a JSON object.
+    """
+    if ijson is not None:
+        # Chunks are parsed as they arrive, a batch at a time off the event loop
+        parser = WebhookEventParser()
+        batch = []
+        size = 0
+        async for chunk in chunks:
+            batch.append(chunk)
+            size += len(chunk)
+            if size >= WEBHOOK_PARSE_BATCH_BYTES:
+                await run_blocking(parser.feed, b"".join(batch))
+                batch = []
+                size = 0
+        # A short body, or the tail of a long one, is cheap enough to parse here
+        parser.feed(b"".join(batch))
+        return parser.close()
+
+    # Decoding is CPU bound, so it runs in a worker process if there are any
+    body = b"".join([chunk async for chunk in chunks])
+    return await run_cpu_bound(parse_webhook_body, body)
+
+async def peek_event_type(chunks: AsyncIterator[bytes]) -> Tuple[Optional[str], AsyncIterator[bytes]]:
+    """
+    Read the event type from the start of a webhook body before parsing it.
+
+    Returns the event type, or None unless it is the first key in the first
+    chunk, and the chunks of the whole body to parse.
+    """
+    first = b""
+    async for first in chunks:
+        if first:
+            break
+    match = EVENT_TYPE_PREFIX.match(first)
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return (match.group(1).decode() if match else None), body()
+
+class LiveCalls:
+    """Transcript streams of calls in progress, dropped once idle for longer than the TTL."""
+
+    def __init__(self, ttl: float = 900.0, max_calls: int = 1000):
+        self.ttl = ttl
+        self.max_calls = max_calls
+        self._calls: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, call_id: str) -> TranscriptStream:
+        """Return the stream for a call, starting one if needed."""
+        now = time.monotonic()
+        with self._lock:
+            # Least recently used calls are at the front
+            while self._calls:
+                oldest, (used, _) = next(iter(self._calls.items()))
+                if now - used < self.ttl and len(self._calls) < self.max_calls:
+                    break
+                del self._calls[oldest]
+
+            _, stream = self._calls.pop(call_id, (now, None))
+            if stream is None:
+                stream = TranscriptStream()
+            self._calls[call_id] = (now, stream)
+            return stream
+
+    def pop(self, call_id: str) -> Optional[TranscriptStream]:
+        """Stop tracking a call, e.g. because it has ended."""
+        with self._lock:
+            _, stream = self._calls.pop(call_id, (None, None))
+            return stream
+
+    def __len__(self) -> int:
+        return len(self._calls)
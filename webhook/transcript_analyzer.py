@@ -0,0 +1,261 @@
+"""
+Transcript Analyzer
+
+This module extracts every post-call field (outcome, booking date and time,
+party size, customer name and summary) from a transcript in one go. The
+transcript is lower-cased once; keywords are found with substring checks,
+and every date, time, party size and name with one pass of FIELD_SCANNER.
+All fields are derived from what those scans found.
+
+The results are the same as running get_call_outcome, the extract_*
+functions and generate_call_summary from google_sheets one after another,
+which scan and lower-case the transcript many times.
+
+TranscriptStream runs the same scans over a transcript that arrives turn by
+turn, such as the turns of a long call being parsed or sent live, keeping only
+a bounded window of text.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+
+BOOKING_KEYWORDS = ("book", "reservation", "table", "available")
+POST_BOOKING_KEYWORDS = ("change", "modify", "cancel", "update", "existing")
+ENQUIRY_KEYWORDS = ("menu", "hour", "time", "open", "address", "location", "parking")
+DATE_KEYWORDS = ("today", "tomorrow")
+KEYWORDS = BOOKING_KEYWORDS + POST_BOOKING_KEYWORDS + ENQUIRY_KEYWORDS + DATE_KEYWORDS
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+# Every field, as one alternation in reading order. After each match the
+# search goes on from the next character, not the end of the match, so fields
+# that overlap ("for 4 people" holds "4 people") are all found. Only a clock
+# time and an am/pm time can start at the same place, so they share one
+# alternative: "7:30 pm" is both. The original "I am X" / "I'm X" name
+# patterns are matched against lower-cased text and so can never match; they
+# are left out.
+FIELD_SCANNER = re.compile(r"""
+    # Where a field can start, checked first so that re moves on from every
+    # other position without trying each field; keep it in step with them
+    (?=\d|party|table|booking|for|my\ name|name)
+    (?:
+        (?P<iso_date>\d{4}-\d{2}-\d{2})
+      | (?P<slash_date>\d{1,2}/\d{1,2}/\d{4})
+      | (?P<time>(?P<clock_time>\d{1,2}:\d{2})(?:\s*(?:am|pm))? | \d{1,2}\s*(?:am|pm))
+      | (?P<count>\d+)\s+(?P<unit>guests|people|person)
+      | party\s+of\s+(?P<party_of>\d+)
+      | table\s+for\s+(?P<table_for>\d+)
+      | booking\s+for\s+(?P<booking_for>\d+)
+      | for\s+(?P<for_count>\d+)\s+(?P<for_unit>people|person)
+      | my\ name\ is\ (?P<my_name_is>\w+)
+      | name's\ (?P<names>\w+)
+      | name\ is\ (?P<name_is>\w+)
+    )
+""", re.VERBOSE)
+
+# Fields recorded as they are captured; the rest are derived in _scan
+CAPTURED_FIELDS = (
+    "iso_date", "slash_date", "clock_time", "party_of", "table_for", "booking_for", "my_name_is", "names", "name_is"
+)
+
+# Once these are found nothing later in the text changes the analysis
+TOP_FIELDS = {"iso_date", "clock_time", "for_people", "my_name_is"}
+
+# Party size sources in the priority order of extract_party_size
+PARTY_PRIORITY = (
+    "for_people", "for_person", "party_of", "guests", "people", "person", "table_for", "booking_for"
+)
+
+# Characters a match in a streamed transcript may run past the text scanned so far.
+# Only pathological text, such as a number followed by hundreds of spaces
+# before "people", needs more.
+STREAM_WINDOW = 256
+
+class TranscriptAnalysis(NamedTuple):
+    """Post-call fields extracted from a transcript."""
+    outcome: str
+    booking_date: str
+    booking_time: str
+    party_size: str
+    customer_name: str
+    summary: str
+
+def _scan(text: str, found: Dict[str, Any], start: int = 0, end: Optional[int] = None):
+    """
+    Record the first value of every field, plus the keywords, in found.
+
+    Only matches starting in text[start:end] are recorded; they may run
+    past end.
+    """
+    if end is None:
+        end = len(text)
+    keywords = found["keywords"]
+    for keyword in KEYWORDS:
+        if keyword not in keywords and text.find(keyword, start, end + len(keyword) - 1) != -1:
+            keywords.add(keyword)
+    # Weekdays are found like keywords, since FIELD_SCANNER would have to try
+    # seven more words at every position, but the first one named is kept
+    if "weekday" not in found:
+        named = [(text.find(day, start, end + len(day) - 1), day) for day in WEEKDAYS]
+        named = [(position, day) for position, day in named if position != -1]
+        if named:
+            found["weekday"] = min(named)[1]
+
+    position = start
+    while True:
+        match = FIELD_SCANNER.search(text, position)
+        if match is None or match.start() >= end:
+            break
+        for field in CAPTURED_FIELDS:
+            value = match.group(field)
+            if value is not None:
+                found.setdefault(field, value)
+        time = match.group("time")
+        if time is not None and time.endswith("m"):
+            found.setdefault("ampm_time", time)
+        if match.group("unit") is not None:
+            found.setdefault(match.group("unit"), match.group("count"))
+        if match.group("for_unit") is not None:
+            found.setdefault("for_" + match.group("for_unit"), match.group("for_count"))
+        if TOP_FIELDS <= found.keys():
+            break
+        position = match.start() + 1
+
+def _outcome(keywords) -> str:
+    if not keywords.isdisjoint(BOOKING_KEYWORDS):
+        return "Availability"
+    if not keywords.isdisjoint(POST_BOOKING_KEYWORDS):
+        return "Post-Booking"
+    if not keywords.isdisjoint(ENQUIRY_KEYWORDS):
+        return "Enquiry"
+    return "Misc."
+
+def next_weekday(weekday: str, today: date) -> date:
+    """Return the next date falling on weekday, counting today."""
+    return today + timedelta(days=(WEEKDAYS.index(weekday) - today.weekday()) % 7)
+
+def _booking_date(found, now: datetime) -> str:
+    if "iso_date" in found:
+        return found["iso_date"]
+    if "slash_date" in found:
+        day, month, year = found["slash_date"].split("/")
+        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+    if "today" in found["keywords"]:
+        return now.strftime("%Y-%m-%d")
+    if "tomorrow" in found["keywords"]:
+        return (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    if "weekday" in found:
+        return next_weekday(found["weekday"], now.date()).isoformat()
+    return "NA"
+
+def _booking_time(found) -> str:
+    if "clock_time" in found:
+        return found["clock_time"]
+    time = found.get("ampm_time")
+    if time is None:
+        return "NA"
+    # Convert to HH:MM format
+    numbers = [int(number) for number in re.findall(r"\d+", time)]
+    hour, minute = numbers[0], numbers[1] if ":" in time else 0
+    if "pm" in time and hour < 12:
+        hour += 12
+    elif "am" in time and hour == 12:
+        hour = 0
+    return f"{hour:02d}:{minute:02d}"
+
+def _summary(outcome: str, keywords, date: str, time: str, party_size: str) -> str:
+    summary = "Customer called about "
+    if outcome == "Enquiry":
+        if "menu" in keywords:
+            summary += "the menu."
+        elif not keywords.isdisjoint(("hour", "time", "open")):
+            summary += "opening hours."
+        elif not keywords.isdisjoint(("address", "location")):
+            summary += "restaurant location."
+        elif "parking" in keywords:
+            summary += "parking facilities."
+        else:
+            summary += "general information."
+    elif outcome == "Availability":
+        if date != "NA" and time != "NA":
+            summary += f"making a reservation for {date} at {time}"
+            summary += f" for {party_size} guests." if party_size != "NA" else "."
+        else:
+            summary += "checking availability."
+    elif outcome == "Post-Booking":
+        if "cancel" in keywords:
+            summary += "cancelling a reservation."
+        elif not keywords.isdisjoint(("change", "modify", "update")):
+            summary += "modifying an existing reservation."
+        else:
+            summary += "an existing reservation."
+    else:
+        summary += "a miscellaneous matter."
+    return summary
+
+def analyze_transcript(transcript: str, now: Optional[datetime] = None) -> TranscriptAnalysis:
+    """
+    Extract all post-call fields from a transcript.
+
+    ``now`` is the reference time for "today", "tomorrow" and weekday names
+    (the next such day, counting today, as in call_store.resolve_date) and
+    defaults to the current time, which for a live call is the call time.
+    """
+    found: Dict[str, Any] = {"keywords": set()}
+    _scan(transcript.lower(), found)
+    return _analysis(found, now)
+
+def _analysis(found: Dict[str, Any], now: Optional[datetime]) -> TranscriptAnalysis:
+    keywords = found["keywords"]
+
+    outcome = _outcome(keywords)
+    booking_date = _booking_date(found, now or datetime.now())
+    booking_time = _booking_time(found)
+    party_size = next((found[source] for source in PARTY_PRIORITY if source in found), "NA")
+    name = next((found[source] for source in ("my_name_is", "names", "name_is") if source in found), None)
+    customer_name = name.capitalize() if name else "NA"
+
+    return TranscriptAnalysis(
+        outcome=outcome,
+        booking_date=booking_date,
+        booking_time=booking_time,
+        party_size=party_size,
+        customer_name=customer_name,
+        summary=_summary(outcome, keywords, booking_date, booking_time, party_size)
+    )
+
+class TranscriptStream:
+    """
+    Analyzes a transcript turn by turn, as the turns arrive.
+
+    Each turn is scanned once, apart from the last STREAM_WINDOW characters,
+    which are held back until the next turn shows how a match there ends.
+    Only that window is kept, so memory does not grow with the length of the
+    call. The analysis equals analyze_transcript on the turns joined with
+    spaces.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self._found: Dict[str, Any] = {"keywords": set()}
+        # Text not scanned yet, after up to STREAM_WINDOW characters of context
+        self._text = ""
+        self._start = 0
+
+    def add_turn(self, transcript: str):
+        piece = transcript.lower()
+        self._text = self._text + " " + piece if self.turns else piece
+        self.turns += 1
+
+        end = len(self._text) - STREAM_WINDOW
+        if end > self._start:
+            _scan(self._text, self._found, self._start, end)
+            cut = max(0, end - STREAM_WINDOW)
+            self._text = self._text[cut:]
+            self._start = end - cut
+
+    def analysis(self, now: Optional[datetime] = None) -> TranscriptAnalysis:
+        """Return the analysis of the turns so far."""
+        found = dict(self._found, keywords=set(self._found["keywords"]))
+        _scan(self._text, found, self._start)
+        return _analysis(found, now)